@@ -0,0 +1,63 @@
+"""
+批处理后端基准测试
+对同一目录的 RAW 文件分别使用进程后端和线程后端运行 orchestrator.process_path，
+对比首轮 (含进程启动 / 预热) 和复用工作池后的每分钟处理图片数。
+
+用法: python benchmarks/bench_backends.py RAW_DIR [--jobs 4] [--log-space F-Log2] [--lut look.cube] [--repeat 2] [--lens-correct]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from raw_alchemy import orchestrator, worker_pool
+
+
+def _run(args, backend):
+    with tempfile.TemporaryDirectory(prefix='raw_alchemy_bench_') as output_dir:
+        t0 = time.perf_counter()
+        orchestrator.process_path(
+            input_path=args.raw_dir,
+            output_path=output_dir,
+            log_space=args.log_space,
+            lut_path=args.lut,
+            exposure=None,
+            lens_correct=args.lens_correct,
+            custom_db_path=None,
+            metering_mode='hybrid',
+            jobs=args.jobs,
+            logger_func=lambda message: None,
+            backend=backend,
+            output_format='tif',
+            force=True,
+            # 任务记录写入临时目录，不污染用户的 jobs.sqlite
+            job_store_path=os.path.join(output_dir, 'jobs.sqlite'),
+        )
+        elapsed = time.perf_counter() - t0
+        # 只统计输出图像 (输出目录中还有处理清单和任务数据库)
+        count = sum(1 for name in os.listdir(output_dir) if name.endswith('.tif'))
+    return count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('raw_dir')
+    parser.add_argument('--jobs', type=int, default=4)
+    parser.add_argument('--log-space', default='F-Log2')
+    parser.add_argument('--lut', default=None)
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--lens-correct', action='store_true')
+    args = parser.parse_args()
+
+    print(f"Input: {args.raw_dir}, jobs: {args.jobs}, lens correction: {args.lens_correct}")
+    for backend in (worker_pool.BACKEND_PROCESSES, worker_pool.BACKEND_THREADS):
+        worker_pool.shutdown_worker_pool()
+        count, cold = _run(args, backend)
+        warm = min(_run(args, backend)[1] for _ in range(args.repeat))
+        print(f"  {backend:9s}: {count} files, first run {cold:6.2f} s ({count / cold * 60:6.1f} images/min), "
+              f"warm pool {warm:6.2f} s ({count / warm * 60:6.1f} images/min)")
+    worker_pool.shutdown_worker_pool()
+
+
+if __name__ == '__main__':
+    main()
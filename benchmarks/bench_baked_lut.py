@@ -0,0 +1,79 @@
+"""
+烘焙 LUT 基准测试
+对比融合管线与烘焙后的单次查表在不同网格尺寸下的耗时和 ΔE2000 精度。
+
+用法: python benchmarks/bench_baked_lut.py [--megapixels 24] [--log-space F-Log2] [--sizes 33 65 97] [--repeat 3]
+"""
+import argparse
+import time
+
+import numpy as np
+import colour
+
+from raw_alchemy.fused_pipeline import apply_pointwise_pipeline
+from raw_alchemy.baked_lut import bake_color_chain, apply_baked_lut
+from raw_alchemy.lut_parser import from_colour_lut
+
+
+def _make_image(megapixels, seed=0):
+    width = int(np.sqrt(megapixels * 1e6 * 1.5))
+    height = int(megapixels * 1e6 / width)
+    rng = np.random.default_rng(seed)
+    return (rng.random((height, width, 3), dtype=np.float32) ** 2.2) * 0.5
+
+
+def _make_lut(size=33):
+    lut = colour.LUT3D(size=size)
+    lut.table = np.ascontiguousarray((lut.table ** 1.1).astype(np.float32))
+    # 管线与烘焙都使用解析后的 LoadedLUT (与 lut_cache.get_lut 的结果相同)
+    return from_colour_lut(lut)
+
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, default=24.0)
+    parser.add_argument('--log-space', default='F-Log2')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[33, 65, 97])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    source = _make_image(args.megapixels)
+    lut = _make_lut()
+    gain = 1.7
+
+    def fused():
+        apply_pointwise_pipeline(source.copy(), gain, args.log_space, lut)
+
+    fused()
+    t_copy = _best_of(lambda: source.copy(), args.repeat)
+    t_fused = _best_of(fused, args.repeat) - t_copy
+
+    print(f"Image: {source.shape[1]}x{source.shape[0]}, log space: {args.log_space}")
+    print(f"  fused      : {t_fused * 1000:8.1f} ms")
+
+    for size in args.sizes:
+        t0 = time.perf_counter()
+        baked = bake_color_chain(args.log_space, lut, size)
+        t_bake = time.perf_counter() - t0
+
+        def run_baked():
+            apply_baked_lut(source.copy(), baked, gain)
+
+        run_baked()
+        t_baked = _best_of(run_baked, args.repeat) - t_copy
+        acc = baked.accuracy
+        print(f"  baked {size:3d}³: {t_baked * 1000:8.1f} ms  (bake {t_bake:.2f} s, "
+              f"ΔE2000 mean {acc['mean']:.3f} / p99 {acc['p99']:.3f} / max {acc['max']:.3f})")
+
+
+if __name__ == '__main__':
+    main()
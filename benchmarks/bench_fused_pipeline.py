@@ -0,0 +1,84 @@
+"""
+融合像素管线基准测试
+对比分阶段实现 (每阶段一遍整图) 与单遍融合核函数的耗时和内存流量。
+
+用法: python benchmarks/bench_fused_pipeline.py [--megapixels 45] [--log-space F-Log2] [--repeat 3]
+"""
+import argparse
+import time
+
+import numpy as np
+import colour
+
+from raw_alchemy import core
+from raw_alchemy.fused_pipeline import apply_pointwise_pipeline
+from raw_alchemy.logger import create_logger
+from raw_alchemy.lut_parser import from_colour_lut
+
+
+def _make_image(megapixels, seed=0):
+    width = int(np.sqrt(megapixels * 1e6 * 1.5))
+    height = int(megapixels * 1e6 / width)
+    rng = np.random.default_rng(seed)
+    return (rng.random((height, width, 3), dtype=np.float32) ** 2.2) * 0.5
+
+
+def _make_lut(size=33):
+    lut = colour.LUT3D(size=size)
+    lut.table = np.ascontiguousarray((lut.table ** 1.1).astype(np.float32))
+    # 管线与烘焙都使用解析后的 LoadedLUT (与 lut_cache.get_lut 的结果相同)
+    return from_colour_lut(lut)
+
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, default=45.0)
+    parser.add_argument('--log-space', default='F-Log2')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    source = _make_image(args.megapixels)
+    lut = _make_lut()
+    source_cs = colour.RGB_COLOURSPACES['ProPhoto RGB']
+    quiet = create_logger(lambda msg: None)
+    gain = 1.7
+
+    def staged():
+        img = source.copy()
+        return core._apply_pointwise_staged(img, gain, args.log_space, lut, 'bench.cube', source_cs, quiet)
+
+    def fused():
+        img = source.copy()
+        return apply_pointwise_pipeline(img, gain, args.log_space, lut)
+
+    # 预热 (numba 编译 / colour 缓存)，同时确认两种实现结果一致 (分阶段实现出错时只记录日志并跳过 LUT)
+    max_diff = float(np.abs(staged() - fused()).max())
+    if max_diff > 1e-3:
+        raise SystemExit(f"staged and fused outputs differ by {max_diff:.2e}; comparison is invalid.")
+
+    t_copy = _best_of(lambda: source.copy(), args.repeat)
+    t_staged = _best_of(staged, args.repeat) - t_copy
+    t_fused = _best_of(fused, args.repeat) - t_copy
+
+    nbytes = source.nbytes
+    # 分阶段: 增益、饱和度/对比度、矩阵、maximum、cctf_encoding (float64 输出) 、LUT 各读写一遍
+    staged_traffic = nbytes * 2 * 5 + nbytes * 2 * 2
+    fused_traffic = nbytes * 2
+
+    print(f"Image: {source.shape[1]}x{source.shape[0]} ({nbytes / 1e6:.0f} MB float32), log space: {args.log_space}")
+    print(f"  staged: {t_staged * 1000:8.1f} ms   ~{staged_traffic / 1e9:5.2f} GB moved")
+    print(f"  fused : {t_fused * 1000:8.1f} ms   ~{fused_traffic / 1e9:5.2f} GB moved")
+    print(f"  speedup: {t_staged / t_fused:.2f}x   (max |staged - fused| {max_diff:.1e})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+LUT 核函数基准测试
+对比 colour 的通用插值 (lut.apply) 与 numba 原位核函数 (LoadedLUT.apply_inplace)
+在 1D、3x1D、shaper + 3D 和 3D LUT 上的耗时。
+
+用法: python benchmarks/bench_lut_kernels.py [--megapixels 24] [--repeat 3]
+"""
+import argparse
+import time
+
+import numpy as np
+import colour
+
+from raw_alchemy.lut_parser import from_colour_lut
+
+
+def _make_image(megapixels, seed=0):
+    width = int(np.sqrt(megapixels * 1e6 * 1.5))
+    height = int(megapixels * 1e6 / width)
+    rng = np.random.default_rng(seed)
+    return rng.random((height, width, 3), dtype=np.float32)
+
+
+def _make_luts():
+    curve = colour.LUT1D(size=4096)
+    curve.table = curve.table ** 0.8
+
+    per_channel = colour.LUT3x1D(size=1024)
+    per_channel.table = per_channel.table ** np.array([0.9, 1.0, 1.1])
+
+    cube = colour.LUT3D(size=33)
+    cube.table = cube.table ** 1.1
+
+    shaper = colour.LUT3x1D(size=4096, domain=np.array([[0.0] * 3, [2.0] * 3]))
+    shaper.table = np.sqrt(shaper.table / 2.0)
+
+    return {
+        'LUT1D 4096': curve,
+        'LUT3x1D 1024': per_channel,
+        'LUT3D 33': cube,
+        'Shaper + LUT3D': colour.LUTSequence(shaper, cube),
+    }
+
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, default=24.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    source = _make_image(args.megapixels)
+    t_copy = _best_of(lambda: source.copy(), args.repeat)
+    print(f"Image: {source.shape[1]}x{source.shape[0]}")
+
+    for name, lut in _make_luts().items():
+        loaded = from_colour_lut(lut)
+        loaded.apply_inplace(source[:16].copy())  # 预热 (numba 编译)
+
+        t_colour = _best_of(lambda: lut.apply(source), args.repeat)
+        t_numba = _best_of(lambda: loaded.apply_inplace(source.copy()), args.repeat) - t_copy
+        print(f"  {name:16s}: colour {t_colour * 1000:8.1f} ms   numba {t_numba * 1000:7.1f} ms   "
+              f"speedup {t_colour / t_numba:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+3D LUT 内存布局基准测试
+测量 rgb / rgba / blocked / rgba16 布局在不同 LUT 尺寸下的查表耗时，
+以及加载时自动选择 (lut_layout.choose_layout) 的结果。
+
+用法: python benchmarks/bench_lut_layouts.py [--sizes 17 33 65] [--megapixels 4] [--repeat 3]
+"""
+import argparse
+
+import numpy as np
+
+from raw_alchemy import lut_layout
+
+
+def _make_image(megapixels, seed=0):
+    """平滑渐变 + 噪声，近似真实照片的局部相关性"""
+    width = int(np.sqrt(megapixels * 1e6 * 1.5))
+    height = int(megapixels * 1e6 / width)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rng = np.random.default_rng(seed)
+    img = np.stack([x / width, y / height, 0.5 + 0.5 * np.sin(x / 97.0) * np.cos(y / 61.0)], axis=-1)
+    img += rng.normal(0.0, 0.02, img.shape).astype(np.float32)
+    return np.clip(img, 0.0, 1.0).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[17, 33, 65])
+    parser.add_argument('--megapixels', type=float, default=4.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    photo = _make_image(args.megapixels)
+    print(f"Image: {photo.shape[1]}x{photo.shape[0]} (ns per pixel)")
+    header = ''.join(f"{layout:>10s}" for layout in lut_layout.LUT_LAYOUTS)
+    print(f"  size  pixels  {header}   auto")
+
+    for size in args.sizes:
+        random_px = lut_layout.benchmark_layouts(size, lut_layout.LUT_LAYOUTS, args.repeat)
+        photo_px = lut_layout.benchmark_layouts(size, lut_layout.LUT_LAYOUTS, args.repeat,
+                                                pixels=photo.reshape(-1, 1, 3))
+        chosen = lut_layout.choose_layout(size)
+        for name, timings in (('random', random_px), ('photo', photo_px)):
+            cells = ''.join(f"{timings[layout] * 1000:10.1f}" for layout in lut_layout.LUT_LAYOUTS)
+            print(f"  {size:4d}  {name:6s}  {cells}   {chosen if name == 'random' else ''}")
+
+
+if __name__ == '__main__':
+    main()
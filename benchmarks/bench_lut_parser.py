@@ -0,0 +1,60 @@
+"""
+LUT 解析器基准测试
+对比原生解析器 (lut_parser.read_lut) 与 colour.read_LUT 在 17³ / 33³ / 65³ 文件上的冷启动解析耗时，
+并校验两者结果一致。
+
+用法: python benchmarks/bench_lut_parser.py [--sizes 17 33 65] [--repeat 3]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import colour
+
+from raw_alchemy.lut_parser import read_lut
+
+
+def _make_lut(size, seed=0):
+    rng = np.random.default_rng(seed)
+    lut = colour.LUT3D(size=size, name=f"Bench {size}")
+    lut.table = np.clip(lut.table ** 1.1 + rng.normal(0.0, 0.01, lut.table.shape), 0.0, 1.0)
+    return lut
+
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[17, 33, 65])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            lut = _make_lut(size)
+            for ext in ('.cube', '.csp'):
+                path = os.path.join(tmp, f"bench_{size}{ext}")
+                colour.write_LUT(lut, path)
+
+                # 预热 (numba 编译)
+                native = read_lut(path)
+                reference = colour.read_LUT(path)
+                max_error = float(np.max(np.abs(native.table - reference.table)))
+
+                t_colour = _best_of(lambda: colour.read_LUT(path), args.repeat)
+                t_native = _best_of(lambda: read_lut(path), args.repeat)
+                print(f"{size:3d}³ {ext:5s}: colour {t_colour * 1000:8.1f} ms   native {t_native * 1000:7.1f} ms   "
+                      f"speedup {t_colour / t_native:5.1f}x   max |Δ| {max_error:.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Log 编码曲线校验与基准测试
+将 log_curves 的原生实现 (及查表模式) 与 colour.cctf_encoding 对比误差，并比较整图编码耗时。
+
+用法: python benchmarks/verify_log_curves.py [--megapixels 24]
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import colour
+
+from raw_alchemy import log_curves
+from raw_alchemy.config import LOG_ENCODING_MAP
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, default=24.0)
+    args = parser.parse_args()
+
+    native_errors = log_curves.verify_against_colour()
+    table_errors = log_curves.verify_against_colour(use_table=True)
+
+    print(f"Max abs error vs colour (native tolerance {log_curves.LOG_ENCODING_TOLERANCE:.0e}, "
+          f"table tolerance {log_curves.LOG_TABLE_TOLERANCE:.0e})")
+    failed = False
+    for log_space, err in native_errors.items():
+        table_err = table_errors[log_space]
+        ok = err <= log_curves.LOG_ENCODING_TOLERANCE and table_err <= log_curves.LOG_TABLE_TOLERANCE
+        failed |= not ok
+        print(f"  {log_space:<14} native {err:.2e}   table {table_err:.2e}   {'OK' if ok else 'FAIL'}")
+
+    n = int(args.megapixels * 1e6)
+    rng = np.random.default_rng(0)
+    img = (rng.random((n // 4000, 4000, 3), dtype=np.float32) ** 2.2)
+
+    log_space = 'F-Log2'
+    name = LOG_ENCODING_MAP.get(log_space, log_space)
+    log_curves.log_encode(img[:8].copy(), log_space)
+    log_curves.log_encode(img[:8].copy(), log_space, use_table=True)
+
+    t0 = time.perf_counter()
+    colour.cctf_encoding(np.maximum(img, 1e-6), function=name)
+    t_colour = time.perf_counter() - t0
+
+    work = img.copy()
+    t0 = time.perf_counter()
+    log_curves.log_encode(work, log_space)
+    t_native = time.perf_counter() - t0
+
+    work = img.copy()
+    t0 = time.perf_counter()
+    log_curves.log_encode(work, log_space, use_table=True)
+    t_table = time.perf_counter() - t0
+
+    print(f"\n{log_space} on {img.shape[1]}x{img.shape[0]}:")
+    print(f"  colour.cctf_encoding: {t_colour * 1000:8.1f} ms")
+    print(f"  native (in-place)   : {t_native * 1000:8.1f} ms")
+    print(f"  table (in-place)    : {t_table * 1000:8.1f} ms")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""
+烘焙 LUT 模块
+曝光之后的整条色彩链 (饱和度/对比度、色域矩阵、Log 编码、用户 LUT) 对每个像素而言是固定函数，
+因此可以在 log 形状的 ProPhoto 定义域上一次性采样成高分辨率 3D LUT，
+之后每个像素只需一次整形 + 四面体查表。烘焙结果按配置缓存在内存和磁盘中。
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import colour
+from numba import njit, prange
+
+from raw_alchemy import utils
+from raw_alchemy.config import DEFAULT_BAKED_LUT_SIZE, DEFAULT_LUT_STACK_SIZE
+from raw_alchemy.decode_cache import hash_file_content
+from raw_alchemy.lut_cache import get_lut
+from raw_alchemy.fused_pipeline import apply_pointwise_pipeline, DEFAULT_SATURATION, DEFAULT_CONTRAST
+
+# 烘焙格式版本，采样方式变化时递增即可让磁盘缓存失效
+BAKE_FORMAT_VERSION = 1
+
+# log 整形定义域: 覆盖 2^-16 ~ 2^8 的线性 ProPhoto 值
+SHAPER_MIN_STOP = -16.0
+SHAPER_MAX_STOP = 8.0
+
+# 精度评估采样数
+ACCURACY_SAMPLES = 200000
+
+
+class BakedLUT:
+    """烘焙后的色彩链: 3D 表 + log 整形参数 + 精度统计"""
+
+    def __init__(self, table: np.ndarray, min_stop: float, max_stop: float, accuracy: Optional[dict] = None):
+        self.table = table
+        self.min_stop = min_stop
+        self.max_stop = max_stop
+        self.accuracy = accuracy or {}
+
+    @property
+    def size(self) -> int:
+        return self.table.shape[0]
+
+
+# ==========================================
+#              整形函数与核函数
+# ==========================================
+
+def _shaper_offset_and_span(min_stop, max_stop):
+    offset = 2.0 ** min_stop
+    span = np.log2(2.0 ** max_stop + offset) - min_stop
+    return offset, span
+
+
+def shaper_inverse(t: np.ndarray, min_stop: float, max_stop: float) -> np.ndarray:
+    """整形坐标 (0-1) -> 线性值"""
+    offset, span = _shaper_offset_and_span(min_stop, max_stop)
+    return np.exp2(min_stop + t * span) - offset
+
+
+@njit(fastmath=True, cache=True)
+def _shape(x, offset, min_stop, inv_span, size_float):
+    """线性值 -> LUT 网格坐标 (钳位到 [0, size-1])"""
+    if x < 0.0:
+        x = 0.0
+    t = (np.log2(x + offset) - min_stop) * inv_span * size_float
+    return min(max(t, 0.0), size_float)
+
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def apply_baked_lut_inplace(img, gain, lut_table, offset, min_stop, inv_span):
+    """
+    单遍应用烘焙 LUT: 增益 -> log 整形 -> 四面体插值
+    """
+    rows, cols, channels = img.shape
+    n_pixels = rows * cols
+    flat_img = img.reshape(n_pixels, channels)
+
+    size_minus_1 = lut_table.shape[0] - 1
+    size_float = float(size_minus_1)
+
+    for i in prange(n_pixels):
+        idx_r = _shape(flat_img[i, 0] * gain, offset, min_stop, inv_span, size_float)
+        idx_g = _shape(flat_img[i, 1] * gain, offset, min_stop, inv_span, size_float)
+        idx_b = _shape(flat_img[i, 2] * gain, offset, min_stop, inv_span, size_float)
+
+        r_val, g_val, b_val = utils.tetrahedral_sample(lut_table, idx_r, idx_g, idx_b, size_minus_1)
+
+        flat_img[i, 0] = r_val
+        flat_img[i, 1] = g_val
+        flat_img[i, 2] = b_val
+
+
+def apply_baked_lut(img: np.ndarray, baked: BakedLUT, gain: float = 1.0) -> np.ndarray:
+    """
+    对线性 ProPhoto 图像原位应用烘焙 LUT
+
+    Args:
+        img: float32 线性 ProPhoto 图像 (H, W, 3)
+        baked: bake_color_chain 的结果
+        gain: 同一遍中应用的曝光增益
+
+    Returns:
+        处理后的图像 (原地修改，返回以便链式调用)
+    """
+    if not img.flags['C_CONTIGUOUS']:
+        img = np.ascontiguousarray(img)
+    if img.dtype != np.float32:
+        img = img.astype(np.float32)
+
+    offset, span = _shaper_offset_and_span(baked.min_stop, baked.max_stop)
+    apply_baked_lut_inplace(img, np.float32(gain), baked.table, offset, baked.min_stop, 1.0 / span)
+    return img
+
+
+# ==========================================
+#                 烘焙
+# ==========================================
+
+def _evaluate_chain(linear: np.ndarray, log_space: str, lut, saturation: float, contrast: float) -> np.ndarray:
+    """使用未烘焙的融合管线计算参考结果"""
+    lut3d = lut if lut is not None and lut.is_3d else None
+    out = apply_pointwise_pipeline(
+        linear, 1.0, log_space, lut3d, saturation=saturation, contrast=contrast,
+        clip_output=(lut is None or lut3d is not None),
+    )
+    if lut is not None and lut3d is None:
+        out = np.clip(lut.apply_inplace(out), 0.0, 1.0)
+    return out
+
+
+def _accuracy_samples(count: int, seed: int = 0) -> np.ndarray:
+    """
+    精度评估用的测试像素: 亮度在 log 域均匀分布，同时覆盖中性灰和高饱和颜色
+    """
+    rng = np.random.default_rng(seed)
+    lum = np.exp2(rng.uniform(-12.0, 4.0, size=(count, 1)))
+    chroma = rng.dirichlet((0.7, 0.7, 0.7), size=count) * 3.0
+    neutral = rng.random((count, 1)) < 0.3
+    chroma = np.where(neutral, 1.0, chroma)
+    return np.ascontiguousarray((lum * chroma).astype(np.float32).reshape(1, count, 3))
+
+
+def _delta_e_2000(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """将输出按 sRGB 编码解释，计算 CIE ΔE2000"""
+    cs = colour.RGB_COLOURSPACES['sRGB']
+    lab_a = colour.XYZ_to_Lab(colour.RGB_to_XYZ(a.astype(np.float64), cs, apply_cctf_decoding=True))
+    lab_b = colour.XYZ_to_Lab(colour.RGB_to_XYZ(b.astype(np.float64), cs, apply_cctf_decoding=True))
+    return colour.delta_E(lab_a, lab_b, method='CIE 2000')
+
+
+def measure_accuracy(baked: BakedLUT, log_space: str, lut=None,
+                     saturation: float = DEFAULT_SATURATION, contrast: float = DEFAULT_CONTRAST,
+                     samples: int = ACCURACY_SAMPLES) -> dict:
+    """
+    对比烘焙结果与未烘焙管线，返回 ΔE2000 统计 (输出按 sRGB 编码解释)
+    """
+    source = _accuracy_samples(samples)
+    reference = _evaluate_chain(source.copy(), log_space, lut, saturation, contrast)
+    baked_out = apply_baked_lut(source.copy(), baked)
+    de = _delta_e_2000(np.clip(baked_out, 0.0, 1.0), np.clip(reference, 0.0, 1.0)).ravel()
+    return {
+        'mean': float(np.mean(de)),
+        'p99': float(np.percentile(de, 99.0)),
+        'max': float(np.max(de)),
+    }
+
+
+def bake_color_chain(log_space: str, lut=None, size: int = DEFAULT_BAKED_LUT_SIZE,
+                     saturation: float = DEFAULT_SATURATION, contrast: float = DEFAULT_CONTRAST,
+                     min_stop: float = SHAPER_MIN_STOP, max_stop: float = SHAPER_MAX_STOP,
+                     measure: bool = True) -> BakedLUT:
+    """
+    将曝光之后的色彩链采样为 3D LUT
+
+    Args:
+        log_space: 目标 Log 空间
+        lut: lut_cache.get_lut 读取的用户 LUT 或 None
+        size: 每轴格点数
+        saturation: 饱和度系数
+        contrast: 对比度系数
+        min_stop: 整形定义域下限 (log2)
+        max_stop: 整形定义域上限 (log2)
+        measure: 是否评估与未烘焙管线的 ΔE
+
+    Returns:
+        BakedLUT
+    """
+    axis = shaper_inverse(np.linspace(0.0, 1.0, size), min_stop, max_stop).astype(np.float32)
+    r, g, b = np.meshgrid(axis, axis, axis, indexing='ij')
+    lattice = np.ascontiguousarray(np.stack([r, g, b], axis=-1).reshape(size, size * size, 3))
+    table = _evaluate_chain(lattice, log_space, lut, saturation, contrast)
+    table = np.ascontiguousarray(table.reshape(size, size, size, 3), dtype=np.float32)
+
+    baked = BakedLUT(table, min_stop, max_stop)
+    if measure:
+        baked.accuracy = measure_accuracy(baked, log_space, lut, saturation, contrast)
+    return baked
+
+
+# ==========================================
+#                 缓存
+# ==========================================
+
+_memory_cache = {}
+_memory_lock = threading.Lock()
+_bake_lock = threading.Lock()
+
+# LUT 文件内容摘要按 (路径, 修改时间, 文件大小) 记忆，每张图片只需 stat 而不必重新读取整个文件
+_content_hashes = {}
+_CONTENT_HASHES_MAX_ENTRIES = 256
+
+
+def _lut_content_hash(lut_path: str) -> str:
+    st = os.stat(lut_path)
+    signature = (os.path.abspath(lut_path), st.st_mtime_ns, st.st_size)
+    with _memory_lock:
+        digest = _content_hashes.get(signature)
+    if digest is None:
+        digest = hash_file_content(lut_path)
+        with _memory_lock:
+            if len(_content_hashes) >= _CONTENT_HASHES_MAX_ENTRIES:
+                _content_hashes.clear()
+            _content_hashes[signature] = digest
+    return digest
+
+
+def _config_key(log_space, lut_path, size, saturation, contrast, lut_stack_size):
+    if isinstance(lut_path, (list, tuple)) and len(lut_path) == 1:
+        lut_path = lut_path[0]
+    if not lut_path:
+        lut_key = None
+    elif isinstance(lut_path, str):
+        lut_key = _lut_content_hash(lut_path)
+    else:
+        # 叠加的 LUT: 顺序和合成分辨率都会影响结果
+        lut_key = {'stack': [_lut_content_hash(path) for path in lut_path], 'size': lut_stack_size}
+    payload = json.dumps({
+        'version': BAKE_FORMAT_VERSION,
+        'log_space': log_space,
+        'lut': lut_key,
+        'size': size,
+        'saturation': saturation,
+        'contrast': contrast,
+        'shaper': [SHAPER_MIN_STOP, SHAPER_MAX_STOP],
+    }, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+
+def _load_from_disk(directory, key) -> Optional[BakedLUT]:
+    table_path = os.path.join(directory, f"{key}.npy")
+    meta_path = os.path.join(directory, f"{key}.json")
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        table = np.load(table_path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    return BakedLUT(np.ascontiguousarray(table), meta['min_stop'], meta['max_stop'], meta.get('accuracy'))
+
+
+def _save_to_disk(directory, key, baked: BakedLUT):
+    os.makedirs(directory, exist_ok=True)
+    tmp_suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+    table_path = os.path.join(directory, f"{key}.npy")
+    meta_path = os.path.join(directory, f"{key}.json")
+    try:
+        # np.save 会自动追加 .npy 后缀，使用文件对象避免
+        with open(table_path + tmp_suffix, 'wb') as f:
+            np.save(f, baked.table)
+        os.replace(table_path + tmp_suffix, table_path)
+        with open(meta_path + tmp_suffix, 'w', encoding='utf-8') as f:
+            json.dump({'min_stop': baked.min_stop, 'max_stop': baked.max_stop, 'accuracy': baked.accuracy}, f)
+        os.replace(meta_path + tmp_suffix, meta_path)
+    except OSError:
+        pass
+
+
+def get_baked_lut(log_space: str, lut_path: Union[str, Sequence[str], None], lut=None,
+                  size: int = DEFAULT_BAKED_LUT_SIZE,
+                  saturation: float = DEFAULT_SATURATION, contrast: float = DEFAULT_CONTRAST,
+                  cache_dir: Optional[str] = None, logger: callable = print,
+                  lut_stack_size: int = DEFAULT_LUT_STACK_SIZE) -> BakedLUT:
+    """
+    获取 (log 空间, LUT) 组合对应的烘焙 LUT，依次查找内存缓存、磁盘缓存，最后才重新烘焙
+
+    Args:
+        log_space: 目标 Log 空间
+        lut_path: 用户 LUT 路径或按顺序叠加的路径列表 (参与缓存键计算)
+        lut: 已读取的 LUT 对象；为 None 且 lut_path 非空时自动读取
+        size: 每轴格点数
+        cache_dir: 磁盘缓存根目录 (与解码缓存共用，烘焙结果存放在 baked/ 子目录)
+        logger: 日志函数
+        lut_stack_size: 叠加多个 LUT 时合成表的每轴格点数
+    """
+    key = _config_key(log_space, lut_path, size, saturation, contrast, lut_stack_size)
+
+    with _memory_lock:
+        baked = _memory_cache.get(key)
+    if baked is not None:
+        return baked
+
+    # 同一进程的多个线程同时未命中时只烘焙一次，其余线程等待后直接命中内存缓存
+    with _bake_lock:
+        with _memory_lock:
+            baked = _memory_cache.get(key)
+        if baked is not None:
+            return baked
+
+        disk_dir = os.path.join(cache_dir, 'baked') if cache_dir else None
+        if disk_dir:
+            baked = _load_from_disk(disk_dir, key)
+            if baked is not None:
+                logger(f"  🧊 [Baked LUT] Loaded {baked.size}³ table from cache.")
+
+        if baked is None:
+            if lut is None and lut_path:
+                lut = get_lut(lut_path, cache_dir, stack_size=lut_stack_size)
+            logger(f"  🧊 [Baked LUT] Baking colour chain into a {size}³ table...")
+            baked = bake_color_chain(log_space, lut, size, saturation, contrast)
+            if disk_dir:
+                _save_to_disk(disk_dir, key, baked)
+
+        if baked.accuracy:
+            acc = baked.accuracy
+            logger(f"  🧊 [Baked LUT] ΔE2000 vs unbaked: mean {acc['mean']:.3f}, p99 {acc['p99']:.3f}, max {acc['max']:.3f}")
+
+        with _memory_lock:
+            _memory_cache[key] = baked
+    return baked
@@ -1,8 +1,62 @@
+import os
+import time
+
 import click
 from raw_alchemy import lensfun_wrapper as lf
-from raw_alchemy import config, orchestrator
+from raw_alchemy import config, discovery, job_store, lens_profiles, orchestrator, shards
+
+
+class DefaultGroup(click.Group):
+    """第一个参数不是子命令时交给默认命令，保持 `raw-alchemy INPUT OUTPUT ...` 的用法"""
+
+    def __init__(self, *args, default_command: str = 'process', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] not in ctx.help_option_names):
+            args.insert(0, self.default_command)
+        return super().parse_args(ctx, args)
+
+
+class JobsParamType(click.ParamType):
+    """--jobs: 正整数或 'auto'"""
+    name = "INTEGER|auto"
+
+    def convert(self, value, param, ctx):
+        if str(value).lower() == 'auto':
+            return 'auto'
+        try:
+            jobs = int(value)
+        except ValueError:
+            jobs = 0
+        if jobs < 1:
+            self.fail(f"{value!r} is not a positive integer or 'auto'.", param, ctx)
+        return jobs
+
+
+class ShardParamType(click.ParamType):
+    """--shard: i/n，i 从 1 开始"""
+    name = "i/n"
 
-@click.command()
+    def convert(self, value, param, ctx):
+        try:
+            index, count = shards.parse_shard(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+        return f"{index}/{count}"
+
+
+@click.group(cls=DefaultGroup)
+def main():
+    """
+    Raw Alchemy: converts RAW images to log-encoded TIFF, HEIF or JPG files.
+
+    Without a sub-command, the arguments are passed to `process`.
+    """
+
+
+@main.command()
 @click.argument("input_path", type=click.Path(exists=True))
 @click.argument("output_path", type=click.Path())
 @click.option(
@@ -15,7 +69,8 @@ from raw_alchemy import config, orchestrator
     "--lut",
     "lut_path",
     type=click.Path(exists=True),
-    help="Path to a .cube LUT file to apply.",
+    multiple=True,
+    help="Path to a LUT file (.cube, .3dl, .csp, ...) to apply. Repeat to stack several LUTs in order; they are composed once into a single cached 3D LUT.",
 )
 @click.option(
     "--exposure",
@@ -34,6 +89,18 @@ from raw_alchemy import config, orchestrator
     type=click.Path(exists=True),
     help="Path to a custom lensfun database XML file.",
 )
+@click.option(
+    "--lens-grid",
+    type=click.IntRange(0, 256),
+    default=config.DEFAULT_LENS_GRID,
+    help="Evaluate lens distortion/TCA on a sparse grid with this spacing in pixels (e.g. 16) and interpolate coordinates while resampling, instead of building a per-pixel map. The grid is refined automatically until the interpolation error is below 0.05 px. 0 uses the dense map (default).",
+)
+@click.option(
+    "--lens-interpolation",
+    type=click.Choice(['bilinear', 'bicubic', 'lanczos3'], case_sensitive=False),
+    default=config.DEFAULT_LENS_INTERPOLATION,
+    help=f"Resampling filter for lens distortion/TCA correction. 'lanczos3' is the sharpest and slowest, 'bilinear' the fastest and softest. Default is {config.DEFAULT_LENS_INTERPOLATION}.",
+)
 @click.option(
     "--metering",
     default="hybrid",
@@ -42,9 +109,38 @@ from raw_alchemy import config, orchestrator
 )
 @click.option(
     "--jobs",
-    type=int,
-    default=4,
-    help="Number of concurrent jobs for batch processing. Default is 4.",
+    type=JobsParamType(),
+    default="4",
+    help="Number of worker processes for batch processing, or 'auto' to calibrate the process × thread split once on this machine and reuse it. Default is 4.",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(['executor', 'staged'], case_sensitive=False),
+    default='executor',
+    help="Batch engine. 'executor' runs whole files in worker processes; 'staged' pipelines read, decode, compute and encode in separate bounded thread pools so encoding overlaps with decoding and compute.",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(['processes', 'threads'], case_sensitive=False),
+    default='processes',
+    help="Executor backend. 'threads' runs files concurrently in one process that shares the LUTs, lens database and caches (no spawn or pickling cost); 'processes' isolates every file in a worker process.",
+)
+@click.option(
+    "--threads-per-job",
+    type=click.IntRange(1, None),
+    default=None,
+    help="Numba threads per worker process. Default splits the available CPUs evenly between the workers.",
+)
+@click.option(
+    "--pin-cpus/--no-pin-cpus",
+    default=False,
+    help="Pin each worker process to its own set of CPUs (Linux only).",
+)
+@click.option(
+    "--recalibrate",
+    is_flag=True,
+    default=False,
+    help="With --jobs auto, ignore the saved profile and calibrate again.",
 )
 @click.option(
     "--format",
@@ -53,7 +149,135 @@ from raw_alchemy import config, orchestrator
     default='tif',
     help="Output file format. Default is 'tif'.",
 )
-def main(input_path, output_path, log_space, lut_path, exposure, lens_correct, custom_lensfun_db_path, metering, jobs, output_format):
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Directory for the decoded image cache. Re-running with a different LUT or log space skips RAW decoding. Disabled by default.",
+)
+@click.option(
+    "--cache-size",
+    "cache_size_gb",
+    type=float,
+    default=config.DEFAULT_DECODE_CACHE_SIZE_GB,
+    help=f"Maximum size of the decoded image cache in GB (least recently used entries are evicted). Default is {config.DEFAULT_DECODE_CACHE_SIZE_GB:g}.",
+)
+@click.option(
+    "--baked/--no-baked",
+    default=False,
+    help="Bake the post-exposure colour chain (style, gamut, log curve and LUT) into a single 3D LUT. Faster for batches; the accuracy (ΔE2000) is reported in the log.",
+)
+@click.option(
+    "--baked-size",
+    type=click.IntRange(17, 257),
+    default=config.DEFAULT_BAKED_LUT_SIZE,
+    help=f"Grid size per axis of the baked LUT. Default is {config.DEFAULT_BAKED_LUT_SIZE}.",
+)
+@click.option(
+    "--lut-layout",
+    type=click.Choice(['auto', 'rgb', 'rgba', 'blocked', 'rgba16'], case_sensitive=False),
+    default=config.DEFAULT_LUT_LAYOUT,
+    help="Memory layout of 3D LUT tables. 'auto' benchmarks the layouts once at load time and picks the fastest; 'rgba16' halves the table size at ~2.5e-4 precision (float16).",
+)
+@click.option(
+    "--lut-stack-size",
+    type=click.IntRange(17, 129),
+    default=config.DEFAULT_LUT_STACK_SIZE,
+    help=f"Grid size per axis of the composed table when several LUTs are stacked. Default is {config.DEFAULT_LUT_STACK_SIZE}.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Reprocess every file. By default a batch skips files whose input and processing parameters are unchanged since the last run (recorded in a manifest in the output directory).",
+)
+@click.option(
+    "--hash-inputs",
+    is_flag=True,
+    default=False,
+    help="Also record a content hash of each input, so files whose modification time changed but whose content did not (e.g. after a re-sync) are still skipped.",
+)
+@click.option(
+    "--recursive",
+    "-r",
+    is_flag=True,
+    default=False,
+    help="Also process RAW files in subfolders of INPUT_PATH; the folder structure is mirrored under OUTPUT_PATH.",
+)
+@click.option(
+    "--include",
+    multiple=True,
+    help="Only process files matching this glob (e.g. 'DSC_*' or '2024/*/*.ARW'). Patterns containing '/' match the path relative to INPUT_PATH, others the file name. Repeatable.",
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Skip files and subfolders matching this glob (same matching rules as --include). Repeatable.",
+)
+@click.option(
+    "--files-from",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    default=None,
+    help="Process the files listed in this text file ('-' for stdin), one path per line, absolute or relative to INPUT_PATH, instead of scanning INPUT_PATH.",
+)
+@click.option(
+    "--shard",
+    type=ShardParamType(),
+    default=None,
+    help="Process only shard i of n of the batch (e.g. 2/4), so several machines sharing the input and output directories can split one batch without a coordinator. Each shard writes its own summary file to OUTPUT_PATH; combine them with `raw-alchemy merge`.",
+)
+@click.option(
+    "--shard-by",
+    type=click.Choice(shards.SHARD_BY, case_sensitive=False),
+    default='hash',
+    help="How files are assigned to shards: 'hash' of the relative path (streams, stable as files are added) or 'size' (balances the total bytes per shard; scans the whole input first). Default is hash.",
+)
+@click.option(
+    "--retries",
+    type=click.IntRange(0, None),
+    default=config.DEFAULT_JOB_RETRIES,
+    help=f"How many times a failed file is retried within a batch. Default is {config.DEFAULT_JOB_RETRIES}.",
+)
+@click.option(
+    "--priority",
+    type=int,
+    default=0,
+    help="Priority of this batch's jobs in the job store; higher runs first when several processes share the store.",
+)
+@click.option(
+    "--job-store",
+    "job_store_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="SQLite job store that records the state of every file in a batch, so an interrupted batch can be resumed. Defaults to the user cache directory.",
+)
+@click.option(
+    "--file-timeout",
+    type=click.FloatRange(0, None, min_open=True),
+    default=None,
+    help="Per-file wall-clock limit in seconds. A file that takes longer is failed and its worker process is killed and replaced.",
+)
+@click.option(
+    "--max-tasks-per-worker",
+    type=click.IntRange(1, None),
+    default=None,
+    help="Recycle each worker process after it has processed this many files.",
+)
+@click.option(
+    "--max-worker-memory",
+    "max_worker_memory_gb",
+    type=float,
+    default=None,
+    help="Recycle a worker process when its resident memory exceeds this many GB after a file.",
+)
+@click.option(
+    "--max-memory",
+    "max_memory_gb",
+    type=float,
+    default=None,
+    help=f"Memory budget in GB for batch processing. Files are admitted only while their estimated peak memory fits; --jobs is the upper bound on concurrency. Default is {config.DEFAULT_MEMORY_BUDGET_FRACTION:.0%} of the available RAM.",
+)
+def process(input_path, output_path, log_space, lut_path, exposure, lens_correct, custom_lensfun_db_path, metering, jobs, engine, backend, threads_per_job, pin_cpus, recalibrate, output_format, cache_dir, cache_size_gb, baked, baked_size, lut_layout, lut_stack_size, lens_grid, lens_interpolation, retries, priority, job_store_path, file_timeout, max_tasks_per_worker, max_worker_memory_gb, max_memory_gb, force, hash_inputs, recursive, include, exclude, files_from, shard, shard_by):
     """
     Converts RAW image(s) to high-quality image files (TIFF, HEIF, or JPG).
 
@@ -65,7 +289,7 @@ def main(input_path, output_path, log_space, lut_path, exposure, lens_correct, c
             input_path=input_path,
             output_path=output_path,
             log_space=log_space,
-            lut_path=lut_path,
+            lut_path=list(lut_path) or None,
             exposure=exposure,
             lens_correct=lens_correct,
             custom_db_path=custom_lensfun_db_path,
@@ -73,11 +297,238 @@ def main(input_path, output_path, log_space, lut_path, exposure, lens_correct, c
             jobs=jobs,
             logger_func=click.echo, # Use click.echo for robust Unicode support
             output_format=output_format,
+            cache_dir=cache_dir,
+            cache_size_gb=cache_size_gb,
+            baked=baked,
+            baked_size=baked_size,
+            lut_layout=lut_layout,
+            lut_stack_size=lut_stack_size,
+            lens_grid=lens_grid,
+            lens_interpolation=lens_interpolation,
+            max_memory_gb=max_memory_gb,
+            threads_per_job=threads_per_job,
+            pin_cpus=pin_cpus,
+            recalibrate=recalibrate,
+            engine=engine,
+            backend=backend,
+            force=force,
+            hash_inputs=hash_inputs,
+            retries=retries,
+            priority=priority,
+            job_store_path=job_store_path,
+            file_timeout=file_timeout,
+            max_tasks_per_worker=max_tasks_per_worker,
+            max_worker_memory_gb=max_worker_memory_gb,
+            recursive=recursive,
+            include=list(include),
+            exclude=list(exclude),
+            files_from=files_from,
+            shard=shard,
+            shard_by=shard_by.lower(),
         )
     except Exception as e:
         # The orchestrator will log specifics, but we can catch fatal errors here.
         raise click.ClickException(f"A critical error occurred: {e}")
 
 
+@main.command()
+@click.argument("batch_id", required=False)
+@click.option(
+    "--jobs",
+    type=JobsParamType(),
+    default="4",
+    help="Number of worker processes, or 'auto'. Default is 4.",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(['executor', 'staged'], case_sensitive=False),
+    default='executor',
+    help="Batch engine (see `process --help`).",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(['processes', 'threads'], case_sensitive=False),
+    default='processes',
+    help="Executor backend (see `process --help`).",
+)
+@click.option(
+    "--threads-per-job",
+    type=click.IntRange(1, None),
+    default=None,
+    help="Numba threads per worker process.",
+)
+@click.option(
+    "--max-memory",
+    "max_memory_gb",
+    type=float,
+    default=None,
+    help="Memory budget in GB for the batch.",
+)
+@click.option(
+    "--file-timeout",
+    type=click.FloatRange(0, None, min_open=True),
+    default=None,
+    help="Per-file wall-clock limit in seconds. A file that takes longer is failed and its worker process is killed and replaced.",
+)
+@click.option(
+    "--max-tasks-per-worker",
+    type=click.IntRange(1, None),
+    default=None,
+    help="Recycle each worker process after it has processed this many files.",
+)
+@click.option(
+    "--max-worker-memory",
+    "max_worker_memory_gb",
+    type=float,
+    default=None,
+    help="Recycle a worker process when its resident memory exceeds this many GB after a file.",
+)
+@click.option(
+    "--retry-failed",
+    is_flag=True,
+    default=False,
+    help="Also re-queue the files that already failed.",
+)
+@click.option(
+    "--retries",
+    type=click.IntRange(0, None),
+    default=config.DEFAULT_JOB_RETRIES,
+    help="With --retry-failed, how many more times each failed file may be retried.",
+)
+@click.option(
+    "--job-store",
+    "job_store_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="SQLite job store used by the original batch.",
+)
+def resume(batch_id, jobs, engine, backend, threads_per_job, max_memory_gb, file_timeout, max_tasks_per_worker, max_worker_memory_gb, retry_failed, retries, job_store_path):
+    """
+    Continue an interrupted batch from where it stopped.
+
+    BATCH_ID: The batch ID printed when the batch started. Without it, recent batches are listed.
+    """
+    if not batch_id:
+        store = job_store.open_store(job_store_path, logger=click.echo)
+        try:
+            batches = store.list_batches()
+        finally:
+            store.close()
+        if not batches:
+            click.echo("No batches in the job store.")
+        for batch in batches:
+            progress = batch['progress']
+            created = time.strftime('%Y-%m-%d %H:%M', time.localtime(batch['created']))
+            click.echo(f"{batch['id']}  {created}  done {progress['done']}, failed {progress['failed']}, "
+                       f"pending {progress['pending'] + progress['running']}  {batch['input_path']}")
+        return
+    try:
+        orchestrator.resume_batch(
+            batch_id,
+            logger_func=click.echo,
+            jobs=jobs,
+            job_store_path=job_store_path,
+            retry_failed=retry_failed,
+            retries=retries,
+            engine=engine,
+            backend=backend,
+            threads_per_job=threads_per_job,
+            max_memory_gb=max_memory_gb,
+            file_timeout=file_timeout,
+            max_tasks_per_worker=max_tasks_per_worker,
+            max_worker_memory_gb=max_worker_memory_gb,
+        )
+    except Exception as e:
+        raise click.ClickException(f"A critical error occurred: {e}")
+
+
+
+@main.command()
+@click.argument("output_path", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--output",
+    "output_file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=f"Where to write the merged summary. Defaults to {shards.MERGED_SUMMARY_FILENAME} in OUTPUT_PATH.",
+)
+def merge(output_path, output_file):
+    """
+    Combine the per-shard summaries of a sharded batch.
+
+    OUTPUT_PATH: The output directory shared by all shards.
+    """
+    try:
+        merged = shards.merge_summaries(output_path, output_file)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    count = merged['count']
+    click.echo(f"🧩 Merged {count - len(merged['missing_shards'])}/{count} shard summaries: "
+               f"{len(merged['done'])} done, {len(merged['failed'])} failed, {merged['skipped']} unchanged, "
+               f"{merged['remaining']} remaining.")
+    for info in merged['shards']:
+        click.echo(f"   Shard {info['shard']}/{count} on {info['host']}: "
+                   f"{info['finished'] - info['started']:.0f}s, batch {info['batch_id']}")
+    if merged['missing_shards']:
+        click.echo(f"⚠️ Missing shards: {', '.join(str(index) for index in merged['missing_shards'])}")
+    for name, error in sorted(merged['failed'].items()):
+        click.echo(f"❌ {name}: {error}")
+    click.echo(f"📄 {output_file or os.path.join(output_path, shards.MERGED_SUMMARY_FILENAME)}")
+
+
+
+@main.command("lens-report")
+@click.argument("input_path", type=click.Path(exists=True, file_okay=False))
+@click.option("--recursive", "-r", is_flag=True, default=False, help="Also scan subfolders.")
+@click.option("--include", multiple=True, help="Only include files matching this glob (see `process --help`).")
+@click.option("--exclude", multiple=True, help="Skip files and subfolders matching this glob.")
+@click.option(
+    "--custom-lensfun-db",
+    "custom_lensfun_db_path",
+    type=click.Path(exists=True),
+    help="Path to a custom lensfun database XML file.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Decode cache directory; the resolved profiles are stored there (use the same value as for `process`). Defaults to the user cache directory.",
+)
+@click.option("--files", "show_files", is_flag=True, default=False, help="List the files of each camera and lens combination.")
+def lens_report(input_path, recursive, include, exclude, custom_lensfun_db_path, cache_dir, show_files):
+    """
+    Resolve the Lensfun profile of every camera and lens combination in a folder, reading only the file headers.
+
+    The results are cached, so a later `process` run skips lens correction setup for lenses without a profile.
+
+    INPUT_PATH: A directory of RAW files.
+    """
+    files = discovery.scan_directory(input_path, orchestrator.SUPPORTED_RAW_EXTENSIONS, recursive, include, exclude)
+    groups = lens_profiles.build_report(input_path, files, custom_lensfun_db_path, cache_dir, logger=click.echo)
+    total = sum(len(group['files']) for group in groups)
+    click.echo(f"🔭 {total} file(s), {len(groups)} camera / lens combination(s):")
+    icons = {'found': '✅', 'missing': '❌', 'unknown': '❔', 'no-exif': '⚪', 'unreadable': '⚠️'}
+    for group in groups:
+        exif = group['exif']
+        profile = group['profile']
+        name = f"{exif.get('camera_maker') or ''} {exif.get('camera_model')} + {exif.get('lens_model')}".strip()
+        if group['status'] == 'found':
+            lens = profile['lens']
+            detail = f"{name} -> {lens['maker'] or ''} {lens['model']}".rstrip()
+        elif group['status'] == 'missing':
+            detail = f"{name} -> no Lensfun profile, lens correction will be skipped"
+        elif group['status'] == 'unknown':
+            detail = f"{name} -> not resolved (Lensfun library not available)"
+        elif group['status'] == 'no-exif':
+            detail = "no camera or lens model in EXIF, lens correction will be skipped"
+        else:
+            detail = "could not read the RAW header"
+        click.echo(f"  {icons[group['status']]} {len(group['files']):>6}  {detail}")
+        if show_files:
+            for rel_path in group['files']:
+                click.echo(f"             {rel_path}")
+    click.echo(f"📄 {lens_profiles.default_profiles_path(cache_dir)}")
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,6 +2,9 @@
 Raw Alchemy 配置文件
 包含 Log 空间映射、编码映射、测光模式定义和 GUI 配置
 """
+import os
+import sys
+import tempfile
 
 # ==========================================
 #           核心处理配置
@@ -40,6 +43,49 @@ METERING_MODES = [
     'matrix',         # 矩阵/评价测光
 ]
 
+def user_cache_dir() -> str:
+    """用户缓存目录下的 raw_alchemy/ (任务数据库、拓扑校准结果、镜头配置与坐标表等的默认位置)"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or tempfile.gettempdir()
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'raw_alchemy')
+
+
+# 解码缓存默认大小上限 (GB)
+DEFAULT_DECODE_CACHE_SIZE_GB = 20.0
+
+# 每个进程在私有内存中缓存的镜头校正坐标表与暗角增益场的大小上限 (GB)，见 lens_maps
+# (正常情况下表写入磁盘后以内存映射方式共享，只有磁盘不可写时才占用这部分)
+DEFAULT_LENS_MAP_CACHE_GB = 0.5
+
+# 镜头校正坐标表与暗角增益场磁盘缓存的大小上限 (GB)
+DEFAULT_LENS_MAP_DISK_GB = 8.0
+
+# 烘焙色彩链 LUT 的默认分辨率 (每轴格点数)
+DEFAULT_BAKED_LUT_SIZE = 65
+
+# LUT 磁盘缓存 (解析后的二进制表) 的大小上限 (GB)
+DEFAULT_LUT_DISK_CACHE_GB = 1.0
+
+# 3D LUT 内存布局: 'auto' 在加载时按微基准测试选择最快的布局 (见 lut_layout)
+DEFAULT_LUT_LAYOUT = 'auto'
+
+# 叠加多个 LUT 时合成表的默认分辨率 (每轴格点数)
+DEFAULT_LUT_STACK_SIZE = 65
+
+# 镜头畸变/色差校正的稀疏坐标网格间距 (像素)，0 表示使用整图坐标表
+DEFAULT_LENS_GRID = 0
+
+# 镜头几何校正重采样的插值方式: 'bilinear' / 'bicubic' (Catmull-Rom) / 'lanczos3'
+DEFAULT_LENS_INTERPOLATION = 'bicubic'
+
+# 批处理未指定 --max-memory 时，内存预算占当前可用内存的比例
+DEFAULT_MEMORY_BUDGET_FRACTION = 0.8
+
+# 批处理中失败的文件默认重试的次数 (任务队列见 job_store)
+DEFAULT_JOB_RETRIES = 1
+
 # ==========================================
 #           GUI 配置
 # ==========================================
@@ -1,32 +1,62 @@
+import contextlib
 import gc
+import io
 import rawpy
 import numpy as np
 import colour
 import os
-from typing import Optional
+from typing import Optional, Sequence, Union
 
 # 尝试导入同级目录下的模块，如果失败则尝试绝对导入 (方便不同运行环境调试)
-from raw_alchemy import utils
-from raw_alchemy.config import LOG_TO_WORKING_SPACE, LOG_ENCODING_MAP
+from raw_alchemy import utils, log_curves, lens_profiles
+from raw_alchemy.config import LOG_TO_WORKING_SPACE, LOG_ENCODING_MAP, DEFAULT_LUT_LAYOUT, DEFAULT_LUT_STACK_SIZE
+from raw_alchemy.config import DEFAULT_LENS_GRID, DEFAULT_LENS_INTERPOLATION
 from raw_alchemy.logger import create_logger
-from raw_alchemy.metering import apply_auto_exposure
+from raw_alchemy.metering import get_metering_strategy
+from raw_alchemy.decode_cache import get_decode_cache, build_cache_params, hash_bytes
+from raw_alchemy.lut_cache import get_lut, lut_display_name
 from raw_alchemy.file_io import save_image
+from raw_alchemy.fused_pipeline import apply_pointwise_pipeline
+from raw_alchemy.baked_lut import get_baked_lut, apply_baked_lut, DEFAULT_BAKED_LUT_SIZE
 
 
 # ==========================================
 #              核心处理函数
 # ==========================================
 
+class DecodedFrame:
+    """解码阶段的结果 (线性 ProPhoto float32 图像及后续阶段需要的信息)"""
+
+    def __init__(self, img, metering_sample, exif_data, cache=None, cache_key=None, from_cache=False, gain_applied=False):
+        self.img = img
+        self.metering_sample = metering_sample
+        self.exif_data = exif_data
+        self.cache = cache
+        self.cache_key = cache_key
+        self.from_cache = from_cache
+        # 手动曝光增益是否已在解码转换中完成
+        self.gain_applied = gain_applied
+
+
 def process_image(
     raw_path: str,
     output_path: str,
     log_space: str,
-    lut_path: Optional[str],
+    lut_path: Union[str, Sequence[str], None], # 多个路径时按顺序叠加
     exposure: Optional[float] = None, # None=自动, Float=手动EV
     lens_correct: bool = True,
     metering_mode: str = 'hybrid',
     custom_db_path: Optional[str] = None,
     log_queue: Optional[object] = None, # 多进程通信队列
+    cache_dir: Optional[str] = None, # 解码缓存目录，None=禁用
+    cache_size_gb: Optional[float] = None,
+    fused: bool = True, # True=单遍融合管线, False=分阶段参考实现
+    baked: bool = False, # True=将曝光后的色彩链烘焙为单个 3D LUT
+    baked_size: int = DEFAULT_BAKED_LUT_SIZE,
+    lut_layout: Optional[str] = DEFAULT_LUT_LAYOUT, # 3D LUT 内存布局 ('auto' 按微基准测试选择)
+    lut_stack_size: int = DEFAULT_LUT_STACK_SIZE, # 叠加多个 LUT 时合成表的分辨率
+    lens_grid: int = DEFAULT_LENS_GRID, # 镜头校正稀疏坐标网格间距 (像素)，0=整图坐标表
+    lens_interpolation: str = DEFAULT_LENS_INTERPOLATION, # 镜头几何校正的插值方式
 ):
     filename = os.path.basename(raw_path)
     
@@ -35,58 +65,149 @@ def process_image(
     
     logger.info(f"🧪 [Raw Alchemy] Processing: {raw_path}")
 
-    # --- Step 1: 解码 RAW (统一至 ProPhoto RGB / 16-bit Linear) ---
+    frame = decode_image(raw_path, exposure, lens_correct, custom_db_path, cache_dir, cache_size_gb, logger,
+                         lens_grid=lens_grid, lens_interpolation=lens_interpolation)
+    img = develop_image(
+        frame, log_space, lut_path, exposure, lens_correct, metering_mode, custom_db_path, cache_dir,
+        fused, baked, baked_size, lut_layout, lut_stack_size, logger,
+        lens_grid=lens_grid, lens_interpolation=lens_interpolation,
+    )
+    del frame
+
+    # --- Step 6: 保存（使用模块化的文件保存功能）---
+    logger.info(f"  💾 Saving to {os.path.basename(output_path)}...")
+    saved = save_image(img, output_path, logger)
+    
+    # --- 最终清理 ---
+    del img
+    gc.collect()
+
+    # save_image 只记录错误并返回 False: 抛出异常，避免批处理把写入失败的文件记为已完成
+    if not saved:
+        raise RuntimeError(f"could not write {output_path}")
+
+
+def decode_image(raw_path, exposure, lens_correct, custom_db_path, cache_dir, cache_size_gb, logger,
+                 raw_source=None, lens_grid=DEFAULT_LENS_GRID,
+                 lens_interpolation=DEFAULT_LENS_INTERPOLATION, kernel_lock=None) -> DecodedFrame:
+    """
+    Step 1: 解码 RAW (统一至 ProPhoto RGB / 16-bit Linear)，或从解码缓存读取
+
+    Args:
+        raw_source: 已读入内存的 RAW 文件 (file-like)，None 时直接读取 raw_path
+        lens_grid / lens_interpolation: 镜头校正的稀疏坐标网格间距与插值方式 (缓存内容包含镜头校正结果，参与缓存键)
+        kernel_lock: numba 并行核函数调用期间持有的锁 (workqueue 线程层下由流水线传入)，None 时不加锁
+    """
+    kernels = kernel_lock if kernel_lock is not None else contextlib.nullcontext()
+    # 启用解码缓存时，缓存内容包含镜头校正结果 (如果开启)，命中后可跳过解码与校正
+    cache = get_decode_cache(cache_dir, cache_size_gb)
+    cache_key = None
+    cached = None
+    if cache is not None:
+        content_digest = None
+        if isinstance(raw_source, io.BytesIO):
+            # 已预读到内存的 RAW 直接计算摘要，不再从 (可能是网络) 存储重新读取整个文件
+            with raw_source.getbuffer() as view:
+                content_digest = hash_bytes(view)
+        cache_key = cache.make_key(
+            raw_path, build_cache_params(lens_correct=lens_correct, custom_db_path=custom_db_path, lens_grid=lens_grid,
+                                         lens_interpolation=lens_interpolation),
+            content_digest=content_digest,
+        )
+        cached = cache.load(cache_key)
+
+    # 手动曝光且不写入缓存时，增益直接在解码转换的同一遍中完成
+    fold_gain = exposure is not None and cache is None
+    metering_sample = None
+
+    if cached is not None:
+        logger.info(f"  🔹 [Step 1] Loaded decoded image from cache.")
+        img, metering_sample, meta = cached
+        return DecodedFrame(img, metering_sample, meta.get('exif', {}), cache, cache_key, from_cache=True)
+
     logger.info(f"  🔹 [Step 1] Decoding RAW...")
-    with rawpy.imread(raw_path) as raw:
+    with rawpy.imread(raw_source if raw_source is not None else raw_path) as raw:
         # 提取 EXIF (用于镜头校正)
         exif_data = utils.extract_lens_exif(raw, logger=logger.log)
 
-        # 解码: 必须使用 16-bit 以保留 Log 转换所需的动态范围
-        prophoto_linear = raw.postprocess(
-            gamma=(1, 1),
-            no_auto_bright=True,
-            use_camera_wb=True,
-            output_bps=16,
-            output_color=rawpy.ColorSpace.ProPhoto,
-            bright=1.0,
-            highlight_mode=2, # 2=Blend (防止高光死白)
-            demosaic_algorithm=rawpy.DemosaicAlgorithm.AAHD,
-        )
-        # 转为 Float32 (0.0 - 1.0) 进行数学运算
-        img = prophoto_linear.astype(np.float32) / 65535.0
+        prophoto_linear = utils.decode_raw(raw)
+        # 转为 Float32 (0.0 - 1.0) 进行数学运算 (单次转换，无中间临时数组)
+        with kernels:
+            img = utils.raw_to_float32(prophoto_linear, 2.0 ** exposure if fold_gain else 1.0)
         
         # 立即释放内存
         del prophoto_linear 
         gc.collect()
 
+    # 测光基于镜头校正前的图像，保留一份采样图供缓存复用
+    if not fold_gain:
+        metering_sample = np.ascontiguousarray(utils.get_subsampled_view(img))
+
+    return DecodedFrame(img, metering_sample, exif_data, cache, cache_key, gain_applied=fold_gain)
+
+
+def develop_image(frame: DecodedFrame, log_space, lut_path, exposure, lens_correct, metering_mode, custom_db_path,
+                  cache_dir, fused, baked, baked_size, lut_layout, lut_stack_size, logger,
+                  lens_grid=DEFAULT_LENS_GRID, lens_interpolation=DEFAULT_LENS_INTERPOLATION,
+                  kernel_lock=None) -> np.ndarray:
+    """
+    Step 2-5: 曝光、镜头校正、色彩转换与 LUT
+
+    Args:
+        kernel_lock: numba 并行核函数调用期间持有的锁 (workqueue 线程层下由流水线传入)，None 时不加锁；
+            Lensfun 坐标表生成和解码缓存写入不在锁内
+
+    Returns:
+        处理完成、待保存的 float32 图像
+    """
+    kernels = kernel_lock if kernel_lock is not None else contextlib.nullcontext()
+    img = frame.img
+    frame.img = None
     source_cs = colour.RGB_COLOURSPACES['ProPhoto RGB']
 
     # --- Step 2: 曝光控制 ---
+    # 镜头校正 (暗角增益 + 几何重采样) 对像素值是线性的，因此先计算增益，校正后再统一应用
     if exposure is not None:
         # 路径 A: 手动曝光
         logger.info(f"  🔹 [Step 2] Manual Exposure Override ({exposure:+.2f} stops)")
         gain = 2.0 ** exposure
-        utils.apply_gain_inplace(img, gain)
     else:
         # 路径 B: 自动测光（使用策略模式）
         logger.info(f"  🔹 [Step 2] Auto Exposure ({metering_mode})")
-        img = apply_auto_exposure(img, source_cs, metering_mode, target_gray=0.18, logger=logger)
+        strategy = get_metering_strategy(metering_mode)
+        gain = strategy.calculate_gain(frame.metering_sample, source_cs, target_gray=0.18, logger=logger)
 
     # --- Step 3: 镜头校正 & 风格化 ---
-    if lens_correct:
+    # 校正失败 (Lensfun 不可用或出错) 时得到的是未校正的图像，不能以"已校正"的键写入缓存
+    cacheable = True
+    if frame.from_cache:
+        logger.info("  🔹 [Step 3] Lens Correction restored from cache.")
+    elif lens_correct and lens_profiles.is_known_missing(
+            lens_profiles.get_profile_cache(cache_dir, custom_db_path).resolve(
+                frame.exif_data, custom_db_path, logger=logger.log)):
+        # 已知 Lensfun 中没有该镜头的配置 (持久化的解析结果)，不必创建修改器
+        logger.info(f"  🔹 [Step 3] No Lensfun profile for {frame.exif_data.get('lens_model')}; "
+                    f"skipping Lens Correction.")
+    elif lens_correct:
         logger.info("  🔹 [Step 3] Applying Lens Correction...")
-        img = utils.apply_lens_correction(
+        img, cacheable = utils.correct_lens(
             img,
-            exif_data=exif_data,
+            exif_data=frame.exif_data,
             custom_db_path=custom_db_path,
-            logger=logger.log
+            logger=logger.log,
+            map_cache_dir=cache_dir,
+            lens_grid=lens_grid,
+            interpolation=lens_interpolation,
+            kernel_lock=kernel_lock,
         )
     else:
         logger.info("  🔹 [Step 3] Skipping Lens Correction.")
 
-    # 稍微增加饱和度和对比度，为 LUT 转换打底
-    logger.info("  🔹 [Step 3.5] Applying Camera-Match Boost...")
-    img = utils.apply_saturation_and_contrast(img, saturation=1.25, contrast=1.1, colourspace=source_cs)
+    if frame.cache is not None and not frame.from_cache and cacheable:
+        frame.cache.store(frame.cache_key, img, {'exif': frame.exif_data}, metering=frame.metering_sample)
+
+    # 尚未应用的曝光增益 (手动曝光时可能已在解码中完成)
+    pending_gain = 1.0 if frame.gain_applied else float(gain)
 
     # --- Step 4: 色彩空间转换 (ProPhoto Linear -> Log) ---
     log_color_space_name = LOG_TO_WORKING_SPACE.get(log_space)
@@ -95,6 +216,59 @@ def process_image(
     if not log_color_space_name:
          raise ValueError(f"Unknown Log Space: {log_space}")
 
+    # LUT 首次加载时可能运行核函数 (布局微基准测试、叠加 LUT 采样、烘焙)，与逐像素处理一起加锁
+    with kernels:
+        lut = None
+        if lut_path:
+            try:
+                lut = get_lut(lut_path, cache_dir, layout=lut_layout if fused and not baked else None,
+                              stack_size=lut_stack_size)
+            except Exception as e:
+                logger.error(f"  ❌ reading LUT: {e}")
+
+        if baked:
+            # 曝光后的整条色彩链预先采样为 3D LUT，每个像素只做一次整形 + 查表
+            baked_table = get_baked_lut(
+                log_space, lut_path if lut is not None else None, lut, baked_size,
+                cache_dir=cache_dir, logger=logger.info, lut_stack_size=lut_stack_size,
+            )
+            logger.info(f"  🔹 [Step 3.5-5] Baked Colour Chain ({baked_table.size}³)")
+            img = apply_baked_lut(img, baked_table, pending_gain)
+        elif fused:
+            # 增益、风格化、色域、Log 编码和 3D LUT 在同一遍中完成
+            lut3d = lut if lut is not None and lut.is_3d else None
+            stages = f"Boost -> {log_color_space_name} -> {log_curve_name}"
+            if lut3d is not None:
+                stages += f" -> LUT {lut_display_name(lut_path)} [{lut3d.layout}]"
+            logger.info(f"  🔹 [Step 3.5-5] Fused Pixel Pipeline ({stages})")
+            img = apply_pointwise_pipeline(img, pending_gain, log_space, lut3d, clip_output=(lut is None or lut3d is not None))
+
+            if lut is not None and lut3d is None:
+                logger.info(f"  🔹 [Step 5] Applying LUT {lut_display_name(lut_path)}...")
+                try:
+                    # 1D / 3x1D / shaper + 3D 序列使用 numba 原位核函数
+                    img = lut.apply_inplace(img)
+                except Exception as e:
+                    logger.error(f"  ❌ applying LUT: {e}")
+        else:
+            img = _apply_pointwise_staged(img, pending_gain, log_space, lut, lut_path, source_cs, logger)
+
+    return img
+
+def _apply_pointwise_staged(img, gain, log_space, lut, lut_path, source_cs, logger):
+    """
+    分阶段实现: 每个阶段单独扫描整图一遍
+    作为融合管线的参考实现保留 (对比测试与基准测试使用)
+    """
+    if gain != 1.0:
+        utils.apply_gain_inplace(img, float(gain))
+
+    # 稍微增加饱和度和对比度，为 LUT 转换打底
+    logger.info("  🔹 [Step 3.5] Applying Camera-Match Boost...")
+    img = utils.apply_saturation_and_contrast(img, saturation=1.25, contrast=1.1, colourspace=source_cs)
+
+    log_color_space_name = LOG_TO_WORKING_SPACE[log_space]
+    log_curve_name = LOG_ENCODING_MAP.get(log_space, log_space)
     logger.info(f"  🔹 [Step 4] Color Transform (ProPhoto -> {log_color_space_name} -> {log_curve_name})")
 
     # 4.1 Gamut 变换 (矩阵运算)
@@ -108,37 +282,26 @@ def process_image(
         img = img.astype(np.float32)
     utils.apply_matrix_inplace(img, M)
     
-    # 4.2 Log 编码
+    # 4.2 Log 编码 (原生 numba 曲线，原位处理)
     # Log 函数无法处理负值，需裁剪微小底噪
-    np.maximum(img, 1e-6, out=img) 
-    img = colour.cctf_encoding(img, function=log_curve_name)
+    img = log_curves.log_encode(img, log_space, floor=1e-6)
 
     # --- Step 5: 应用 LUT ---
-    if lut_path:
-        logger.info(f"  🔹 [Step 5] Applying LUT {os.path.basename(lut_path)}...")
+    if lut is not None:
+        logger.info(f"  🔹 [Step 5] Applying LUT {lut_display_name(lut_path)}...")
         try:
-            lut = colour.read_LUT(lut_path)
-            
             # 3D LUT 使用 Numba 加速
-            if isinstance(lut, colour.LUT3D):
+            if lut.is_3d:
                 if not img.flags['C_CONTIGUOUS']:
                     img = np.ascontiguousarray(img)
                 if img.dtype != np.float32:
                     img = img.astype(np.float32)
-                if lut.table.dtype != np.float32:
-                    lut.table = lut.table.astype(np.float32)
                 utils.apply_lut_inplace(img, lut.table, lut.domain[0], lut.domain[1])
             else:
-                # 1D LUT 使用 colour 库默认方法
-                img = lut.apply(img)
+                # 1D / 3x1D / shaper + 3D 序列使用 numba 原位核函数
+                img = lut.apply_inplace(img)
             
         except Exception as e:
             logger.error(f"  ❌ applying LUT: {e}")
 
-    # --- Step 6: 保存（使用模块化的文件保存功能）---
-    logger.info(f"  💾 Saving to {os.path.basename(output_path)}...")
-    save_image(img, output_path, logger)
-    
-    # --- 最终清理 ---
-    del img
-    gc.collect()
\ No newline at end of file
+    return img
@@ -0,0 +1,231 @@
+"""
+解码缓存模块
+按内容寻址，将 RAW 解码 (可选含镜头校正) 后的线性 ProPhoto float32 图像缓存到磁盘，
+以 .npy 格式保存，命中时内存映射读取，避免重复执行 AAHD 解码。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import Optional, Tuple
+
+import numpy as np
+
+from raw_alchemy import utils
+from raw_alchemy import lensfun_wrapper as lf
+from raw_alchemy.config import DEFAULT_DECODE_CACHE_SIZE_GB, DEFAULT_LENS_INTERPOLATION
+
+# 缓存格式版本，格式变化时递增即可让旧条目全部失效
+CACHE_FORMAT_VERSION = 1
+
+_IMAGE_FILE = 'image.npy'
+_METERING_FILE = 'metering.npy'
+_META_FILE = 'meta.json'
+
+_HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def hash_file_content(path: str) -> str:
+    """计算文件内容的 BLAKE2b 摘要 (分块读取，不占用大内存)"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_bytes(data) -> str:
+    """计算内存中数据 (bytes / memoryview) 的 BLAKE2b 摘要，与 hash_file_content 对相同内容的结果一致"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(data)
+    return h.hexdigest()
+
+
+def build_cache_params(half_size: bool = False, lens_correct: bool = False,
+                       custom_db_path: Optional[str] = None, lens_grid: int = 0,
+                       lens_interpolation: str = DEFAULT_LENS_INTERPOLATION) -> dict:
+    """
+    构造参与缓存键计算的参数字典
+
+    Args:
+        half_size: 是否半尺寸解码 (预览)
+        lens_correct: 缓存内容是否包含镜头校正
+        custom_db_path: 自定义 Lensfun 数据库路径 (内置与自定义数据库的标识也参与计算，
+                        数据库更新后旧的校正结果不再命中)
+        lens_grid: 镜头校正的稀疏坐标网格间距 (0 为整图坐标表，不写入键以保持原有条目有效)
+        lens_interpolation: 镜头几何校正的插值方式
+    """
+    params = {'decode': utils.RAW_DECODE_PARAMS, 'half_size': half_size}
+    if lens_correct:
+        params['lens'] = {'custom_db': custom_db_path, 'database': lf.database_signature(custom_db_path),
+                          'interpolation': lens_interpolation}
+        if lens_grid:
+            params['lens']['grid'] = lens_grid
+    return params
+
+
+class DecodeCache:
+    """
+    基于磁盘的解码结果缓存 (LRU，按总大小上限淘汰)
+
+    每个条目是一个以键命名的目录，包含:
+        - image.npy: float32 线性图像 (H, W, 3)
+        - metering.npy: 镜头校正前的测光采样图 (保证命中时测光结果一致)
+        - meta.json: EXIF 等元数据
+    条目目录的 mtime 即最近访问时间，淘汰时先删除最久未使用的条目。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        if max_bytes is None:
+            max_bytes = int(DEFAULT_DECODE_CACHE_SIZE_GB * 1024 ** 3)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, raw_path: str, params: dict, content_digest: Optional[str] = None) -> str:
+        """
+        由 RAW 文件内容和处理参数生成缓存键
+
+        Args:
+            content_digest: 已计算的文件内容摘要 (见 hash_bytes)，None 时从 raw_path 读取文件计算
+        """
+        payload = json.dumps(
+            {
+                'version': CACHE_FORMAT_VERSION,
+                'content': content_digest or hash_file_content(raw_path),
+                'params': params,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def load(self, key: str) -> Optional[Tuple[np.ndarray, Optional[np.ndarray], dict]]:
+        """
+        读取缓存条目
+
+        Returns:
+            (image, metering_sample, meta) 或 None (未命中)。
+            image 以写时复制 (copy-on-write) 方式内存映射，可直接原地修改，不会回写磁盘。
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, _META_FILE), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            image = np.asarray(np.load(os.path.join(entry_dir, _IMAGE_FILE), mmap_mode='c'))
+            metering_path = os.path.join(entry_dir, _METERING_FILE)
+            metering = np.load(metering_path) if os.path.exists(metering_path) else None
+        except (OSError, ValueError):
+            return None
+
+        # 刷新访问时间 (LRU)
+        try:
+            os.utime(entry_dir, None)
+        except OSError:
+            pass
+        return image, metering, meta
+
+    def store(self, key: str, image: np.ndarray, meta: dict, metering: Optional[np.ndarray] = None):
+        """
+        写入缓存条目 (先写临时目录再原子重命名，多进程并发写入安全)，随后执行淘汰
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+
+        parent = os.path.dirname(entry_dir)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = os.path.join(parent, f".tmp-{key}-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            np.save(os.path.join(tmp_dir, _IMAGE_FILE), np.ascontiguousarray(image, dtype=np.float32))
+            if metering is not None:
+                np.save(os.path.join(tmp_dir, _METERING_FILE), np.ascontiguousarray(metering, dtype=np.float32))
+            with open(os.path.join(tmp_dir, _META_FILE), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, default=str)
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # 其他进程已写入同一条目，或磁盘已满：放弃本次写入
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def _list_entries(self):
+        """返回 [(mtime, size, path), ...]"""
+        entries = []
+        try:
+            shards = list(os.scandir(self.cache_dir))
+        except OSError:
+            return entries
+        for shard in shards:
+            # 只统计两位十六进制分片目录，同一缓存根目录下的其他子目录 (如 baked/) 不参与淘汰
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.is_dir() or entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+                except OSError:
+                    continue
+        return entries
+
+    def evict(self):
+        """按 LRU 顺序淘汰条目，直到总大小不超过上限"""
+        entries = self._list_entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            # Windows 下被其他进程映射中的文件无法删除，跳过即可
+            shutil.rmtree(path, ignore_errors=True)
+            if not os.path.exists(path):
+                total -= size
+
+    def total_size(self) -> int:
+        """当前缓存占用的总字节数"""
+        return sum(size for _, size, _ in self._list_entries())
+
+
+# 进程内共享的缓存实例 (预览窗口和线程中复用)
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_decode_cache(cache_dir: Optional[str], max_size_gb: Optional[float] = None) -> Optional[DecodeCache]:
+    """
+    获取指定目录的解码缓存实例
+
+    Args:
+        cache_dir: 缓存目录，为 None 或空字符串时表示禁用缓存
+        max_size_gb: 缓存大小上限 (GB)
+
+    Returns:
+        DecodeCache 实例，或 None
+    """
+    if not cache_dir:
+        return None
+    if max_size_gb is None:
+        max_size_gb = DEFAULT_DECODE_CACHE_SIZE_GB
+    max_bytes = int(max_size_gb * 1024 ** 3)
+    key = (os.path.abspath(cache_dir), max_bytes)
+    with _instances_lock:
+        cache = _instances.get(key)
+        if cache is None:
+            cache = DecodeCache(cache_dir, max_bytes)
+            _instances[key] = cache
+        return cache
@@ -0,0 +1,150 @@
+"""
+批处理文件发现
+单次 os.scandir 遍历输入目录 (可递归)，按扩展名和 include / exclude 通配符筛选，
+也可以从文件列表 (标准输入或文本文件) 读取。发现在后台线程中进行，找到一个文件就交给执行器一个，
+不必等整棵目录树扫描完成 (NAS 上数万个文件的目录树单是扫描就需要几分钟)。
+"""
+import fnmatch
+import os
+import queue
+import sys
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+_END = object()
+
+
+def _matches(rel_path: str, patterns: Sequence[str]) -> bool:
+    """通配符匹配: 含 '/' 的模式匹配相对路径，否则只匹配文件 (目录) 名"""
+    posix = rel_path.replace(os.sep, '/')
+    name = posix.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(posix if '/' in pattern else name, pattern) for pattern in patterns)
+
+
+def _accept(rel_path: str, extensions: Sequence[str], include: Sequence[str], exclude: Sequence[str]) -> bool:
+    if not rel_path.lower().endswith(tuple(extensions)):
+        return False
+    if include and not _matches(rel_path, include):
+        return False
+    return not (exclude and _matches(rel_path, exclude))
+
+
+def scan_directory(root: str, extensions: Sequence[str], recursive: bool = False,
+                   include: Sequence[str] = (), exclude: Sequence[str] = (),
+                   skip_dirs: Iterable[str] = ()) -> Iterator[str]:
+    """
+    单次遍历目录，逐个产出符合条件的文件 (相对 root 的路径，按名称排序、深度优先)
+
+    Args:
+        root: 输入目录
+        extensions: 小写扩展名 (含 '.')
+        recursive: 是否进入子目录 (不跟随符号链接，跳过隐藏目录)
+        include / exclude: 通配符列表；exclude 同样作用于子目录名，匹配的整个子目录不再遍历
+        skip_dirs: 不遍历的目录 (例如位于输入目录内的输出目录)
+    """
+    skip = {os.path.normcase(os.path.abspath(path)) for path in skip_dirs}
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, rel_dir) if rel_dir else root) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if (recursive and not entry.name.startswith('.') and not (exclude and _matches(rel_path, exclude))
+                        and os.path.normcase(os.path.abspath(entry.path)) not in skip):
+                    subdirs.append(rel_path)
+            elif _accept(rel_path, extensions, include, exclude):
+                yield rel_path
+        stack.extend(reversed(subdirs))
+
+
+def read_file_list(source: str, root: str, extensions: Sequence[str], include: Sequence[str] = (),
+                   exclude: Sequence[str] = (), logger: callable = print) -> Iterator[str]:
+    """
+    从文件列表读取要处理的文件，逐个产出相对 root 的路径
+
+    Args:
+        source: 列表文件路径，'-' 表示标准输入；每行一个路径 (绝对路径或相对 root)，空行和 # 开头的行忽略
+        root: 输入目录 (输出按相对它的路径镜像)，不在其中的文件会被跳过
+    """
+    stream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    try:
+        for line in stream:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path = line if os.path.isabs(line) else os.path.join(root, line)
+            rel_path = os.path.relpath(path, root)
+            if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep):
+                logger(f"⚠️ Skipping {line}: not inside the input directory {root}.")
+                continue
+            if _accept(rel_path, extensions, include, exclude):
+                yield rel_path
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+class Discovery:
+    """
+    在后台线程中运行文件发现，结果通过队列交给处理循环
+
+    Args:
+        source: 产出相对路径的可迭代对象 (scan_directory / read_file_list)
+        prepare: 在发现线程中对每个文件调用 (检查清单、读取文件头估算内存等)，
+            返回要交给处理循环的条目，返回 None 表示跳过
+    """
+
+    def __init__(self, source: Iterable[str], prepare: Callable[[str], Optional[object]]):
+        self.found = 0
+        self.skipped = 0
+        self.finished = False
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(source, prepare), name='raw-alchemy-discovery',
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, source, prepare):
+        try:
+            for rel_path in source:
+                item = prepare(rel_path)
+                if item is None:
+                    self.skipped += 1
+                else:
+                    self.found += 1
+                    self._queue.put(item)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._queue.put(_END)
+
+    def take(self, block: bool = False, timeout: Optional[float] = None) -> List[object]:
+        """
+        取出目前已发现的全部条目
+
+        Args:
+            block: 没有新条目时是否等待 (直到有新条目、发现结束或超时)
+        """
+        items = []
+        if self.finished:
+            return items
+        try:
+            items.append(self._queue.get(block=block, timeout=timeout))
+            while True:
+                items.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if items and items[-1] is _END:
+            items.pop()
+            self.finished = True
+        return items
@@ -0,0 +1,192 @@
+"""
+融合像素管线模块
+曝光之后的逐像素处理 (增益、饱和度/对比度、色域矩阵、Log 编码、3D LUT、最终裁剪)
+被编译进同一个 numba prange 核函数，每个像素只读写一次内存，
+替代原先每个阶段都完整扫描一遍整图的分阶段实现。
+"""
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import colour
+from numba import njit, prange
+
+from raw_alchemy import utils, log_curves, lut_layout
+from raw_alchemy.config import LOG_TO_WORKING_SPACE
+
+# 与分阶段实现保持一致的默认风格参数
+DEFAULT_SATURATION = 1.25
+DEFAULT_CONTRAST = 1.1
+CONTRAST_PIVOT = 0.18
+
+# Log 编码前的底噪裁剪 (Log 函数无法处理负值)
+LOG_FLOOR = 1e-6
+
+# 无 LUT 时传入核函数的占位表 (numba 需要确定的参数类型)
+_EMPTY_LUT = np.zeros((2, 2, 2, 3), dtype=np.float32)
+_UNIT_DOMAIN_MIN = np.zeros(3, dtype=np.float64)
+_UNIT_DOMAIN_MAX = np.ones(3, dtype=np.float64)
+_EMPTY_LOG_TABLE = np.zeros(2, dtype=np.float32)
+
+
+@lru_cache(maxsize=None)
+def get_gamut_matrix(log_space: str) -> np.ndarray:
+    """ProPhoto RGB -> 目标 Log 色域的 3x3 变换矩阵"""
+    log_color_space_name = LOG_TO_WORKING_SPACE.get(log_space)
+    if not log_color_space_name:
+        raise ValueError(f"Unknown Log Space: {log_space}")
+    return np.ascontiguousarray(colour.matrix_RGB_to_RGB(
+        colour.RGB_COLOURSPACES['ProPhoto RGB'],
+        colour.RGB_COLOURSPACES[log_color_space_name],
+    ))
+
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def fused_pointwise_inplace(img, gain, saturation, contrast, pivot, luma_coeffs, matrix,
+                            log_family, log_params, use_log_table, log_table, stop_min, stop_max, log_floor,
+                            lut_table, lut_min, lut_max, use_lut, clip_output,
+                            layout_code, packed_f32, packed_u16, half_pow2):
+    """
+    单遍融合核函数: 增益 -> 饱和度/对比度 -> 色域矩阵 -> Log 编码 -> 3D LUT -> 裁剪
+
+    每个阶段的数学定义与分阶段实现 (apply_gain_inplace / apply_saturation_contrast_inplace /
+    apply_matrix_inplace / log_curves.log_encode / apply_lut_inplace) 完全一致，
+    但中间结果只存在于寄存器中。
+    layout_code 非 0 时从打包布局的表 (packed_f32 / packed_u16，见 lut_layout) 中查表。
+    """
+    rows, cols, channels = img.shape
+    n_pixels = rows * cols
+    flat_img = img.reshape(n_pixels, channels)
+
+    cr, cg, cb = luma_coeffs[0], luma_coeffs[1], luma_coeffs[2]
+
+    m00, m01, m02 = matrix[0, 0], matrix[0, 1], matrix[0, 2]
+    m10, m11, m12 = matrix[1, 0], matrix[1, 1], matrix[1, 2]
+    m20, m21, m22 = matrix[2, 0], matrix[2, 1], matrix[2, 2]
+
+    last_index = log_table.shape[0] - 1
+    inv_step = last_index / (stop_max - stop_min)
+
+    size_minus_1 = lut_table.shape[0] - 1
+    size_float = float(size_minus_1)
+    scale_r = size_minus_1 / (lut_max[0] - lut_min[0])
+    scale_g = size_minus_1 / (lut_max[1] - lut_min[1])
+    scale_b = size_minus_1 / (lut_max[2] - lut_min[2])
+    min_r, min_g, min_b = lut_min[0], lut_min[1], lut_min[2]
+
+    for i in prange(n_pixels):
+        # 1. 曝光增益
+        r = flat_img[i, 0] * gain
+        g = flat_img[i, 1] * gain
+        b = flat_img[i, 2] * gain
+
+        # 2. 饱和度 & 对比度 (以 pivot 为中心)
+        lum = r * cr + g * cg + b * cb
+        r = (lum + (r - lum) * saturation - pivot) * contrast + pivot
+        g = (lum + (g - lum) * saturation - pivot) * contrast + pivot
+        b = (lum + (b - lum) * saturation - pivot) * contrast + pivot
+        if r < 0.0: r = 0.0
+        if g < 0.0: g = 0.0
+        if b < 0.0: b = 0.0
+
+        # 3. 色域矩阵
+        lr = r * m00 + g * m01 + b * m02
+        lg = r * m10 + g * m11 + b * m12
+        lb = r * m20 + g * m21 + b * m22
+
+        # 4. Log 编码 (原生曲线或稠密查找表)
+        lr = max(lr, log_floor)
+        lg = max(lg, log_floor)
+        lb = max(lb, log_floor)
+        if use_log_table:
+            lr = log_curves.table_lookup(lr, log_table, stop_min, inv_step, last_index)
+            lg = log_curves.table_lookup(lg, log_table, stop_min, inv_step, last_index)
+            lb = log_curves.table_lookup(lb, log_table, stop_min, inv_step, last_index)
+        else:
+            lr = log_curves.encode_scalar(lr, log_family, log_params)
+            lg = log_curves.encode_scalar(lg, log_family, log_params)
+            lb = log_curves.encode_scalar(lb, log_family, log_params)
+
+        # 5. 3D LUT (四面体插值)
+        if use_lut:
+            idx_r = min(max((lr - min_r) * scale_r, 0.0), size_float)
+            idx_g = min(max((lg - min_g) * scale_g, 0.0), size_float)
+            idx_b = min(max((lb - min_b) * scale_b, 0.0), size_float)
+            if layout_code == 0:
+                lr, lg, lb = utils.tetrahedral_sample(lut_table, idx_r, idx_g, idx_b, size_minus_1)
+            else:
+                lr, lg, lb = lut_layout.packed_tetrahedral_sample(
+                    layout_code, packed_f32, packed_u16, half_pow2, size_minus_1 + 1, idx_r, idx_g, idx_b)
+
+        # 6. 最终裁剪
+        if clip_output:
+            lr = min(max(lr, 0.0), 1.0)
+            lg = min(max(lg, 0.0), 1.0)
+            lb = min(max(lb, 0.0), 1.0)
+
+        flat_img[i, 0] = lr
+        flat_img[i, 1] = lg
+        flat_img[i, 2] = lb
+
+
+def apply_pointwise_pipeline(
+    img: np.ndarray,
+    gain: float,
+    log_space: str,
+    lut: Optional[object] = None,
+    saturation: float = DEFAULT_SATURATION,
+    contrast: float = DEFAULT_CONTRAST,
+    clip_output: bool = True,
+    use_log_table: bool = False,
+) -> np.ndarray:
+    """
+    对线性 ProPhoto 图像执行融合的逐像素管线 (原位)
+
+    Args:
+        img: float32 线性 ProPhoto 图像 (H, W, 3)
+        gain: 曝光增益
+        log_space: 目标 Log 空间名称
+        lut: 3D LUT (lut_cache.LoadedLUT，需有 table / domain) 或 None；其他类型的 LUT 需由调用方在之后单独应用
+        saturation: 饱和度系数
+        contrast: 对比度系数
+        clip_output: 是否将结果裁剪到 0-1
+        use_log_table: Log 编码使用稠密 1D 查找表代替原生曲线
+
+    Returns:
+        处理后的图像 (原地修改，返回以便链式调用)
+    """
+    matrix = get_gamut_matrix(log_space)
+    log_family, log_params = log_curves.get_log_curve(log_space)
+    log_table = log_curves.build_log_table(log_space) if use_log_table else _EMPTY_LOG_TABLE
+
+    source_cs = colour.RGB_COLOURSPACES['ProPhoto RGB']
+    luma_coeffs = utils.get_luminance_coeffs(source_cs).astype(np.float32)
+
+    if not img.flags['C_CONTIGUOUS']:
+        img = np.ascontiguousarray(img)
+    if img.dtype != np.float32:
+        img = img.astype(np.float32)
+
+    layout_code, packed_f32, packed_u16 = 0, lut_layout.EMPTY_PACKED_F32, lut_layout.EMPTY_PACKED_U16
+    packed = getattr(lut, 'packed', None)
+    if packed is not None and packed.layout != lut_layout.LAYOUT_RGB:
+        layout_code, packed_f32, packed_u16 = packed.kernel_tables()
+
+    if lut is not None:
+        lut_table = lut.table
+        if lut_table.dtype != np.float32 or not lut_table.flags['C_CONTIGUOUS']:
+            lut_table = np.ascontiguousarray(lut_table, dtype=np.float32)
+        lut_min = np.asarray(lut.domain[0], dtype=np.float64)
+        lut_max = np.asarray(lut.domain[1], dtype=np.float64)
+    else:
+        lut_table, lut_min, lut_max = _EMPTY_LUT, _UNIT_DOMAIN_MIN, _UNIT_DOMAIN_MAX
+
+    fused_pointwise_inplace(
+        img, np.float32(gain), np.float32(saturation), np.float32(contrast), np.float32(CONTRAST_PIVOT),
+        luma_coeffs, matrix,
+        log_family, log_params, use_log_table,
+        log_table, log_curves.LOG_TABLE_MIN_STOP, log_curves.LOG_TABLE_MAX_STOP, LOG_FLOOR,
+        lut_table, lut_min, lut_max, lut is not None, clip_output,
+        layout_code, packed_f32, packed_u16, lut_layout.HALF_POW2,
+    )
+    return img
@@ -8,6 +8,7 @@ import sys
 
 from raw_alchemy import config, orchestrator, utils
 from raw_alchemy.orchestrator import SUPPORTED_RAW_EXTENSIONS
+from raw_alchemy.lut_parser import SUPPORTED_LUT_EXTENSIONS
 from raw_alchemy.preview import open_preview_window
 
 class GuiApplication(tk.Frame):
@@ -99,10 +100,24 @@ class GuiApplication(tk.Frame):
         self.lut_dropdown.grid(row=2, column=1, columnspan=3, sticky="ew", padx=5)
         self.lut_dropdown['values'] = []
 
-        # Row 3: CPU Jobs
-        ttk.Label(settings_frame, text="CPU Threads:").grid(row=3, column=0, sticky="w", pady=5)
+        # Row 3: LUT Stack (按顺序叠加多个 LUT，为空时只使用上面选择的 LUT)
+        ttk.Label(settings_frame, text="LUT Stack:").grid(row=3, column=0, sticky="w", pady=5)
+        self.lut_stack = []
+        self.lut_stack_var = tk.StringVar()
+        ttk.Entry(settings_frame, textvariable=self.lut_stack_var, state="readonly").grid(row=3, column=1, sticky="ew", padx=5)
+        ttk.Button(settings_frame, text="Add", command=self.add_lut_to_stack).grid(row=3, column=2, sticky="ew", padx=5)
+        ttk.Button(settings_frame, text="Clear", command=self.clear_lut_stack).grid(row=3, column=3, sticky="ew", padx=5)
+
+        # Row 4: CPU Jobs
+        ttk.Label(settings_frame, text="CPU Threads:").grid(row=4, column=0, sticky="w", pady=5)
         self.jobs_var = tk.IntVar(value=min(4, multiprocessing.cpu_count()))
-        ttk.Spinbox(settings_frame, from_=1, to=multiprocessing.cpu_count(), textvariable=self.jobs_var, width=5).grid(row=3, column=1, sticky="w", padx=5)
+        ttk.Spinbox(settings_frame, from_=1, to=multiprocessing.cpu_count(), textvariable=self.jobs_var, width=5).grid(row=4, column=1, sticky="w", padx=5)
+
+        # Row 5: Decode Cache
+        ttk.Label(settings_frame, text="Decode Cache:").grid(row=5, column=0, sticky="w", pady=5)
+        self.cache_dir_var = tk.StringVar()
+        ttk.Entry(settings_frame, textvariable=self.cache_dir_var).grid(row=5, column=1, columnspan=2, sticky="ew", padx=5)
+        ttk.Button(settings_frame, text="Browse...", command=self.browse_cache_dir).grid(row=5, column=3, sticky="ew", padx=5)
 
         settings_frame.columnconfigure(1, weight=1)
         settings_frame.columnconfigure(2, weight=1)
@@ -246,20 +261,20 @@ class GuiApplication(tk.Frame):
         if path: self.output_path_var.set(path)
 
     def browse_lut_folder(self):
-        """选择LUT文件夹并扫描其中的.cube文件"""
+        """选择LUT文件夹并扫描其中的LUT文件"""
         path = filedialog.askdirectory(title="Select LUT Folder")
         if path:
             self.lut_folder_var.set(path)
             self.scan_lut_files(path)
     
     def scan_lut_files(self, folder_path):
-        """扫描文件夹中的所有.cube文件并更新下拉框"""
+        """扫描文件夹中的所有LUT文件 (.cube / .3dl / .csp 等) 并更新下拉框"""
         try:
-            # 获取文件夹中所有.cube文件
+            # 获取文件夹中所有LUT文件
             lut_files = []
             if os.path.isdir(folder_path):
                 for file in os.listdir(folder_path):
-                    if file.lower().endswith('.cube'):
+                    if file.lower().endswith(SUPPORTED_LUT_EXTENSIONS):
                         lut_files.append(file)
             
             # 按文件名排序
@@ -273,11 +288,38 @@ class GuiApplication(tk.Frame):
                 self.lut_file_var.set(lut_files[0])
             else:
                 self.lut_file_var.set('')
-                messagebox.showinfo("Info", "No .cube files found in the selected folder.")
+                messagebox.showinfo("Info", "No LUT files (.cube / .3dl / .csp) found in the selected folder.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to scan LUT folder: {e}")
 
+    def add_lut_to_stack(self):
+        """将当前选择的 LUT 追加到叠加列表末尾"""
+        lut_file = self._current_lut_file()
+        if lut_file is None:
+            messagebox.showinfo("Info", "Please select a LUT to add to the stack.")
+            return
+        self.lut_stack.append(lut_file)
+        self._refresh_lut_stack()
+
+    def clear_lut_stack(self):
+        """清空叠加列表"""
+        self.lut_stack = []
+        self._refresh_lut_stack()
+
+    def _refresh_lut_stack(self):
+        # 写入 lut_stack_var 同时触发预览刷新
+        self.lut_stack_var.set(" → ".join(os.path.basename(path) for path in self.lut_stack))
+
     def get_selected_lut_path(self):
+        """
+        获取要应用的 LUT: 叠加列表非空时返回按顺序排列的路径列表，
+        否则返回当前选择的 LUT 文件完整路径 (未选择时为 None)
+        """
+        if self.lut_stack:
+            return list(self.lut_stack)
+        return self._current_lut_file()
+
+    def _current_lut_file(self):
         """获取当前选择的LUT文件的完整路径"""
         folder = self.lut_folder_var.get()
         lut_file = self.lut_file_var.get()
@@ -288,6 +330,11 @@ class GuiApplication(tk.Frame):
                 return full_path
         return None
     
+    def browse_cache_dir(self):
+        """选择解码缓存目录 (留空则禁用缓存)"""
+        path = filedialog.askdirectory(title="Select Decode Cache Folder")
+        if path: self.cache_dir_var.set(path)
+
     def browse_lensfun_db(self):
         path = filedialog.askopenfilename(filetypes=[("Lensfun XML", "*.xml")])
         if path: self.custom_lensfun_db_path_var.set(path)
@@ -397,7 +444,8 @@ class GuiApplication(tk.Frame):
             'lut_path': self.get_selected_lut_path(),
             'custom_db_path': self.custom_lensfun_db_path_var.get() or None,
             'jobs': self.jobs_var.get(),
-            'lens_correct': self.lens_correction_var.get()
+            'lens_correct': self.lens_correction_var.get(),
+            'cache_dir': self.cache_dir_var.get() or None,
         }
         
         if self.exposure_mode_var.get() == "Manual":
@@ -460,10 +508,10 @@ class GuiApplication(tk.Frame):
                             'level': level
                         })
                     
-                    # 2. 进度初始化信号 (Orchestrator 需要发这个)
+                    # 2. 总数信号 (流式发现时随新文件多次发送，只更新总数，保留已完成数)
                     if 'total_files' in item:
                         total_files = item['total_files']
-                        self.update_progress(0, total_files)
+                        self.update_progress(processed_count, total_files)
                         
                     # 3. 完成信号
                     if 'status' in item and item['status'] == 'done':
@@ -0,0 +1,373 @@
+"""
+持久化的批处理任务队列 (SQLite)
+每次批处理记录为一个批次，批次中的每个文件是一个任务，状态为 pending / running / done / failed。
+进程崩溃 (内存不足、断电、卡死的文件) 后，可以用 `raw-alchemy resume <batch-id>` 从中断处继续。
+失败的任务在重试次数内重新排队；任务按优先级领取，多个本地进程可以安全地并发领取同一批次的任务。
+"""
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+from raw_alchemy.config import user_cache_dir
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATES = (PENDING, RUNNING, DONE, FAILED)
+
+# 数据库结构版本，结构变化时递增
+SCHEMA_VERSION = 2
+
+# 其他进程持有写锁时的最长等待时间 (秒)
+_BUSY_TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    discovery_complete INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    raw_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 1,
+    worker TEXT,
+    error TEXT,
+    updated REAL,
+    UNIQUE (batch_id, name)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (batch_id, state, priority DESC, attempts, seq);
+"""
+
+# 从旧版本升级的语句: {旧版本: [SQL, ...]}
+_MIGRATIONS = {
+    1: ["ALTER TABLE batches ADD COLUMN discovery_complete INTEGER NOT NULL DEFAULT 1"],
+}
+
+# 领取顺序: 优先级高的先处理，同优先级时重试过的任务排在新任务之后
+_CLAIM_ORDER = "ORDER BY priority DESC, attempts ASC, seq ASC"
+
+
+def default_store_path() -> str:
+    """任务数据库: 用户缓存目录下的 raw_alchemy/jobs.sqlite"""
+    return os.path.join(user_cache_dir(), 'jobs.sqlite')
+
+
+def new_batch_id() -> str:
+    """按时间排序、便于在命令行输入的批次 ID"""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+# 本进程的工作者标识: 主机名、PID 和随机令牌 (容器中 PID 可能在重启后重复)
+_WORKER_TOKEN = uuid.uuid4().hex[:8]
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{_WORKER_TOKEN}"
+
+
+def _pid_alive(pid: int) -> bool:
+    if sys.platform == 'win32':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def worker_alive(worker: Optional[str]) -> bool:
+    """判断领取任务的工作者进程是否仍在运行 (只能判断本机进程，其他主机视为已退出)"""
+    try:
+        host, pid, token = worker.rsplit(':', 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False
+    if host != socket.gethostname():
+        return False
+    if pid == os.getpid():
+        return token == _WORKER_TOKEN
+    return _pid_alive(pid)
+
+
+class JobStore:
+    """
+    SQLite 任务队列
+
+    使用 WAL 模式，GUI 等读取者不会阻塞处理进程；领取任务在 BEGIN IMMEDIATE 事务中完成，
+    多个进程同时领取时同一任务只会被一个进程拿到。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_store_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.worker = worker_id()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        if self.path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+
+    def _migrate(self):
+        with self._transaction() as cur:
+            version = cur.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise sqlite3.DatabaseError(f"Unsupported job store version {version} in {self.path}")
+            if version == SCHEMA_VERSION:
+                return
+            if version == 0:
+                for statement in _SCHEMA.split(';'):
+                    if statement.strip():
+                        cur.execute(statement)
+            else:
+                for old in range(version, SCHEMA_VERSION):
+                    for statement in _MIGRATIONS[old]:
+                        cur.execute(statement)
+            cur.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------------- 批次 ----------------
+
+    def create_batch(self, input_path: str, output_path: str, params: dict, files: Iterable[Tuple[str, str, str]] = (),
+                     priority: int = 0, max_attempts: int = 1, batch_id: Optional[str] = None,
+                     discovery_complete: bool = True) -> str:
+        """
+        创建批次并登记任务
+
+        Args:
+            input_path / output_path: 批处理的输入、输出目录
+            params: 处理参数 (resume 时原样传回 orchestrator.process_path)
+            files: (任务名, RAW 路径, 输出路径) 列表，任务名在批次内唯一
+            priority: 任务优先级 (越大越先处理)
+            max_attempts: 每个任务最多尝试的次数 (1 + 重试次数)
+            discovery_complete: 是否已登记全部任务；边发现边处理时为 False，
+                之后用 add_jobs 追加并在发现结束时调用 mark_discovery_complete
+
+        Returns:
+            批次 ID
+        """
+        batch_id = batch_id or new_batch_id()
+        with self._transaction() as cur:
+            cur.execute("INSERT INTO batches (id, created, input_path, output_path, params, discovery_complete) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (batch_id, time.time(), input_path, output_path, json.dumps(params), int(discovery_complete)))
+        self.add_jobs(batch_id, files, priority, max_attempts)
+        return batch_id
+
+    def add_jobs(self, batch_id: str, files: Iterable[Tuple[str, str, str]], priority: int = 0,
+                 max_attempts: int = 1) -> List[str]:
+        """
+        向批次追加任务 (批次中已有的任务名忽略)
+
+        Returns:
+            新登记的任务名
+        """
+        added = []
+        now = time.time()
+        with self._transaction() as cur:
+            for name, raw_path, out_path in files:
+                cur.execute(
+                    "INSERT OR IGNORE INTO jobs (batch_id, name, raw_path, output_path, priority, max_attempts, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (batch_id, name, raw_path, out_path, priority, max(1, max_attempts), now),
+                )
+                if cur.rowcount == 1:
+                    added.append(name)
+        return added
+
+    def mark_discovery_complete(self, batch_id: str):
+        """标记批次的全部任务都已登记"""
+        with self._transaction() as cur:
+            cur.execute("UPDATE batches SET discovery_complete = 1 WHERE id = ?", (batch_id,))
+
+    def batch(self, batch_id: str) -> Optional[dict]:
+        """读取批次信息 (params 已解析为字典)，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        if row is None:
+            return None
+        batch = dict(row)
+        batch['params'] = json.loads(batch['params'])
+        return batch
+
+    def list_batches(self, limit: int = 20) -> List[dict]:
+        """最近的批次及各状态的任务数"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM batches ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(dict(row), progress=self.progress(row['id'])) for row in rows]
+
+    def progress(self, batch_id: str) -> dict:
+        """各状态的任务数"""
+        counts = dict.fromkeys(STATES, 0)
+        with self._lock:
+            for row in self._conn.execute(
+                    "SELECT state, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY state", (batch_id,)):
+                counts[row[0]] = row[1]
+        return counts
+
+    # ---------------- 任务 ----------------
+
+    def recover(self, batch_id: str) -> int:
+        """
+        回收中断的任务: 领取者进程已退出的 running 任务重新排队 (尝试次数已用完时标记为失败)
+
+        Returns:
+            回收的任务数
+        """
+        now = time.time()
+        with self._transaction() as cur:
+            rows = cur.execute("SELECT seq, worker, attempts, max_attempts FROM jobs WHERE batch_id = ? AND state = ?",
+                               (batch_id, RUNNING)).fetchall()
+            stale = [row for row in rows if not worker_alive(row['worker'])]
+            for row in stale:
+                state = PENDING if row['attempts'] < row['max_attempts'] else FAILED
+                cur.execute("UPDATE jobs SET state = ?, worker = NULL, error = ?, updated = ? WHERE seq = ?",
+                            (state, "interrupted", now, row['seq']))
+        return len(stale)
+
+    def retry_failed(self, batch_id: str, retries: int = 0) -> int:
+        """将失败的任务重新排队，并允许再尝试 1 + retries 次"""
+        with self._transaction() as cur:
+            cur.execute("UPDATE jobs SET state = ?, max_attempts = attempts + ?, updated = ? "
+                        "WHERE batch_id = ? AND state = ?", (PENDING, 1 + max(0, retries), time.time(), batch_id, FAILED))
+            return cur.rowcount
+
+    def pending(self, batch_id: str) -> List[str]:
+        """待处理任务名，按领取顺序"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT name FROM jobs WHERE batch_id = ? AND state = ? {_CLAIM_ORDER}", (batch_id, PENDING)).fetchall()
+        return [row[0] for row in rows]
+
+    def claim(self, batch_id: str, name: str) -> bool:
+        """
+        领取指定的待处理任务 (尝试次数加一)
+
+        Returns:
+            是否领取成功 (任务已被其他进程领取或不存在时为 False)
+        """
+        with self._transaction() as cur:
+            return self._mark_running(cur, batch_id, name)
+
+    def claim_next(self, batch_id: str) -> Optional[str]:
+        """按优先级领取下一个待处理任务，返回任务名，没有时返回 None"""
+        with self._transaction() as cur:
+            row = cur.execute(f"SELECT name FROM jobs WHERE batch_id = ? AND state = ? {_CLAIM_ORDER} LIMIT 1",
+                              (batch_id, PENDING)).fetchone()
+            if row is None:
+                return None
+            self._mark_running(cur, batch_id, row[0])
+            return row[0]
+
+    def _mark_running(self, cur, batch_id: str, name: str) -> bool:
+        cur.execute("UPDATE jobs SET state = ?, worker = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE batch_id = ? AND name = ? AND state = ?",
+                    (RUNNING, self.worker, time.time(), batch_id, name, PENDING))
+        return cur.rowcount == 1
+
+    def finish(self, batch_id: str, name: str):
+        """标记任务完成"""
+        with self._transaction() as cur:
+            cur.execute("UPDATE jobs SET state = ?, worker = NULL, error = NULL, updated = ? WHERE batch_id = ? AND name = ?",
+                        (DONE, time.time(), batch_id, name))
+
+    def fail(self, batch_id: str, name: str, error: str) -> Tuple[bool, int, int]:
+        """
+        记录任务失败: 尝试次数未用完时重新排队，否则标记为失败
+
+        Returns:
+            (是否重新排队, 已尝试次数, 最多尝试次数)
+        """
+        with self._transaction() as cur:
+            row = cur.execute("SELECT attempts, max_attempts FROM jobs WHERE batch_id = ? AND name = ?",
+                              (batch_id, name)).fetchone()
+            if row is None:
+                return False, 0, 0
+            retry = row['attempts'] < row['max_attempts']
+            cur.execute("UPDATE jobs SET state = ?, worker = NULL, error = ?, updated = ? WHERE batch_id = ? AND name = ?",
+                        (PENDING if retry else FAILED, str(error), time.time(), batch_id, name))
+            return retry, row['attempts'], row['max_attempts']
+
+    def names(self, batch_id: str, state: str) -> List[str]:
+        """处于某个状态的任务名"""
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM jobs WHERE batch_id = ? AND state = ? ORDER BY seq",
+                                      (batch_id, state)).fetchall()
+        return [row[0] for row in rows]
+
+    def failures(self, batch_id: str) -> List[Tuple[str, str]]:
+        """失败任务的 (任务名, 最后一次错误)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, error FROM jobs WHERE batch_id = ? AND state = ? ORDER BY seq",
+                                      (batch_id, FAILED)).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE 事务: 立即取得写锁，领取任务时不会与其他进程交错"""
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn.cursor()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+        return False
+
+
+def open_store(path: Optional[str] = None, logger: callable = print) -> JobStore:
+    """打开任务数据库；无法打开时退回内存数据库 (本次批处理仍可运行，只是无法恢复)"""
+    try:
+        return JobStore(path)
+    except (OSError, sqlite3.Error) as e:
+        logger(f"⚠️ Could not open job store {path or default_store_path()}: {e}; progress will not be resumable.")
+        return JobStore(':memory:')
@@ -0,0 +1,181 @@
+"""
+镜头校正坐标表与暗角增益场缓存
+连拍或棚拍中数百张照片的相机、镜头、焦距、光圈和尺寸都相同，而 lensfun 每张都要重新计算
+(H, W, 3, 2) float32 坐标表 (4500 万像素约 1 GB) 和暗角增益。这里按光学配置缓存:
+
+- 进程内: LRU，线程后端的各线程共享；只有无法写入磁盘时留在进程私有内存中的表计入字节数上限，
+  内存映射的表由页缓存承载，按条目数限制
+- 磁盘: 解码缓存目录 (未指定时为用户缓存目录) 下的 lens_maps/*.npy，工作进程以只读内存映射方式加载，
+  同一份表在操作系统页缓存中只存在一份；按最近使用时间淘汰，总大小不超过上限
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+from raw_alchemy.config import DEFAULT_LENS_MAP_CACHE_GB, DEFAULT_LENS_MAP_DISK_GB, user_cache_dir
+
+# 磁盘格式版本，格式变化时递增即可让旧文件全部失效
+LENS_MAP_FORMAT_VERSION = 1
+
+# 进程内缓存中私有 (非内存映射) 表的字节数上限，计入调度器的每进程内存估算 (见 scheduler)
+LENS_MAP_CACHE_MAX_BYTES = int(DEFAULT_LENS_MAP_CACHE_GB * 1024 ** 3)
+
+# 进程内缓存的条目数上限 (内存映射的表只占用地址空间和文件句柄)
+LENS_MAP_CACHE_MAX_ENTRIES = 32
+
+# 磁盘缓存的字节数上限
+LENS_MAP_DISK_MAX_BYTES = int(DEFAULT_LENS_MAP_DISK_GB * 1024 ** 3)
+
+
+def map_key(kind: str, params: dict) -> str:
+    """由表的种类和光学配置 (数据库、相机、镜头、焦距、光圈、尺寸等) 计算缓存键"""
+    payload = json.dumps({'version': LENS_MAP_FORMAT_VERSION, 'kind': kind, 'params': params}, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+
+def default_lens_map_dir(cache_dir: Optional[str] = None) -> str:
+    """磁盘缓存目录: 解码缓存目录下的 lens_maps/，未指定时放在用户缓存目录"""
+    base = cache_dir or user_cache_dir()
+    return os.path.join(base, 'lens_maps')
+
+
+def _load_from_disk(directory: str, key: str) -> Optional[np.ndarray]:
+    path = os.path.join(directory, f"{key}.npy")
+    try:
+        # 只读内存映射: 多个工作进程共享同一份页缓存
+        table = np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    try:
+        # 更新访问时间，供磁盘淘汰使用
+        os.utime(path, None)
+    except OSError:
+        pass
+    return table
+
+
+def _prune_disk(directory: str):
+    """按最近使用时间淘汰磁盘上的表，直到总大小不超过上限"""
+    entries = []
+    try:
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith('.npy'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    entries.sort()
+    for _, size, path in entries:
+        if total <= LENS_MAP_DISK_MAX_BYTES:
+            break
+        try:
+            # Windows 下被其他进程映射中的文件无法删除，跳过即可
+            os.remove(path)
+            total -= size
+        except OSError:
+            continue
+
+
+def _save_to_disk(directory: str, key: str, table: np.ndarray) -> bool:
+    path = os.path.join(directory, f"{key}.npy")
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, table)
+        os.replace(tmp_path, path)
+        _prune_disk(directory)
+        return True
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+
+_memory_cache = OrderedDict()
+_memory_bytes = 0
+_memory_lock = threading.Lock()
+# 未命中时按键互斥生成: 同一配置只计算一次，不同配置可以同时计算
+_build_locks = {}
+
+
+def _private_bytes(table: np.ndarray) -> int:
+    """表占用的进程私有内存 (内存映射的表由页缓存承载，不计入)"""
+    return 0 if isinstance(table, np.memmap) else table.nbytes
+
+
+def _remember(key: str, table: np.ndarray):
+    global _memory_bytes
+    with _memory_lock:
+        if key in _memory_cache:
+            return
+        _memory_cache[key] = table
+        _memory_bytes += _private_bytes(table)
+        while len(_memory_cache) > 1 and (_memory_bytes > LENS_MAP_CACHE_MAX_BYTES
+                                          or len(_memory_cache) > LENS_MAP_CACHE_MAX_ENTRIES):
+            _, evicted = _memory_cache.popitem(last=False)
+            _memory_bytes -= _private_bytes(evicted)
+
+
+def get_map(kind: str, params: dict, cache_dir: Optional[str], build: Callable[[], Optional[np.ndarray]]):
+    """
+    依次查找进程内 LRU、磁盘缓存，都未命中时调用 build() 生成并写回
+
+    Args:
+        kind: 表的种类 ('geometry' 整图坐标表 / 'geometry-grid' 稀疏坐标网格 / 'geometry-plan' 网格间距与误差 / 'vignetting')
+        params: 决定表内容的全部光学参数 (可 JSON 序列化)
+        cache_dir: 解码缓存目录，None 时使用用户缓存目录
+        build: 生成表的函数，返回 None 表示无法生成 (不缓存)
+
+    Returns:
+        只读的表 (可能是内存映射)，build 失败时为 None
+    """
+    key = map_key(kind, params)
+    with _memory_lock:
+        table = _memory_cache.get(key)
+        if table is not None:
+            _memory_cache.move_to_end(key)
+            return table
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+
+    try:
+        with build_lock:
+            # 等待期间其他线程可能已经完成同一个条目
+            with _memory_lock:
+                table = _memory_cache.get(key)
+            if table is not None:
+                return table
+
+            directory = default_lens_map_dir(cache_dir)
+            table = _load_from_disk(directory, key)
+            if table is None:
+                table = build()
+                if table is None:
+                    return None
+                table.flags.writeable = False
+                if _save_to_disk(directory, key, table):
+                    # 写入后改用内存映射，进程私有内存中不再保留一份
+                    mapped = _load_from_disk(directory, key)
+                    if mapped is not None:
+                        table = mapped
+            _remember(key, table)
+            return table
+    finally:
+        with _memory_lock:
+            _build_locks.pop(key, None)
+
+
+def clear_memory_cache():
+    """清空进程内缓存 (磁盘缓存保留)"""
+    global _memory_bytes
+    with _memory_lock:
+        _memory_cache.clear()
+        _memory_bytes = 0
@@ -0,0 +1,196 @@
+"""
+镜头配置解析缓存
+Lensfun 按 EXIF 中的相机和镜头名称做模糊匹配，同一批次中每个文件都重复同样的查找，
+而找不到配置时要到完整解码之后才知道。这里将 (相机厂商/型号, 镜头厂商/型号) 到匹配结果
+(数据库中的配置名称，或"未找到") 的映射持久化为 JSON，与解码缓存放在同一目录 (未指定时为用户缓存目录)，
+Lensfun 数据库 (内置或自定义) 变化时全部失效。
+`raw-alchemy lens-report <dir>` 只读取文件头即可解析整批文件的镜头配置。
+"""
+import concurrent.futures
+import json
+import os
+import tempfile
+import threading
+from typing import Iterable, List, Optional
+
+import rawpy
+
+from raw_alchemy import utils
+from raw_alchemy import lensfun_wrapper as lf
+from raw_alchemy.config import user_cache_dir
+
+PROFILES_FILENAME = 'lens_profiles.json'
+
+# 文件格式版本，格式变化时递增即可让旧文件失效
+PROFILES_FORMAT_VERSION = 1
+
+# 生成报告时并发读取文件头的线程数 (网络存储上主要是等待 I/O)
+_HEADER_READERS = 8
+
+
+def default_profiles_path(cache_dir: Optional[str] = None) -> str:
+    """解码缓存目录中的 lens_profiles.json，未指定缓存目录时放在用户缓存目录"""
+    base = cache_dir or user_cache_dir()
+    return os.path.join(base, PROFILES_FILENAME)
+
+
+def profile_key(exif: dict) -> Optional[str]:
+    """由 EXIF 中相机与镜头名称组成的键；缺少型号时返回 None (无法校正，也不缓存)"""
+    if not exif.get('camera_model') or not exif.get('lens_model'):
+        return None
+    return json.dumps([exif.get('camera_maker'), exif['camera_model'], exif.get('lens_maker'), exif['lens_model']],
+                      ensure_ascii=False)
+
+
+def is_known_missing(profile: Optional[dict]) -> bool:
+    """已解析过且 Lensfun 中没有该镜头的配置"""
+    return profile is not None and profile['lens'] is None
+
+
+def read_lens_exif(raw_path: str) -> dict:
+    """只读取文件头获得镜头 EXIF (不解包传感器数据)"""
+    raw = rawpy.RawPy()
+    try:
+        raw.open_file(raw_path)
+        return utils.extract_lens_exif(raw, logger=lambda msg: None)
+    finally:
+        raw.close()
+
+
+class ProfileCache:
+    """
+    持久化的镜头配置解析结果
+
+    Args:
+        path: JSON 文件路径
+        signature: 当前 Lensfun 数据库的标识 (lensfun_wrapper.database_signature)，不一致的文件内容被忽略
+    """
+
+    def __init__(self, path: str, signature: str):
+        self.path = path
+        self.signature = signature
+        self._lock = threading.Lock()
+        self.entries = self._read()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if (not isinstance(data, dict) or data.get('version') != PROFILES_FORMAT_VERSION
+                or data.get('database') != self.signature or not isinstance(data.get('profiles'), dict)):
+            return {}
+        return data['profiles']
+
+    def get(self, exif: dict) -> Optional[dict]:
+        """缓存的解析结果，未解析过时返回 None"""
+        key = profile_key(exif)
+        if key is None:
+            return None
+        with self._lock:
+            return self.entries.get(key)
+
+    def resolve(self, exif: dict, custom_db_path: Optional[str] = None, logger: callable = print) -> Optional[dict]:
+        """
+        解析镜头配置: 优先使用缓存，未缓存时查询 Lensfun 数据库并写回
+
+        Returns:
+            {'camera': ..., 'lens': ...} (见 LensfunDatabase.resolve_profile)；
+            EXIF 缺少型号或 Lensfun 不可用 (数据库无法加载) 时返回 None
+        """
+        key = profile_key(exif)
+        if key is None:
+            return None
+        with self._lock:
+            profile = self.entries.get(key)
+        if profile is None:
+            if not lf._lensfun:
+                return None
+            try:
+                db = lf.get_database(custom_db_path, logger=logger)
+            except RuntimeError:
+                # 数据库无法加载: 不缓存，交给镜头校正步骤报告错误
+                return None
+            profile = db.resolve_profile(exif.get('camera_maker'), exif['camera_model'],
+                                         exif.get('lens_maker'), exif['lens_model'])
+            with self._lock:
+                self.entries[key] = profile
+            self.save()
+        return profile
+
+    def save(self):
+        """原子地写回 (合并其他进程同时写入的条目)"""
+        with self._lock:
+            entries = self._read()
+            entries.update(self.entries)
+            self.entries = entries
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(prefix=PROFILES_FILENAME, suffix='.tmp', dir=directory)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'version': PROFILES_FORMAT_VERSION, 'database': self.signature, 'profiles': entries},
+                              f, indent=1, sort_keys=True, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_profile_cache(cache_dir: Optional[str] = None, custom_db_path: Optional[str] = None) -> ProfileCache:
+    """获取进程内复用的 ProfileCache (按文件路径和数据库标识区分)"""
+    key = (default_profiles_path(cache_dir), lf.database_signature(custom_db_path))
+    cache = _instances.get(key)
+    if cache is None:
+        with _instances_lock:
+            cache = _instances.get(key)
+            if cache is None:
+                cache = ProfileCache(*key)
+                _instances[key] = cache
+    return cache
+
+
+def build_report(root: str, files: Iterable[str], custom_db_path: Optional[str] = None,
+                 cache_dir: Optional[str] = None, logger: callable = print) -> List[dict]:
+    """
+    只读取文件头，解析一批文件的镜头配置
+
+    Args:
+        root: 输入目录
+        files: 相对 root 的路径
+
+    Returns:
+        按 (相机, 镜头) 分组的列表，每组包含 exif (名称)、files、profile 和 status:
+        'found' / 'missing' (Lensfun 中没有该镜头) / 'unknown' (Lensfun 不可用) / 'no-exif' (缺少型号) /
+        'unreadable' (无法读取文件头)
+    """
+    cache = get_profile_cache(cache_dir, custom_db_path)
+
+    def read(rel_path):
+        try:
+            return rel_path, read_lens_exif(os.path.join(root, rel_path))
+        except Exception:
+            return rel_path, None
+
+    groups = {}
+    with concurrent.futures.ThreadPoolExecutor(_HEADER_READERS) as executor:
+        for rel_path, exif in executor.map(read, files):
+            if exif is None:
+                key = ('unreadable',)
+            else:
+                key = profile_key(exif) or ('no-exif',)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {'exif': exif or {}, 'files': [], 'profile': None, 'status': key[0]}
+                if isinstance(key, str):
+                    group['profile'] = cache.resolve(exif, custom_db_path, logger=logger)
+                    if group['profile'] is None:
+                        group['status'] = 'unknown'
+                    else:
+                        group['status'] = 'missing' if is_known_missing(group['profile']) else 'found'
+            group['files'].append(rel_path)
+    return sorted(groups.values(), key=lambda group: -len(group['files']))
@@ -3,12 +3,18 @@ Lensfun库的Python包装器
 用于镜头畸变、色差和暗角校正
 """
 
+import contextlib
 import ctypes
+import hashlib
+import json
 import numpy as np
 from typing import Optional
 import platform
 import os
 import sys
+import threading
+
+from raw_alchemy import lens_maps
 
 def _get_base_path():
     """
@@ -133,12 +139,21 @@ class lfDatabase(ctypes.Structure):
     pass
 
 class lfCamera(ctypes.Structure):
-    """相机对象 (不透明)"""
-    pass
+    """相机对象 (只声明开头的公开字段，其余不透明)"""
+    _fields_ = [
+        ('Maker', ctypes.c_char_p),    # lfMLstr: 第一个字符串为默认名称
+        ('Model', ctypes.c_char_p),
+        ('Variant', ctypes.c_char_p),
+        ('Mount', ctypes.c_char_p),
+        ('CropFactor', ctypes.c_float),
+    ]
 
 class lfLens(ctypes.Structure):
-    """镜头对象 (不透明)"""
-    pass
+    """镜头对象 (只声明开头的公开字段，其余不透明)"""
+    _fields_ = [
+        ('Maker', ctypes.c_char_p),
+        ('Model', ctypes.c_char_p),
+    ]
 
 class lfModifier(ctypes.Structure):
     """校正修改器对象 (不透明)"""
@@ -256,6 +271,11 @@ if _lensfun:
 # Python包装类
 # ============================================================================
 
+def _bundled_database_path() -> str:
+    """随程序分发的 Lensfun 数据库目录"""
+    return os.path.join(_get_base_path(), "vendor", "lensfun", "share", "lensfun", "version_2")
+
+
 class LensfunDatabase:
     """Lensfun数据库包装器"""
     
@@ -265,10 +285,11 @@ class LensfunDatabase:
         self.db = _lensfun.lf_db_create()
         if not self.db:
             raise RuntimeError("Could not create lensfun database")
+        # 模糊匹配结果 (指针属于数据库，与数据库同生命周期)，同一批次中相同的 EXIF 名称只匹配一次
+        self._lookups = {}
         
         # 检查本地数据库路径
-        base_path = _get_base_path()
-        db_path = os.path.join(base_path, "vendor", "lensfun", "share", "lensfun", "version_2")
+        db_path = _bundled_database_path()
         
         result = -1
         if os.path.isdir(db_path):
@@ -313,24 +334,61 @@ class LensfunDatabase:
     
     def find_camera(self, maker: Optional[str], model: str) -> Optional[ctypes.POINTER(lfCamera)]:
         """查找相机"""
-        maker_b = maker.encode('utf-8') if maker else None
-        model_b = model.encode('utf-8')
-        
-        cameras = _lensfun.lf_db_find_cameras_ext(self.db, maker_b, model_b, 0)
-        if cameras and cameras[0]:
-            return cameras[0]
-        return None
+        key = ('camera', maker, model)
+        if key not in self._lookups:
+            maker_b = maker.encode('utf-8') if maker else None
+            model_b = model.encode('utf-8')
+
+            cameras = _lensfun.lf_db_find_cameras_ext(self.db, maker_b, model_b, 0)
+            self._lookups[key] = _first_and_free(cameras)
+        return self._lookups[key]
     
     def find_lens(self, camera: Optional[ctypes.POINTER(lfCamera)], 
                   maker: Optional[str], model: str) -> Optional[ctypes.POINTER(lfLens)]:
         """查找镜头"""
-        maker_b = maker.encode('utf-8') if maker else None
-        model_b = model.encode('utf-8')
-        
-        lenses = _lensfun.lf_db_find_lenses(self.db, camera, maker_b, model_b, 0)
-        if lenses and lenses[0]:
-            return lenses[0]
+        key = ('lens', ctypes.addressof(camera.contents) if camera else None, maker, model)
+        if key not in self._lookups:
+            maker_b = maker.encode('utf-8') if maker else None
+            model_b = model.encode('utf-8')
+
+            lenses = _lensfun.lf_db_find_lenses(self.db, camera, maker_b, model_b, 0)
+            self._lookups[key] = _first_and_free(lenses)
+        return self._lookups[key]
+
+    def resolve_profile(self, camera_maker: Optional[str], camera_model: str,
+                        lens_maker: Optional[str], lens_model: str) -> dict:
+        """
+        模糊匹配相机和镜头，返回匹配到的配置 (数据库中的名称，可持久化)
+
+        Returns:
+            {'camera': {'maker', 'model', 'crop_factor'} 或 None, 'lens': {'maker', 'model'} 或 None}
+        """
+        camera = self.find_camera(camera_maker, camera_model)
+        lens = self.find_lens(camera, lens_maker, lens_model)
+        profile = {'camera': None, 'lens': None}
+        if camera:
+            profile['camera'] = {
+                'maker': _mlstr(camera.contents.Maker),
+                'model': _mlstr(camera.contents.Model),
+                'crop_factor': round(float(camera.contents.CropFactor), 4),
+            }
+        if lens:
+            profile['lens'] = {'maker': _mlstr(lens.contents.Maker), 'model': _mlstr(lens.contents.Model)}
+        return profile
+
+
+def _first_and_free(results):
+    """取查找结果列表的第一项并释放列表本身 (列表由 lensfun 分配，元素属于数据库)"""
+    if not results:
         return None
+    first = results[0] if results[0] else None
+    _lensfun.lf_free(results)
+    return first
+
+
+def _mlstr(value: Optional[bytes]) -> Optional[str]:
+    """lfMLstr 的默认名称"""
+    return value.decode('utf-8', errors='replace') if value else None
 
 
 class LensfunModifier:
@@ -428,6 +486,134 @@ class LensfunModifier:
 # 便捷函数
 # ============================================================================
 
+# 进程内已加载的数据库，工作进程启动时可预先加载
+# 键: (内置数据库目录, 自定义数据库的 (绝对路径, 修改时间, 大小))，自定义 XML 被修改后自动重新加载
+_database_cache = {}
+_database_lock = threading.Lock()
+
+
+def _database_key(custom_db_path: Optional[str]) -> tuple:
+    bundled = _bundled_database_path()
+    bundled = bundled if os.path.isdir(bundled) else None
+    custom = None
+    if custom_db_path:
+        try:
+            st = os.stat(custom_db_path)
+            custom = (os.path.abspath(custom_db_path), st.st_mtime_ns, st.st_size)
+        except OSError:
+            # 与 LensfunDatabase 一致: 不存在的自定义数据库被忽略
+            pass
+    return bundled, custom
+
+
+def _custom_path(key: tuple) -> Optional[str]:
+    return key[1][0] if key[1] else None
+
+
+_signatures = {}
+
+
+def database_signature(custom_db_path: Optional[str] = None) -> str:
+    """
+    Lensfun 数据库的标识，数据库变化时随之改变 (不需要加载数据库)
+
+    由内置数据库目录中各文件的名称、大小和修改时间，以及自定义数据库的路径、修改时间和大小计算。
+    """
+    key = _database_key(custom_db_path)
+    signature = _signatures.get(key)
+    if signature is None:
+        bundled = []
+        if key[0]:
+            for name in sorted(os.listdir(key[0])):
+                st = os.stat(os.path.join(key[0], name))
+                bundled.append([name, st.st_size, st.st_mtime_ns])
+        payload = json.dumps({'bundled': key[0], 'files': bundled, 'custom': key[1]}, sort_keys=True)
+        signature = hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+        _signatures[key] = signature
+    return signature
+
+
+def get_database(custom_db_path: Optional[str] = None, logger: callable = print) -> LensfunDatabase:
+    """
+    获取进程内复用的 LensfunDatabase
+
+    首次使用时才加载 (lf_db_create + 完整解析内置数据库 XML + 读取自定义 XML)，之后每张图片直接复用；
+    多线程同时调用时只加载一次。自定义数据库文件变化后重新加载并替换旧的数据库
+    (仍在使用旧数据库的调用持有它的引用，不受影响)。
+    """
+    key = _database_key(custom_db_path)
+    db = _database_cache.get(key)
+    if db is None:
+        with _database_lock:
+            db = _database_cache.get(key)
+            if db is None:
+                db = LensfunDatabase(custom_db_path=custom_db_path, logger=logger)
+                # 同一自定义数据库的旧版本不再使用
+                for old in [k for k in _database_cache if k[0] == key[0] and _custom_path(k) == _custom_path(key)]:
+                    del _database_cache[old]
+                _database_cache[key] = db
+    return db
+
+
+# 稀疏坐标网格的插值误差上限 (像素)，超出时网格间距减半直到满足
+LENS_GRID_TOLERANCE_PX = 0.05
+
+# 最大位移 (含各通道的横向色差) 低于该值 (像素) 时跳过几何重采样: 插值带来的模糊比校正收益更明显
+GEOMETRY_SKIP_PX = 0.5
+
+# 检查网格插值误差时抽样的网格行数 (包含畸变最大的首尾两行)
+_GRID_CHECK_ROWS = 8
+
+# 由整图坐标表估计最大位移时的抽样间距 (像素)
+_DISPLACEMENT_STRIDE = 16
+
+
+def _geometry_grid(modifier: 'LensfunModifier', width: int, height: int, step: int) -> Optional[np.ndarray]:
+    """
+    按 step 间距计算坐标网格
+
+    逐行调用 lensfun (行宽延伸到覆盖最后一列的网格点)，再在行内按间距抽取，
+    计算量和内存约为整图坐标表的 1/step。
+
+    Returns:
+        (Gh, Gw, 3, 2) float32，grid[gy, gx] 对应输出像素 (gx * step, gy * step)；lensfun 失败时为 None
+    """
+    grid_h = max(2, -(-(height - 1) // step) + 1)
+    grid_w = max(2, -(-(width - 1) // step) + 1)
+    row_width = (grid_w - 1) * step + 1
+    grid = np.empty((grid_h, grid_w, 3, 2), dtype=np.float32)
+    for k in range(grid_h):
+        row = modifier.apply_subpixel_geometry_distortion(0.0, float(k * step), row_width, 1)
+        if row is None:
+            return None
+        grid[k] = row[0, ::step]
+    return grid
+
+
+def _grid_error(modifier: 'LensfunModifier', grid: np.ndarray, width: int, height: int, step: int) -> float:
+    """抽样若干网格行中间的整行精确坐标，返回与网格双线性插值结果的最大偏差 (像素)"""
+    xs = np.arange(width)
+    ix = np.minimum(xs // step, grid.shape[1] - 2)
+    fx = ((xs - ix * step) / step)[:, None, None]
+    error = 0.0
+    for k in np.unique(np.linspace(0, grid.shape[0] - 2, _GRID_CHECK_ROWS).round().astype(int)):
+        y = min(k * step + step // 2, height - 1)
+        exact = modifier.apply_subpixel_geometry_distortion(0.0, float(y), width, 1)
+        if exact is None:
+            return float('inf')
+        fy = (y - k * step) / step
+        top = grid[k, ix] * (1 - fx) + grid[k, ix + 1] * fx
+        bottom = grid[k + 1, ix] * (1 - fx) + grid[k + 1, ix + 1] * fx
+        error = max(error, float(np.abs(top * (1 - fy) + bottom * fy - exact[0]).max()))
+    return error
+
+
+def _max_displacement(coords: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> float:
+    """坐标表 (在 xs × ys 像素处抽样) 相对恒等映射的最大位移 (像素)"""
+    return float(max(np.abs(coords[..., 0] - xs[None, :, None]).max(),
+                     np.abs(coords[..., 1] - ys[:, None, None]).max()))
+
+
 def apply_lens_correction(
     image: np.ndarray,
     camera_maker: Optional[str],
@@ -443,6 +629,10 @@ def apply_lens_correction(
     distance: float = 1000.0,
     custom_db_path: Optional[str] = None,
     logger: callable = print,
+    map_cache_dir: Optional[str] = None,
+    lens_grid: int = 0,
+    interpolation: str = 'bicubic',
+    kernel_lock=None,
 ) -> np.ndarray:
     """应用镜头校正到图像
     
@@ -459,6 +649,10 @@ def apply_lens_correction(
         correct_tca: 是否校正横向色差
         correct_vignetting: 是否校正暗角
         distance: 对焦距离 (米)
+        map_cache_dir: 坐标表与暗角增益场的磁盘缓存目录 (解码缓存目录)，None 时使用用户缓存目录
+        lens_grid: 稀疏坐标网格的间距 (像素)，在重采样时插值坐标以代替整图坐标表；0 使用整图坐标表
+        interpolation: 几何校正重采样的插值方式 ('bilinear' / 'bicubic' / 'lanczos3')
+        kernel_lock: 重采样核函数调用期间持有的锁 (numba workqueue 线程层下串行化并行核函数)，None 时不加锁
     
     返回:
         校正后的图像（与输入相同dtype）
@@ -477,7 +671,7 @@ def apply_lens_correction(
     height, width = image.shape[:2]
     
     # 创建数据库并查找相机和镜头
-    db = LensfunDatabase(custom_db_path=custom_db_path, logger=logger)
+    db = get_database(custom_db_path=custom_db_path, logger=logger)
     camera = db.find_camera(camera_maker, camera_model)
     lens = db.find_lens(camera, lens_maker, lens_model)
     
@@ -494,59 +688,119 @@ def apply_lens_correction(
         else:
             crop_factor = 1.0
     
-    # 创建修改器
-    modifier = LensfunModifier(lens, focal_length, crop_factor, width, height, LF_PF_F32)
-    
-    # 启用所需的校正并应用自动缩放
-    if correct_distortion:
-        modifier.enable_distortion_correction()
-        # 获取并应用自动缩放以消除黑边
-        auto_scale = modifier.get_auto_scale()
-        if auto_scale < 1.0:
-            modifier.enable_scaling(1.0/auto_scale)
-        else:
-            modifier.enable_scaling(auto_scale)
-        logger(f"  ⚖️ [Lensfun] Auto-scaling enabled with factor: {auto_scale:.4f}")
+    # 相同光学配置的坐标表和暗角增益场直接复用 (见 lens_maps)
+    optics = {
+        'database': database_signature(custom_db_path),
+        'camera': [camera_maker, camera_model],
+        'lens': [lens_maker, lens_model],
+        'focal': float(focal_length),
+        'crop': float(crop_factor),
+        'size': [width, height],
+        'distortion': bool(correct_distortion),
+        'tca': bool(correct_tca),
+    }
+    modifier = None
+
+    def get_modifier():
+        """按需创建修改器 (两种表都命中缓存时不需要)"""
+        nonlocal modifier
+        if modifier is None:
+            modifier = LensfunModifier(lens, focal_length, crop_factor, width, height, LF_PF_F32)
+
+            # 启用所需的校正并应用自动缩放
+            if correct_distortion:
+                modifier.enable_distortion_correction()
+                # 获取并应用自动缩放以消除黑边
+                auto_scale = modifier.get_auto_scale()
+                if auto_scale < 1.0:
+                    modifier.enable_scaling(1.0/auto_scale)
+                else:
+                    modifier.enable_scaling(auto_scale)
+                logger(f"  ⚖️ [Lensfun] Auto-scaling enabled with factor: {auto_scale:.4f}")
+
+            if correct_tca:
+                modifier.enable_tca_correction()
+
+            if correct_vignetting:
+                modifier.enable_vignetting_correction(aperture, distance)
+        return modifier
 
-    if correct_tca:
-        modifier.enable_tca_correction()
-    
-    if correct_vignetting:
-        modifier.enable_vignetting_correction(aperture, distance)
-    
-    # 创建输出图像
-    output = np.zeros_like(image)
-    
     # 步骤1: 应用颜色修改（暗角）
     # 这是原位操作，会直接修改 image 数组。
     # 后续的几何校正会从这个修改后的 image 中读取数据，所以这是期望的行为。
     if correct_vignetting:
-        modifier.apply_color_modification(image, 0.0, 0.0, width, height)
+        def build_gain():
+            # lensfun 对 R/G/B 使用相同的暗角增益: 对全 1 图像应用一次即得到增益场
+            gain = np.ones((height, width, 3), dtype=np.float32)
+            if not get_modifier().apply_color_modification(gain, 0.0, 0.0, width, height):
+                # 镜头没有暗角数据: 缓存空表，之后直接跳过
+                return np.ones((0, 0), dtype=np.float32)
+            return np.ascontiguousarray(gain[:, :, 0])
+
+        gain = lens_maps.get_map('vignetting', dict(optics, aperture=float(aperture), distance=float(distance)),
+                                 map_cache_dir, build_gain)
+        if gain.size:
+            np.multiply(image, gain[:, :, None], out=image)
     
     # 步骤2: 应用几何畸变和TCA校正
+    output = image
     if correct_distortion or correct_tca:
-        coords = modifier.apply_subpixel_geometry_distortion(0.0, 0.0, width, height)
-        
-        if coords is not None:
-            # 使用scipy的map_coordinates进行插值
-            from scipy.ndimage import map_coordinates
-            
-            for c in range(3):  # R, G, B
-                coords_c = coords[:, :, c, :]
-                coordinates = np.array([coords_c[:, :, 1], coords_c[:, :, 0]])
-                
-                output[:, :, c] = map_coordinates(
-                    image[:, :, c],
-                    coordinates,
-                    order=3,
-                    mode='constant',
-                    cval=0.0
-                )
+        from raw_alchemy import utils
+        method = utils.REMAP_METHODS[interpolation]
+        kernels = kernel_lock if kernel_lock is not None else contextlib.nullcontext()
+
+        def build_dense():
+            return get_modifier().apply_subpixel_geometry_distortion(0.0, 0.0, width, height)
+
+        def build_plan():
+            # [网格间距 (1 表示整图坐标表), 网格插值误差, 最大位移]
+            step = int(lens_grid)
+            while step > 1:
+                grid = _geometry_grid(get_modifier(), width, height, step)
+                if grid is None:
+                    return None
+                error = _grid_error(get_modifier(), grid, width, height, step)
+                if error <= LENS_GRID_TOLERANCE_PX:
+                    lens_maps.get_map('geometry-grid', dict(optics, step=step), map_cache_dir, lambda: grid)
+                    nodes_y = np.arange(grid.shape[0]) * step
+                    nodes_x = np.arange(grid.shape[1]) * step
+                    return np.array([step, error, _max_displacement(grid, nodes_x, nodes_y)])
+                # 误差超出上限: 网格加密一倍
+                step //= 2
+            coords = lens_maps.get_map('geometry', optics, map_cache_dir, build_dense)
+            if coords is None:
+                return None
+            nodes_y = np.unique(np.r_[np.arange(0, height, _DISPLACEMENT_STRIDE), height - 1])
+            nodes_x = np.unique(np.r_[np.arange(0, width, _DISPLACEMENT_STRIDE), width - 1])
+            return np.array([1, 0.0, _max_displacement(coords[np.ix_(nodes_y, nodes_x)], nodes_x, nodes_y)])
+
+        plan = lens_maps.get_map('geometry-plan', dict(optics, grid=int(lens_grid)), map_cache_dir, build_plan)
+        if plan is None:
+            pass
+        elif plan[2] < GEOMETRY_SKIP_PX:
+            logger(f"  ⏭️ [Lensfun] Max displacement {plan[2]:.2f} px is sub-pixel. Skipping geometry resampling.")
+        elif plan[0] > 1:
+            step = int(plan[0])
+            grid = lens_maps.get_map('geometry-grid', dict(optics, step=step), map_cache_dir,
+                                     lambda: _geometry_grid(get_modifier(), width, height, step))
+            if grid is not None:
+                logger(f"  🕸️ [Lensfun] Sparse {step} px coordinate grid, max interpolation error {plan[1]:.3f} px.")
+                output = np.empty_like(image)
+                with kernels:
+                    utils.remap_grid_into(image, np.asarray(grid), step, output, method)
         else:
-            output = image
-    else:
-        output = image
-    
+            if lens_grid > 1:
+                logger(f"  🕸️ [Lensfun] Sparse grid exceeds {LENS_GRID_TOLERANCE_PX} px error. Using dense map.")
+            coords = lens_maps.get_map('geometry', optics, map_cache_dir, build_dense)
+            if coords is not None:
+                # 单遍并行重采样交错 RGB，每个通道使用各自的坐标 (横向色差)
+                output = np.empty_like(image)
+                with kernels:
+                    utils.remap_into(image, np.asarray(coords), output, method)
+    
+    if modifier is None:
+        logger("  ♻️ [Lensfun] Reused cached correction maps.")
+
     # 转换回原始dtype
     if output.dtype != original_dtype:
         output = output.astype(original_dtype)
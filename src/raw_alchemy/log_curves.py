@@ -0,0 +1,263 @@
+"""
+Log 编码曲线模块
+为 config.LOG_TO_WORKING_SPACE 中的每条相机 Log 曲线提供原生 numba 实现 (float32 原位处理)，
+替代 colour.cctf_encoding 的通用分发和 float64 临时数组。
+
+所有曲线与 colour 的默认参数一致 (归一化码值、in_reflection=True、最新版本的方法)，
+与 colour 的最大绝对误差不超过 LOG_ENCODING_TOLERANCE (远小于 16-bit 量化步长 1/65535)。
+查表模式在大部分区间内误差约 1e-6，仅在曲线分段点附近 (部分曲线在分段点处不完全连续)
+达到 LOG_TABLE_TOLERANCE。
+"""
+from functools import lru_cache
+
+import numpy as np
+from numba import njit, prange
+
+from raw_alchemy.config import LOG_TO_WORKING_SPACE, LOG_ENCODING_MAP
+
+# 与 colour 结果对比的最大绝对误差 (float32 输出)
+LOG_ENCODING_TOLERANCE = 2e-6
+# 查表模式的最大绝对误差 (出现在 L-Log 分段点附近)
+LOG_TABLE_TOLERANCE = 5e-4
+
+# ==========================================
+#              曲线族定义
+# ==========================================
+
+# 对数段 + 线性趾部: y = e*x + f (x < cut) / c*log10(a*x + b) + d
+# params: (cut, a, b, c, d, e, f, inclusive)，inclusive=1 表示 x == cut 时也走线性段
+FAMILY_LOG10_LINEAR = 0
+# Nikon N-Log: 立方根趾部 + 自然对数段
+# params: (cut, a, b, c, d)
+FAMILY_NLOG = 1
+# Canon Log 2/3: 关于原点对称的对数段，可带线性中段
+# params: (in_scale, cut_lo, cut_hi, c, a, d_neg, lin_slope, lin_offset, d_pos)
+FAMILY_CANON = 2
+# ARRI LogC4: log2 段 + 线性趾部
+# params: (a, b, c, s, t)
+FAMILY_LOGC4 = 3
+# RED Log3G10 (v3)
+# params: (a, b, c, g)
+FAMILY_LOG3G10 = 4
+
+_PARAM_COUNT = 9
+
+
+def _params(*values):
+    arr = np.zeros(_PARAM_COUNT, dtype=np.float64)
+    arr[:len(values)] = values
+    return arr
+
+
+# 曲线名称 (colour 编码函数名，即 LOG_ENCODING_MAP 映射后的名称) -> (曲线族, 参数)
+LOG_CURVES = {
+    'F-Log': (FAMILY_LOG10_LINEAR, _params(
+        0.00089, 0.555556, 0.009468, 0.344676, 0.790453, 8.735631, 0.092864, 0)),
+    'F-Log2': (FAMILY_LOG10_LINEAR, _params(
+        0.000889, 5.555556, 0.064829, 0.245281, 0.384316, 8.799461, 0.092864, 0)),
+    'V-Log': (FAMILY_LOG10_LINEAR, _params(
+        0.01, 1.0, 0.00873, 0.241514, 0.598206, 5.6, 0.125, 0)),
+    'L-Log': (FAMILY_LOG10_LINEAR, _params(
+        0.006, 1.3, 0.0115, 0.27, 0.6, 8.0, 0.09, 1)),
+    'S-Log3': (FAMILY_LOG10_LINEAR, _params(
+        0.01125, 1.0 / 0.19, 0.01 / 0.19, 261.5 / 1023.0, 420.0 / 1023.0,
+        (171.2102946929 - 95.0) / 0.01125 / 1023.0, 95.0 / 1023.0, 0)),
+    # ALEXA SUP 3.x, Linear Scene Exposure Factor, EI 800
+    'Arri LogC3': (FAMILY_LOG10_LINEAR, _params(
+        0.010591, 5.555556, 0.052272, 0.24719, 0.385537, 5.367655, 0.092809, 1)),
+    'D-Log': (FAMILY_LOG10_LINEAR, _params(
+        0.0078, 0.9892, 0.0108, 0.256663, 0.584555, 6.025, 0.0929, 1)),
+    'N-Log': (FAMILY_NLOG, _params(
+        0.328, 0.635386119257087, 0.0075, 0.1466275659824047, 0.6050830889540567)),
+    # Canon Log 2/3 v1.2
+    'Canon Log 2': (FAMILY_CANON, _params(
+        1.0 / 0.9, 0.0, 0.0, 0.24136077, 87.09937546, 0.092864125, 0.0, 0.0, 0.092864125)),
+    'Canon Log 3': (FAMILY_CANON, _params(
+        1.0 / 0.9, -0.013999999898758771, 0.014000001417377185, 0.36726845, 14.98325,
+        0.12783901, 1.9754798, 0.12512219, 0.12240537)),
+    'Arri LogC4': (FAMILY_LOGC4, _params(
+        2231.8263090676883, 0.9071358748778103, 0.09286412512218964,
+        0.1135972086105891, -0.01805699611991131)),
+    'Log3G10': (FAMILY_LOG3G10, _params(0.224282, 155.975327, 0.01, 15.1927)),
+}
+
+
+def get_log_curve(log_space: str):
+    """
+    获取 Log 空间对应的 (曲线族, 参数)
+
+    Args:
+        log_space: Log 空间名称 (config.LOG_TO_WORKING_SPACE 的键或 colour 编码函数名)
+
+    Raises:
+        ValueError: 如果没有对应的原生实现
+    """
+    name = LOG_ENCODING_MAP.get(log_space, log_space)
+    curve = LOG_CURVES.get(name)
+    if curve is None:
+        raise ValueError(f"No native log encoding for: {log_space}")
+    return curve
+
+
+# ==========================================
+#              Numba 核函数
+# ==========================================
+
+@njit(fastmath=True, cache=True)
+def encode_scalar(x, family, params):
+    """对单个线性值做 Log 编码 (float64 计算)"""
+    if family == FAMILY_LOG10_LINEAR:
+        cut = params[0]
+        if x < cut or (params[7] != 0.0 and x == cut):
+            return params[5] * x + params[6]
+        return params[3] * np.log10(params[1] * x + params[2]) + params[4]
+
+    elif family == FAMILY_NLOG:
+        if x < params[0]:
+            return params[1] * np.cbrt(x + params[2])
+        return params[3] * np.log(x) + params[4]
+
+    elif family == FAMILY_CANON:
+        x = x * params[0]
+        cut_lo = params[1]
+        cut_hi = params[2]
+        if x < cut_lo:
+            return -params[3] * np.log10(1.0 - params[4] * x) + params[5]
+        if x <= cut_hi and cut_hi > cut_lo:
+            return params[6] * x + params[7]
+        return params[3] * np.log10(params[4] * x + 1.0) + params[8]
+
+    elif family == FAMILY_LOGC4:
+        if x >= params[4]:
+            return (np.log2(params[0] * x + 64.0) - 6.0) / 14.0 * params[1] + params[2]
+        return (x - params[4]) / params[3]
+
+    else:  # FAMILY_LOG3G10
+        x = x + params[2]
+        if x < 0.0:
+            return x * params[3]
+        return params[0] * np.log10(x * params[1] + 1.0)
+
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def log_encode_inplace(img, family, params, floor):
+    """
+    原位 Log 编码 (先按 floor 裁剪底噪，Log 函数无法处理负值)
+    img 可以是任意维度的 C 连续 float32 数组
+    """
+    flat = img.reshape(-1)
+    for i in prange(flat.shape[0]):
+        x = max(np.float64(flat[i]), floor)
+        flat[i] = encode_scalar(x, family, params)
+
+
+# ---------------- 稠密 1D 查找表模式 ----------------
+
+# 在 log2 域上均匀采样，覆盖 2^-20 ~ 2^10 的线性输入
+LOG_TABLE_SIZE = 8192
+LOG_TABLE_MIN_STOP = -20.0
+LOG_TABLE_MAX_STOP = 10.0
+
+
+@njit(fastmath=True, cache=True)
+def table_lookup(x, log_table, stop_min, inv_step, last_index):
+    """在 log2 域查找表上线性插值，超出范围时沿端点斜率外推"""
+    t = (np.log2(x) - stop_min) * inv_step
+    if t <= 0.0:
+        idx = 0
+    elif t >= last_index - 1:
+        idx = last_index - 1
+    else:
+        idx = int(t)
+    frac = t - idx
+    y0 = log_table[idx]
+    return y0 + (log_table[idx + 1] - y0) * frac
+
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def log_encode_table_inplace(img, log_table, stop_min, stop_max, floor):
+    """原位 Log 编码 (查表模式)"""
+    flat = img.reshape(-1)
+    last_index = log_table.shape[0] - 1
+    inv_step = last_index / (stop_max - stop_min)
+    for i in prange(flat.shape[0]):
+        x = max(np.float64(flat[i]), floor)
+        flat[i] = table_lookup(x, log_table, stop_min, inv_step, last_index)
+
+
+@njit(cache=True)
+def _fill_table(table, family, params, stop_min, stop_max):
+    n = table.shape[0]
+    step = (stop_max - stop_min) / (n - 1)
+    for i in range(n):
+        table[i] = encode_scalar(2.0 ** (stop_min + i * step), family, params)
+
+
+@lru_cache(maxsize=None)
+def build_log_table(log_space: str, size: int = LOG_TABLE_SIZE) -> np.ndarray:
+    """
+    用原生曲线在 log2 域上生成稠密 1D 查找表
+
+    Log 曲线在 log2 域上近似线性，线性插值误差约 1e-6；
+    分段点附近的误差见 LOG_TABLE_TOLERANCE。
+    """
+    family, params = get_log_curve(log_space)
+    table = np.empty(size, dtype=np.float32)
+    _fill_table(table, family, params, LOG_TABLE_MIN_STOP, LOG_TABLE_MAX_STOP)
+    return table
+
+
+# ==========================================
+#              对外接口
+# ==========================================
+
+def log_encode(img: np.ndarray, log_space: str, floor: float = 1e-6, use_table: bool = False) -> np.ndarray:
+    """
+    对线性图像做原位 Log 编码
+
+    Args:
+        img: float32 图像数据
+        log_space: Log 空间名称
+        floor: 编码前的底噪裁剪值
+        use_table: 使用稠密 1D 查找表 (精度见 LOG_TABLE_TOLERANCE)
+
+    Returns:
+        编码后的图像 (原地修改，返回以便链式调用)
+    """
+    if not img.flags['C_CONTIGUOUS']:
+        img = np.ascontiguousarray(img)
+    if img.dtype != np.float32:
+        img = img.astype(np.float32)
+
+    if use_table:
+        log_encode_table_inplace(img, build_log_table(log_space), LOG_TABLE_MIN_STOP, LOG_TABLE_MAX_STOP, floor)
+    else:
+        family, params = get_log_curve(log_space)
+        log_encode_inplace(img, family, params, floor)
+    return img
+
+
+def verify_against_colour(samples: int = 100000, use_table: bool = False) -> dict:
+    """
+    将每条原生曲线与 colour.cctf_encoding 对比
+
+    Returns:
+        {Log 空间名称: 最大绝对误差}
+    """
+    import colour
+
+    x = np.concatenate([
+        np.geomspace(1e-6, 64.0, samples),
+        np.linspace(0.0, 0.05, samples // 10),
+    ]).astype(np.float32)
+    x = np.maximum(x, np.float32(1e-6))
+
+    errors = {}
+    for log_space in LOG_TO_WORKING_SPACE:
+        name = LOG_ENCODING_MAP.get(log_space, log_space)
+        # Canon Log 的负值分支在 np.where 中总会被求值，忽略其无效值警告
+        with np.errstate(invalid='ignore'):
+            reference = colour.cctf_encoding(x.astype(np.float64), function=name)
+        native = log_encode(x.copy(), log_space, use_table=use_table)
+        errors[log_space] = float(np.max(np.abs(native - reference)))
+    return errors
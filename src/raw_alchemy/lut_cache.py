@@ -0,0 +1,284 @@
+"""
+LUT 缓存模块
+按 (路径, 修改时间, 文件大小) 缓存解析后的 LUT，避免每张图片 / 每次预览刷新都重新解析文本文件。
+
+- 进程内: LRU 字典，直接返回 float32 C 连续的表和定义域 (解析见 lut_parser)
+- 磁盘: 二进制 .npy + .json 元数据，批处理的各个工作进程以只读内存映射方式加载，
+  同一份表在操作系统页缓存中只存在一份；按最近使用时间淘汰，总大小不超过上限
+- 叠加: 多个 LUT 按顺序合成为一个 3D 表，同样进入上述两级缓存
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from raw_alchemy.config import DEFAULT_LUT_DISK_CACHE_GB, DEFAULT_LUT_STACK_SIZE, user_cache_dir
+from raw_alchemy.lut_parser import LoadedLUT, KIND_1D, KIND_3X1D, KIND_3D, KIND_SEQUENCE, read_lut
+
+# 磁盘格式版本，格式变化时递增即可让旧文件全部失效
+LUT_CACHE_FORMAT_VERSION = 2
+
+# 进程内最多保留的 LUT 数量 (预览时在 LUT 列表中来回切换)
+LUT_CACHE_MAX_ENTRIES = 16
+
+# 磁盘缓存的字节数上限
+LUT_DISK_MAX_BYTES = int(DEFAULT_LUT_DISK_CACHE_GB * 1024 ** 3)
+
+
+# ==========================================
+#              解析与磁盘格式
+# ==========================================
+
+def parse_lut(lut_path: str) -> LoadedLUT:
+    """解析 LUT 文件 (不经过缓存)"""
+    return read_lut(lut_path)
+
+
+def _file_signature(lut_path: str):
+    st = os.stat(lut_path)
+    return os.path.abspath(lut_path), st.st_mtime_ns, st.st_size
+
+
+def _disk_key(signature) -> str:
+    payload = json.dumps({'version': LUT_CACHE_FORMAT_VERSION, 'file': signature})
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+
+def default_lut_cache_dir(cache_dir: Optional[str] = None) -> str:
+    """LUT 磁盘缓存目录: 解码缓存目录下的 luts/，未指定时放在用户缓存目录 (不使用多用户共享的临时目录)"""
+    return os.path.join(cache_dir or user_cache_dir(), 'luts')
+
+
+def _load_from_disk(directory: str, key: str) -> Optional[LoadedLUT]:
+    meta_path = os.path.join(directory, f"{key}.json")
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        # 只读内存映射: 多个工作进程共享同一份页缓存
+        parts = [
+            LoadedLUT(part['kind'], np.load(os.path.join(directory, f"{key}-{i}.npy"), mmap_mode='r'),
+                      np.asarray(part['domain'], dtype=np.float64), part.get('name', ''))
+            for i, part in enumerate(meta['parts'])
+        ]
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        # 更新访问时间，供磁盘淘汰使用
+        os.utime(meta_path, None)
+    except OSError:
+        pass
+    if meta.get('sequence'):
+        return LoadedLUT(KIND_SEQUENCE, None, None, meta.get('name', ''), parts=parts)
+    return parts[0]
+
+
+def _save_to_disk(directory: str, key: str, lut: LoadedLUT):
+    parts = lut.parts if lut.kind == KIND_SEQUENCE else [lut]
+    if not parts or any(part.table is None for part in parts):
+        return
+
+    suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+    meta_path = os.path.join(directory, f"{key}.json")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # 先写表再写元数据: 元数据存在即表示条目完整
+        for i, part in enumerate(parts):
+            table_path = os.path.join(directory, f"{key}-{i}.npy")
+            with open(table_path + suffix, 'wb') as f:
+                np.save(f, part.table)
+            os.replace(table_path + suffix, table_path)
+        meta = {
+            'sequence': lut.kind == KIND_SEQUENCE,
+            'name': lut.name,
+            'parts': [{'kind': part.kind, 'domain': part.domain.tolist(), 'name': part.name} for part in parts],
+        }
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + suffix, meta_path)
+    except OSError:
+        return
+    _prune_disk(directory)
+
+
+def _prune_disk(directory: str):
+    """按最近使用时间淘汰磁盘上的条目 (元数据及其各部分的表)，直到总大小不超过上限"""
+    entries = {}
+    try:
+        for entry in os.scandir(directory):
+            name = entry.name
+            if not entry.is_file() or '.tmp-' in name or not name.endswith(('.json', '.npy')):
+                continue
+            stat = entry.stat()
+            key = name.split('.')[0].split('-')[0]
+            mtime, size, paths = entries.get(key, (0.0, 0, []))
+            entries[key] = (max(mtime, stat.st_mtime), size + stat.st_size, paths + [entry.path])
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries.values())
+    for mtime, size, paths in sorted(entries.values(), key=lambda e: e[0]):
+        if total <= LUT_DISK_MAX_BYTES:
+            break
+        # 先删除元数据: 元数据不存在即表示条目无效
+        paths.sort(key=lambda path: not path.endswith('.json'))
+        try:
+            for path in paths:
+                os.remove(path)
+            total -= size
+        except OSError:
+            # Windows 下被其他进程映射中的文件无法删除，跳过即可
+            continue
+
+
+# ==========================================
+#                 缓存
+# ==========================================
+
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+# 未命中时的解析 / 合成互斥 (叠加时会递归读取组成部分，因此使用可重入锁)
+_build_lock = threading.RLock()
+
+
+def _lookup(memory_key, disk_key: str, cache_dir: Optional[str], persist: bool, build) -> LoadedLUT:
+    """依次查找进程内 LRU、磁盘缓存，都未命中时调用 build() 生成并写回"""
+    with _memory_lock:
+        lut = _memory_cache.get(memory_key)
+        if lut is not None:
+            _memory_cache.move_to_end(memory_key)
+    if lut is not None:
+        return lut
+
+    with _build_lock:
+        # 等待期间其他线程可能已经完成同一个条目
+        with _memory_lock:
+            lut = _memory_cache.get(memory_key)
+        if lut is not None:
+            return lut
+
+        directory = default_lut_cache_dir(cache_dir)
+        lut = _load_from_disk(directory, disk_key) if persist else None
+        if lut is None:
+            lut = build()
+            if persist:
+                _save_to_disk(directory, disk_key, lut)
+
+        with _memory_lock:
+            _memory_cache[memory_key] = lut
+            _memory_cache.move_to_end(memory_key)
+            while len(_memory_cache) > LUT_CACHE_MAX_ENTRIES:
+                _memory_cache.popitem(last=False)
+    return lut
+
+
+def get_lut(lut_path: Union[str, Sequence[str]], cache_dir: Optional[str] = None, persist: bool = True,
+            layout: Optional[str] = None, stack_size: int = DEFAULT_LUT_STACK_SIZE) -> LoadedLUT:
+    """
+    读取 LUT (依次查找进程内 LRU、磁盘二进制缓存，最后才解析原文件)
+
+    Args:
+        lut_path: LUT 文件路径；传入多个路径时按顺序叠加并合成为一个 LUT (见 compose_luts)
+        cache_dir: 解码缓存目录 (磁盘缓存存放在其 luts/ 子目录)，None 时使用用户缓存目录
+        persist: 是否读写磁盘缓存
+        layout: 3D LUT 的内存布局 (见 lut_layout)，'auto' 按微基准测试选择，None 保持原始布局
+        stack_size: 叠加多个 LUT 时合成表的每轴格点数
+
+    Returns:
+        LoadedLUT
+
+    Raises:
+        OSError / ValueError: 文件不存在或无法解析
+    """
+    if not isinstance(lut_path, str):
+        paths = list(lut_path)
+        if len(paths) != 1:
+            lut = _get_lut_stack(paths, cache_dir, persist, stack_size)
+            return lut.pack(layout) if layout else lut
+        lut_path = paths[0]
+
+    signature = _file_signature(lut_path)
+    lut = _lookup(signature, _disk_key(signature), cache_dir, persist, lambda: parse_lut(lut_path))
+    return lut.pack(layout) if layout else lut
+
+
+def _get_lut_stack(lut_paths: List[str], cache_dir: Optional[str], persist: bool, stack_size: int) -> LoadedLUT:
+    """读取并合成多个 LUT，合成结果与单个 LUT 一样进入内存和磁盘缓存"""
+    if not lut_paths:
+        raise ValueError("Empty LUT stack")
+    signatures = tuple(_file_signature(path) for path in lut_paths)
+    memory_key = ('stack', signatures, stack_size)
+
+    def build():
+        # 组成部分只进内存缓存，磁盘上只保存合成结果
+        luts = [get_lut(path, cache_dir, persist=False) for path in lut_paths]
+        return compose_luts(luts, stack_size, name=lut_display_name(lut_paths))
+
+    return _lookup(memory_key, _disk_key(memory_key), cache_dir, persist, build)
+
+
+# ==========================================
+#                 LUT 叠加
+# ==========================================
+
+def _input_bounds(lut: LoadedLUT):
+    """LUT 输入定义域的 (min, max)，各为长度 3 的数组"""
+    if lut.kind == KIND_SEQUENCE:
+        return _input_bounds(lut.parts[0])
+    if lut.is_irregular:
+        return lut.domain.min(axis=0), lut.domain.max(axis=0)
+    return lut._domain_bounds()
+
+
+def compose_luts(luts: List[LoadedLUT], size: int = DEFAULT_LUT_STACK_SIZE, name: str = '') -> LoadedLUT:
+    """
+    将按顺序叠加的多个 LUT 合成为一个 3D LUT
+
+    在第一个 LUT 的输入定义域上生成 size³ 的格点，依次用各 LUT 的 apply_inplace
+    (3D 部分即 utils.apply_lut_inplace) 原位处理格点得到合成表。
+    如果第一个 LUT 以 1D shaper 开头，保留该 shaper，合成表建立在 shaper 的输出范围上，
+    以免线性输入的暗部精度丢失。
+
+    Returns:
+        3D LoadedLUT，或 shaper + 3D 的序列
+    """
+    first = luts[0]
+    shaper = None
+    chain = list(luts)
+    if first.kind == KIND_SEQUENCE and first.parts and first.parts[0].kind in (KIND_1D, KIND_3X1D):
+        shaper = first.parts[0]
+        chain = first.parts[1:] + chain[1:]
+        shaper_table = shaper._table_2d()
+        lo = np.broadcast_to(shaper_table.min(axis=0), (3,)).astype(np.float64)
+        hi = np.broadcast_to(shaper_table.max(axis=0), (3,)).astype(np.float64)
+    else:
+        lo, hi = _input_bounds(first)
+
+    axes = [np.linspace(lo[c], hi[c], size, dtype=np.float32) for c in range(3)]
+    r, g, b = np.meshgrid(*axes, indexing='ij')
+    lattice = np.ascontiguousarray(np.stack([r, g, b], axis=-1).reshape(size, size * size, 3))
+    for lut in chain:
+        lattice = lut.apply_inplace(lattice)
+
+    cube = LoadedLUT(KIND_3D, np.ascontiguousarray(lattice.reshape(size, size, size, 3), dtype=np.float32),
+                     np.array([lo, hi], dtype=np.float64), name)
+    if shaper is None:
+        return cube
+    return LoadedLUT(KIND_SEQUENCE, None, None, name, parts=[shaper, cube])
+
+
+def lut_display_name(lut_path: Union[str, Sequence[str], None]) -> str:
+    """日志中显示的 LUT 名称 (叠加时按顺序用 ' + ' 连接)"""
+    if not lut_path:
+        return ''
+    if isinstance(lut_path, str):
+        return os.path.basename(lut_path)
+    return ' + '.join(os.path.basename(path) for path in lut_path)
+
+
+def clear_memory_cache():
+    """清空进程内缓存"""
+    with _memory_lock:
+        _memory_cache.clear()
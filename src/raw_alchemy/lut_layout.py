@@ -0,0 +1,375 @@
+"""
+3D LUT 内存布局模块
+为 3D LUT 提供多种内存布局及对应的四面体插值核函数，并在加载时用微基准测试为每个尺寸选择最快的布局。
+
+布局:
+    - rgb:     (N, N, N, 3) float32，原始布局 (utils.apply_lut_inplace)
+    - rgba:    每个格点填充为 16 字节 (N³, 4) float32，一个格点不会跨越缓存行
+    - blocked: 4×4×4 的砖块连续存放，砖块内按 Morton (Z 序) 排列，相邻格点大多落在同一缓存行/页
+    - rgba16:  rgba 布局的 float16 版本 (以 uint16 位模式存储，核函数内解码)，表大小减半，
+               精度约 2.5e-4 (float16 舍入)，只在显式指定时使用
+"""
+import time
+import threading
+from typing import Optional
+
+import numpy as np
+from numba import njit, prange
+
+from raw_alchemy import utils
+
+LAYOUT_RGB = 'rgb'
+LAYOUT_RGBA = 'rgba'
+LAYOUT_BLOCKED = 'blocked'
+LAYOUT_RGBA16 = 'rgba16'
+LAYOUT_AUTO = 'auto'
+
+LUT_LAYOUTS = (LAYOUT_RGB, LAYOUT_RGBA, LAYOUT_BLOCKED, LAYOUT_RGBA16)
+
+# 自动选择时参与比较的布局 (rgba16 会损失精度，不参与自动选择)
+AUTO_LAYOUT_CANDIDATES = (LAYOUT_RGB, LAYOUT_RGBA, LAYOUT_BLOCKED)
+
+# 融合核函数中使用的布局编号
+LAYOUT_CODES = {LAYOUT_RGB: 0, LAYOUT_RGBA: 1, LAYOUT_BLOCKED: 2, LAYOUT_RGBA16: 3}
+
+_BRICK = 4
+# 微基准测试的像素数 (随机分布，单核约几十毫秒)
+_BENCH_PIXELS = 1 << 18
+
+# float16 指数 -> 2^(e-25) (e=0 时为非规格化数的 2^-24)
+HALF_POW2 = np.array([2.0 ** -24] + [2.0 ** (e - 25) for e in range(1, 32)], dtype=np.float32)
+
+# 融合核函数中未使用的打包表占位 (numba 需要确定的参数类型)
+EMPTY_PACKED_F32 = np.zeros((1, 4), dtype=np.float32)
+EMPTY_PACKED_U16 = np.zeros((1, 4), dtype=np.uint16)
+
+
+class PackedLUT:
+    """
+    以特定布局存储的 3D LUT
+
+    Attributes:
+        layout: 布局名称
+        table: 打包后的表 (rgb 布局时为原始 (N, N, N, 3) 表)
+        size: 每轴格点数
+        domain_min / domain_max: 长度 3 的 float64 定义域
+    """
+
+    def __init__(self, layout: str, table: np.ndarray, size: int, domain_min: np.ndarray, domain_max: np.ndarray):
+        self.layout = layout
+        self.code = LAYOUT_CODES[layout]
+        self.table = table
+        self.size = size
+        self.domain_min = domain_min
+        self.domain_max = domain_max
+
+    def kernel_tables(self):
+        """融合核函数所需的 (布局编号, float32 表, uint16 表)，未使用的一个为占位表"""
+        if self.layout == LAYOUT_RGBA16:
+            return self.code, EMPTY_PACKED_F32, self.table
+        return self.code, self.table, EMPTY_PACKED_U16
+
+    def apply_inplace(self, img: np.ndarray) -> np.ndarray:
+        """原位应用 LUT (四面体插值)"""
+        if not img.flags['C_CONTIGUOUS']:
+            img = np.ascontiguousarray(img)
+        if img.dtype != np.float32:
+            img = img.astype(np.float32)
+
+        if self.layout == LAYOUT_RGB:
+            utils.apply_lut_inplace(img, self.table, self.domain_min, self.domain_max)
+        elif self.layout == LAYOUT_RGBA:
+            apply_lut_rgba_inplace(img, self.table, self.size, self.domain_min, self.domain_max)
+        elif self.layout == LAYOUT_BLOCKED:
+            apply_lut_blocked_inplace(img, self.table, self.size, self.domain_min, self.domain_max)
+        else:
+            apply_lut_rgba16_inplace(img, self.table, self.size, HALF_POW2, self.domain_min, self.domain_max)
+        return img
+
+
+# ==========================================
+#              打包
+# ==========================================
+
+def _bricks_per_axis(size: int) -> int:
+    return (size + _BRICK - 1) // _BRICK
+
+
+def _morton_offsets() -> np.ndarray:
+    """砖块内 (x, y, z) -> Morton 偏移 (0-63)"""
+    x, y, z = np.meshgrid(np.arange(_BRICK), np.arange(_BRICK), np.arange(_BRICK), indexing='ij')
+    return ((x & 1) | ((y & 1) << 1) | ((z & 1) << 2) | ((x & 2) << 2) | ((y & 2) << 3) | ((z & 2) << 4))
+
+
+def pack_table(table: np.ndarray, layout: str) -> np.ndarray:
+    """
+    将 (N, N, N, 3) 的表转换为指定布局
+
+    Raises:
+        ValueError: 未知布局
+    """
+    size = table.shape[0]
+    table = np.ascontiguousarray(table, dtype=np.float32)
+    if layout == LAYOUT_RGB:
+        return table
+
+    rgba = np.zeros((size, size, size, 4), dtype=np.float32)
+    rgba[..., :3] = table
+    if layout == LAYOUT_RGBA:
+        return rgba.reshape(-1, 4)
+    if layout == LAYOUT_RGBA16:
+        half = np.clip(rgba, -65504.0, 65504.0).astype(np.float16)
+        return np.ascontiguousarray(half.view(np.uint16).reshape(-1, 4))
+    if layout == LAYOUT_BLOCKED:
+        nb = _bricks_per_axis(size)
+        padded = np.zeros((nb * _BRICK, nb * _BRICK, nb * _BRICK, 4), dtype=np.float32)
+        padded[:size, :size, :size] = rgba
+        # (bx, x, by, y, bz, z) -> (bx, by, bz, x, y, z)
+        bricks = padded.reshape(nb, _BRICK, nb, _BRICK, nb, _BRICK, 4).transpose(0, 2, 4, 1, 3, 5, 6)
+        bricks = bricks.reshape(nb, nb, nb, _BRICK ** 3, 4)
+        out = np.empty_like(bricks)
+        out[:, :, :, _morton_offsets().ravel()] = bricks
+        return np.ascontiguousarray(out.reshape(-1, 4))
+    raise ValueError(f"Unknown LUT layout: {layout}")
+
+
+def pack_lut(table: np.ndarray, domain: np.ndarray, layout: str) -> PackedLUT:
+    """将 3D LUT 的表和 (2, 3) 定义域打包为 PackedLUT"""
+    domain = np.asarray(domain, dtype=np.float64)
+    return PackedLUT(layout, pack_table(table, layout), table.shape[0],
+                     np.ascontiguousarray(domain[0]), np.ascontiguousarray(domain[1]))
+
+
+# ==========================================
+#              Numba 核函数
+# ==========================================
+
+@njit(fastmath=True, cache=True)
+def tetrahedral_weights(dx, dy, dz):
+    """
+    四面体插值的权重与中间两个顶点的偏移
+
+    Returns:
+        (w0, w1, w2, w3, o1x, o1y, o1z, o2x, o2y, o2z)，顶点依次为 P0、P0+o1、P0+o2、P0+(1,1,1)
+    """
+    if dx >= dy:
+        if dy >= dz:
+            return 1.0 - dx, dx - dy, dy - dz, dz, 1, 0, 0, 1, 1, 0
+        elif dx >= dz:
+            return 1.0 - dx, dx - dz, dz - dy, dy, 1, 0, 0, 1, 0, 1
+        else:
+            return 1.0 - dz, dz - dx, dx - dy, dy, 0, 0, 1, 1, 0, 1
+    else:
+        if dz >= dy:
+            return 1.0 - dz, dz - dy, dy - dx, dx, 0, 0, 1, 0, 1, 1
+        elif dz >= dx:
+            return 1.0 - dy, dy - dz, dz - dx, dx, 0, 1, 0, 0, 1, 1
+        else:
+            return 1.0 - dy, dy - dx, dx - dz, dz, 0, 1, 0, 1, 1, 0
+
+
+@njit(fastmath=True, cache=True)
+def _grid_coords(idx, size_minus_1):
+    i0 = int(idx)
+    if i0 >= size_minus_1:
+        i0 = size_minus_1 - 1
+    return i0, idx - i0
+
+
+@njit(fastmath=True, cache=True)
+def _rgba_row(x, y, z, size):
+    return (x * size + y) * size + z
+
+
+@njit(fastmath=True, cache=True)
+def _blocked_row(x, y, z, nb):
+    brick = ((x >> 2) * nb + (y >> 2)) * nb + (z >> 2)
+    morton = ((x & 1) | ((y & 1) << 1) | ((z & 1) << 2)
+              | ((x & 2) << 2) | ((y & 2) << 3) | ((z & 2) << 4))
+    return brick * 64 + morton
+
+
+@njit(fastmath=True, cache=True)
+def _half_to_float(h, pow2):
+    e = (h >> 10) & 31
+    m = h & 1023
+    if e != 0:
+        m += 1024
+    v = m * pow2[e]
+    return -v if h & 0x8000 else v
+
+
+@njit(fastmath=True, cache=True)
+def packed_tetrahedral_sample(code, table_f32, table_u16, pow2, size, idx_r, idx_g, idx_b):
+    """
+    在打包布局 (rgba / blocked / rgba16) 的表上做四面体插值，供融合核函数使用
+
+    idx_* 为已钳位到 [0, size-1] 的网格坐标；code 为 LAYOUT_CODES 中的编号，
+    table_f32 / table_u16 中只有与布局对应的一个是真实数据
+    """
+    size_minus_1 = size - 1
+    x0, dx = _grid_coords(idx_r, size_minus_1)
+    y0, dy = _grid_coords(idx_g, size_minus_1)
+    z0, dz = _grid_coords(idx_b, size_minus_1)
+    w0, w1, w2, w3, ax, ay, az, bx, by, bz = tetrahedral_weights(dx, dy, dz)
+
+    if code == 2:
+        nb = (size + 3) // 4
+        p0 = _blocked_row(x0, y0, z0, nb)
+        p1 = _blocked_row(x0 + ax, y0 + ay, z0 + az, nb)
+        p2 = _blocked_row(x0 + bx, y0 + by, z0 + bz, nb)
+        p3 = _blocked_row(x0 + 1, y0 + 1, z0 + 1, nb)
+    else:
+        p0 = _rgba_row(x0, y0, z0, size)
+        p1 = _rgba_row(x0 + ax, y0 + ay, z0 + az, size)
+        p2 = _rgba_row(x0 + bx, y0 + by, z0 + bz, size)
+        p3 = _rgba_row(x0 + 1, y0 + 1, z0 + 1, size)
+
+    if code == 3:
+        r = (_half_to_float(table_u16[p0, 0], pow2) * w0 + _half_to_float(table_u16[p1, 0], pow2) * w1
+             + _half_to_float(table_u16[p2, 0], pow2) * w2 + _half_to_float(table_u16[p3, 0], pow2) * w3)
+        g = (_half_to_float(table_u16[p0, 1], pow2) * w0 + _half_to_float(table_u16[p1, 1], pow2) * w1
+             + _half_to_float(table_u16[p2, 1], pow2) * w2 + _half_to_float(table_u16[p3, 1], pow2) * w3)
+        b = (_half_to_float(table_u16[p0, 2], pow2) * w0 + _half_to_float(table_u16[p1, 2], pow2) * w1
+             + _half_to_float(table_u16[p2, 2], pow2) * w2 + _half_to_float(table_u16[p3, 2], pow2) * w3)
+        return r, g, b
+
+    r = table_f32[p0, 0] * w0 + table_f32[p1, 0] * w1 + table_f32[p2, 0] * w2 + table_f32[p3, 0] * w3
+    g = table_f32[p0, 1] * w0 + table_f32[p1, 1] * w1 + table_f32[p2, 1] * w2 + table_f32[p3, 1] * w3
+    b = table_f32[p0, 2] * w0 + table_f32[p1, 2] * w1 + table_f32[p2, 2] * w2 + table_f32[p3, 2] * w3
+    return r, g, b
+
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def apply_lut_rgba_inplace(img, table, size, domain_min, domain_max):
+    """rgba 布局的原位四面体插值"""
+    flat_img = img.reshape(-1, 3)
+    size_minus_1 = size - 1
+    size_float = float(size_minus_1)
+    scale_r = size_minus_1 / (domain_max[0] - domain_min[0])
+    scale_g = size_minus_1 / (domain_max[1] - domain_min[1])
+    scale_b = size_minus_1 / (domain_max[2] - domain_min[2])
+
+    for i in prange(flat_img.shape[0]):
+        x0, dx = _grid_coords(min(max((flat_img[i, 0] - domain_min[0]) * scale_r, 0.0), size_float), size_minus_1)
+        y0, dy = _grid_coords(min(max((flat_img[i, 1] - domain_min[1]) * scale_g, 0.0), size_float), size_minus_1)
+        z0, dz = _grid_coords(min(max((flat_img[i, 2] - domain_min[2]) * scale_b, 0.0), size_float), size_minus_1)
+        w0, w1, w2, w3, ax, ay, az, bx, by, bz = tetrahedral_weights(dx, dy, dz)
+
+        p0 = _rgba_row(x0, y0, z0, size)
+        p1 = _rgba_row(x0 + ax, y0 + ay, z0 + az, size)
+        p2 = _rgba_row(x0 + bx, y0 + by, z0 + bz, size)
+        p3 = _rgba_row(x0 + 1, y0 + 1, z0 + 1, size)
+        for c in range(3):
+            flat_img[i, c] = table[p0, c] * w0 + table[p1, c] * w1 + table[p2, c] * w2 + table[p3, c] * w3
+
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def apply_lut_blocked_inplace(img, table, size, domain_min, domain_max):
+    """blocked (砖块 + Morton) 布局的原位四面体插值"""
+    flat_img = img.reshape(-1, 3)
+    nb = (size + 3) // 4
+    size_minus_1 = size - 1
+    size_float = float(size_minus_1)
+    scale_r = size_minus_1 / (domain_max[0] - domain_min[0])
+    scale_g = size_minus_1 / (domain_max[1] - domain_min[1])
+    scale_b = size_minus_1 / (domain_max[2] - domain_min[2])
+
+    for i in prange(flat_img.shape[0]):
+        x0, dx = _grid_coords(min(max((flat_img[i, 0] - domain_min[0]) * scale_r, 0.0), size_float), size_minus_1)
+        y0, dy = _grid_coords(min(max((flat_img[i, 1] - domain_min[1]) * scale_g, 0.0), size_float), size_minus_1)
+        z0, dz = _grid_coords(min(max((flat_img[i, 2] - domain_min[2]) * scale_b, 0.0), size_float), size_minus_1)
+        w0, w1, w2, w3, ax, ay, az, bx, by, bz = tetrahedral_weights(dx, dy, dz)
+
+        p0 = _blocked_row(x0, y0, z0, nb)
+        p1 = _blocked_row(x0 + ax, y0 + ay, z0 + az, nb)
+        p2 = _blocked_row(x0 + bx, y0 + by, z0 + bz, nb)
+        p3 = _blocked_row(x0 + 1, y0 + 1, z0 + 1, nb)
+        for c in range(3):
+            flat_img[i, c] = table[p0, c] * w0 + table[p1, c] * w1 + table[p2, c] * w2 + table[p3, c] * w3
+
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def apply_lut_rgba16_inplace(img, table, size, pow2, domain_min, domain_max):
+    """rgba16 (float16 位模式) 布局的原位四面体插值"""
+    flat_img = img.reshape(-1, 3)
+    size_minus_1 = size - 1
+    size_float = float(size_minus_1)
+    scale_r = size_minus_1 / (domain_max[0] - domain_min[0])
+    scale_g = size_minus_1 / (domain_max[1] - domain_min[1])
+    scale_b = size_minus_1 / (domain_max[2] - domain_min[2])
+
+    for i in prange(flat_img.shape[0]):
+        x0, dx = _grid_coords(min(max((flat_img[i, 0] - domain_min[0]) * scale_r, 0.0), size_float), size_minus_1)
+        y0, dy = _grid_coords(min(max((flat_img[i, 1] - domain_min[1]) * scale_g, 0.0), size_float), size_minus_1)
+        z0, dz = _grid_coords(min(max((flat_img[i, 2] - domain_min[2]) * scale_b, 0.0), size_float), size_minus_1)
+        w0, w1, w2, w3, ax, ay, az, bx, by, bz = tetrahedral_weights(dx, dy, dz)
+
+        p0 = _rgba_row(x0, y0, z0, size)
+        p1 = _rgba_row(x0 + ax, y0 + ay, z0 + az, size)
+        p2 = _rgba_row(x0 + bx, y0 + by, z0 + bz, size)
+        p3 = _rgba_row(x0 + 1, y0 + 1, z0 + 1, size)
+        for c in range(3):
+            flat_img[i, c] = (_half_to_float(table[p0, c], pow2) * w0 + _half_to_float(table[p1, c], pow2) * w1
+                              + _half_to_float(table[p2, c], pow2) * w2 + _half_to_float(table[p3, c], pow2) * w3)
+
+
+# ==========================================
+#              布局选择
+# ==========================================
+
+_choice_cache = {}
+_choice_lock = threading.Lock()
+
+
+def _benchmark_pixels(count: int = _BENCH_PIXELS) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.random((count, 1, 3), dtype=np.float32)
+
+
+def benchmark_layouts(size: int, layouts=AUTO_LAYOUT_CANDIDATES, repeat: int = 2, pixels: Optional[np.ndarray] = None) -> dict:
+    """
+    用随机像素测量各布局在给定 LUT 尺寸下的耗时
+
+    Returns:
+        {布局名称: 每百万像素耗时 (秒)}
+    """
+    lut = np.random.default_rng(1).random((size, size, size, 3), dtype=np.float32)
+    domain = np.array([[0.0] * 3, [1.0] * 3])
+    if pixels is None:
+        pixels = _benchmark_pixels()
+    work = np.empty_like(pixels)
+
+    results = {}
+    for layout in layouts:
+        packed = pack_lut(lut, domain, layout)
+        np.copyto(work, pixels)
+        packed.apply_inplace(work)  # 预热 (numba 编译 / 缓存加载)
+        best = float('inf')
+        for _ in range(repeat):
+            np.copyto(work, pixels)
+            t0 = time.perf_counter()
+            packed.apply_inplace(work)
+            best = min(best, time.perf_counter() - t0)
+        results[layout] = best * 1e6 / pixels.shape[0]
+    return results
+
+
+def choose_layout(size: int) -> str:
+    """为给定 LUT 尺寸选择最快的布局 (每个进程每个尺寸只测一次)"""
+    with _choice_lock:
+        layout = _choice_cache.get(size)
+        if layout is None:
+            timings = benchmark_layouts(size)
+            layout = min(timings, key=timings.get)
+            _choice_cache[size] = layout
+        return layout
+
+
+def resolve_layout(layout: Optional[str], size: int) -> str:
+    """将 'auto' / None 解析为具体布局"""
+    if not layout or layout == LAYOUT_AUTO:
+        return choose_layout(size)
+    if layout not in LUT_LAYOUTS:
+        raise ValueError(f"Unknown LUT layout: {layout}")
+    return layout
@@ -0,0 +1,549 @@
+"""
+LUT 文件解析模块
+原生解析 .cube (Iridas / Resolve，含 1D、3D 和 shaper + 3D)、Autodesk .3dl 和 Cinespace .csp 文件。
+
+文件头 (关键字行，通常只有几行) 在 Python 中逐行读取，表数据部分交给 numba 核函数一次性扫描整个字节缓冲区，
+替代 colour.read_LUT 逐行 split + 转换的做法。解析结果直接是 float32 C 连续、按 [R, G, B] 索引的表，
+即 utils.apply_lut_inplace 所需的布局。其他格式或无法识别的文件回退到 colour.read_LUT。
+"""
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+import colour
+from numba import njit
+
+from raw_alchemy import utils, lut_layout
+
+KIND_1D = '1D'
+KIND_3X1D = '3x1D'
+KIND_3D = '3D'
+KIND_SEQUENCE = 'sequence'
+
+_COLOUR_CLASSES = {
+    KIND_1D: colour.LUT1D,
+    KIND_3X1D: colour.LUT3x1D,
+    KIND_3D: colour.LUT3D,
+}
+
+# 原生解析器支持的扩展名
+NATIVE_LUT_EXTENSIONS = ('.cube', '.3dl', '.csp')
+# 可以读取的全部扩展名 (其余格式由 colour 解析)
+SUPPORTED_LUT_EXTENSIONS = NATIVE_LUT_EXTENSIONS + ('.spi1d', '.spi3d')
+
+_UNIT_DOMAIN = np.array([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]])
+
+# 保护各 LoadedLUT 的布局视图字典 (同一个缓存实例可能被多个线程以不同布局同时使用)
+_pack_lock = threading.Lock()
+
+
+class LoadedLUT:
+    """
+    解析完成、可直接用于处理的 LUT
+
+    Attributes:
+        kind: '1D' / '3x1D' / '3D' / 'sequence'
+        table: float32 C 连续数组 (可能是只读内存映射)；'sequence' 时为 None
+        domain: float64 定义域数组。3D 为 (2, 3)，1D 为 (2,)，3x1D 为 (2, 3) 或
+                非均匀定义域 (N, 3) (表中每个采样点对应的输入值)
+        name: LUT 名称
+        parts: 'sequence' 时按应用顺序排列的子 LUT
+        packed: 3D LUT 的替代内存布局 (lut_layout.PackedLUT)，为 None 时使用原始 table；
+                创建后不再修改，其他布局由 pack() 返回的独立对象持有
+    """
+
+    def __init__(self, kind: str, table: Optional[np.ndarray], domain: Optional[np.ndarray],
+                 name: str = '', parts: Optional[List['LoadedLUT']] = None, colour_lut=None):
+        self.kind = kind
+        self.table = table
+        self.domain = domain
+        self.name = name
+        self.parts = parts or []
+        self.packed = None
+        self._colour_lut = colour_lut
+        self._layouts = {}
+
+    @property
+    def is_3d(self) -> bool:
+        return self.kind == KIND_3D
+
+    @property
+    def size(self) -> int:
+        return 0 if self.table is None else self.table.shape[0]
+
+    def to_colour(self):
+        """转换为 colour 的 LUT 对象 (用于 colour 自带的插值方法)，结果会被缓存"""
+        if self._colour_lut is None:
+            if self.kind == KIND_SEQUENCE:
+                self._colour_lut = colour.LUTSequence(*[part.to_colour() for part in self.parts])
+            else:
+                cls = _COLOUR_CLASSES[self.kind]
+                self._colour_lut = cls(np.array(self.table), name=self.name, domain=np.array(self.domain))
+        return self._colour_lut
+
+    def apply(self, img: np.ndarray) -> np.ndarray:
+        """使用 colour 的插值方法应用 LUT (返回新数组)"""
+        return self.to_colour().apply(img)
+
+    def pack(self, layout: Optional[str]) -> 'LoadedLUT':
+        """
+        获取 3D LUT 的指定内存布局 (见 lut_layout)，'auto' / None 时按微基准测试结果选择
+
+        不修改自身 (lut_cache 缓存的实例被多个线程共享)，而是返回共享原始表、带有该布局的 LoadedLUT，
+        每种布局只打包一次。非 3D LUT 或布局相同时返回自身。
+        """
+        if not self.is_3d:
+            return self
+        layout = lut_layout.resolve_layout(layout, self.size)
+        if layout == self.layout:
+            return self
+        with _pack_lock:
+            view = self._layouts.get(layout)
+            if view is None:
+                view = LoadedLUT(self.kind, self.table, self.domain, self.name, colour_lut=self._colour_lut)
+                if layout != lut_layout.LAYOUT_RGB:
+                    view.packed = lut_layout.pack_lut(self.table, self.domain, layout)
+                self._layouts[layout] = view
+        return view
+
+    @property
+    def layout(self) -> str:
+        return self.packed.layout if self.packed is not None else lut_layout.LAYOUT_RGB
+
+    @property
+    def is_irregular(self) -> bool:
+        """1D / 3x1D 是否为非均匀定义域"""
+        return self.kind != KIND_3D and self.domain is not None and self.domain.shape[0] != 2
+
+    def _table_2d(self) -> np.ndarray:
+        """1D 表转为 (N, 1)，3x1D 表保持 (N, 3)"""
+        return self.table.reshape(self.table.shape[0], -1)
+
+    def _domain_bounds(self):
+        """均匀定义域的 (min, max)，均为长度 3 的 float64 数组"""
+        domain = self.domain
+        if domain.ndim == 1:
+            domain = np.repeat(domain[:, None], 3, axis=1)
+        return np.ascontiguousarray(domain[0]), np.ascontiguousarray(domain[1])
+
+    def apply_inplace(self, img: np.ndarray) -> np.ndarray:
+        """
+        使用 numba 核函数原位应用 LUT (不分配整图大小的临时数组)
+
+        3D 使用四面体插值，1D / 3x1D 使用线性插值 + 端点线性外推 (与 colour 默认行为一致)，
+        shaper + 3D 的序列在同一遍中完成。
+
+        Args:
+            img: float32 图像 (H, W, 3)
+
+        Returns:
+            处理后的图像 (原地修改，返回以便链式调用)
+        """
+        if not img.flags['C_CONTIGUOUS']:
+            img = np.ascontiguousarray(img)
+        if img.dtype != np.float32:
+            img = img.astype(np.float32)
+
+        if self.kind == KIND_SEQUENCE:
+            parts = self.parts
+            if (len(parts) == 2 and parts[0].kind in (KIND_1D, KIND_3X1D)
+                    and not parts[0].is_irregular and parts[1].is_3d):
+                shaper, cube = parts
+                shaper_min, shaper_max = shaper._domain_bounds()
+                cube_min, cube_max = cube._domain_bounds()
+                utils.apply_shaper_lut3d_inplace(
+                    img, shaper._table_2d(), shaper_min, shaper_max, cube.table, cube_min, cube_max)
+            else:
+                for part in parts:
+                    img = part.apply_inplace(img)
+        elif self.packed is not None:
+            img = self.packed.apply_inplace(img)
+        elif self.kind == KIND_3D:
+            domain_min, domain_max = self._domain_bounds()
+            utils.apply_lut_inplace(img, self.table, domain_min, domain_max)
+        elif self.is_irregular:
+            utils.apply_lut1d_irregular_inplace(img, self.table, np.ascontiguousarray(self.domain))
+        else:
+            domain_min, domain_max = self._domain_bounds()
+            utils.apply_lut1d_inplace(img, self._table_2d(), domain_min, domain_max)
+        return img
+
+
+def from_colour_lut(lut) -> LoadedLUT:
+    """将 colour 的 LUT 对象转换为 LoadedLUT"""
+    if isinstance(lut, colour.LUTSequence):
+        parts = [from_colour_lut(item) for item in lut.sequence]
+        return LoadedLUT(KIND_SEQUENCE, None, None, getattr(lut, 'name', ''), parts=parts, colour_lut=lut)
+
+    if isinstance(lut, colour.LUT3D):
+        kind = KIND_3D
+    elif isinstance(lut, colour.LUT3x1D):
+        kind = KIND_3X1D
+    elif isinstance(lut, colour.LUT1D):
+        kind = KIND_1D
+    else:
+        raise ValueError(f"Unsupported LUT type: {type(lut).__name__}")
+
+    table = np.ascontiguousarray(lut.table, dtype=np.float32)
+    domain = np.ascontiguousarray(lut.domain, dtype=np.float64)
+    return LoadedLUT(kind, table, domain, lut.name)
+
+
+# ==========================================
+#              Numba 核函数
+# ==========================================
+
+@njit(cache=True, nogil=True)
+def parse_floats(buf, out):
+    """
+    从字节缓冲区中解析所有十进制数字写入 out
+
+    以字母开头的行 (关键字，如 TITLE / LUT8 / gamma) 和 '#' 注释会被整行跳过。
+
+    Returns:
+        找到的数字个数 (可能大于 out 的长度，调用方据此校验)
+    """
+    n = buf.shape[0]
+    cap = out.shape[0]
+    count = 0
+    i = 0
+    line_start = True
+    while i < n:
+        c = buf[i]
+        if c == 10 or c == 13:
+            line_start = True
+            i += 1
+            continue
+        if c == 32 or c == 9 or c == 44:
+            i += 1
+            continue
+        is_alpha = (65 <= c <= 90) or (97 <= c <= 122) or c == 95
+        if c == 35 or (line_start and is_alpha):
+            while i < n and buf[i] != 10:
+                i += 1
+            continue
+        line_start = False
+        if not ((48 <= c <= 57) or c == 45 or c == 43 or c == 46):
+            i += 1
+            continue
+
+        neg = c == 45
+        if c == 45 or c == 43:
+            i += 1
+        mant = 0
+        digits = 0
+        exp10 = 0
+        while i < n and 48 <= buf[i] <= 57:
+            if digits < 18:
+                mant = mant * 10 + (buf[i] - 48)
+                digits += 1
+            else:
+                exp10 += 1
+            i += 1
+        if i < n and buf[i] == 46:
+            i += 1
+            while i < n and 48 <= buf[i] <= 57:
+                if digits < 18:
+                    mant = mant * 10 + (buf[i] - 48)
+                    digits += 1
+                    exp10 -= 1
+                i += 1
+        if i < n and (buf[i] == 101 or buf[i] == 69):
+            i += 1
+            exp_neg = False
+            if i < n and (buf[i] == 45 or buf[i] == 43):
+                exp_neg = buf[i] == 45
+                i += 1
+            e = 0
+            while i < n and 48 <= buf[i] <= 57:
+                e = e * 10 + (buf[i] - 48)
+                i += 1
+            exp10 += -e if exp_neg else e
+
+        v = float(mant)
+        if exp10 < 0:
+            v = v / 10.0 ** (-exp10)
+        elif exp10 > 0:
+            v = v * 10.0 ** exp10
+        if count < cap:
+            out[count] = -v if neg else v
+        count += 1
+    return count
+
+
+def _parse_numbers(data: bytes, expected: int) -> np.ndarray:
+    """批量解析数据段，数量与预期不符时抛出 ValueError"""
+    out = np.empty(expected, dtype=np.float32)
+    count = parse_floats(np.frombuffer(data, dtype=np.uint8), out)
+    if count != expected:
+        raise ValueError(f"LUT data has {count} values, expected {expected}")
+    return out
+
+
+def _is_numeric_line(line: bytes) -> bool:
+    # 只看第一个词: '3DMESH' 之类以数字开头的关键字不算数据行
+    try:
+        float(line.split(None, 1)[0])
+    except ValueError:
+        return False
+    return True
+
+
+def _split_header(raw: bytes, stop=_is_numeric_line):
+    """
+    逐行读取文件头，直到第一个满足 stop 的行
+
+    Returns:
+        (header_lines, data_offset): 去除空白后的文件头行 (str) 和数据段起始偏移
+    """
+    header = []
+    pos = 0
+    length = len(raw)
+    while pos < length:
+        end = raw.find(b'\n', pos)
+        if end < 0:
+            end = length
+        line = raw[pos:end].strip()
+        if line and not line.startswith(b'#'):
+            if stop(line):
+                return header, pos
+            header.append(line.decode('utf-8', errors='replace'))
+        pos = end + 1
+    return header, length
+
+
+def _unquote(text: str) -> str:
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return text[1:-1]
+    return text
+
+
+def _title_from_path(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0].replace('_', ' ')
+
+
+# ==========================================
+#              各格式解析
+# ==========================================
+
+def _read_cube(path: str, raw: bytes) -> LoadedLUT:
+    """Iridas / Resolve .cube"""
+    header, offset = _split_header(raw)
+
+    title = _title_from_path(path)
+    size_1d = size_3d = 0
+    domain_min, domain_max = _UNIT_DOMAIN[0], _UNIT_DOMAIN[1]
+    range_1d = range_3d = None
+    for line in header:
+        tokens = line.split()
+        keyword = tokens[0]
+        if keyword == 'TITLE':
+            title = _unquote(line[len('TITLE'):])
+        elif keyword == 'LUT_1D_SIZE':
+            size_1d = int(tokens[1])
+        elif keyword == 'LUT_3D_SIZE':
+            size_3d = int(tokens[1])
+        elif keyword == 'DOMAIN_MIN':
+            domain_min = np.array(tokens[1:4], dtype=np.float64)
+        elif keyword == 'DOMAIN_MAX':
+            domain_max = np.array(tokens[1:4], dtype=np.float64)
+        elif keyword == 'LUT_1D_INPUT_RANGE':
+            range_1d = np.repeat(np.array(tokens[1:3], dtype=np.float64)[:, None], 3, axis=1)
+        elif keyword == 'LUT_3D_INPUT_RANGE':
+            range_3d = np.repeat(np.array(tokens[1:3], dtype=np.float64)[:, None], 3, axis=1)
+
+    if not size_1d and not size_3d:
+        raise ValueError("Missing LUT_1D_SIZE / LUT_3D_SIZE")
+
+    domain = np.vstack([domain_min, domain_max])
+    values = _parse_numbers(raw[offset:], (size_1d + size_3d ** 3) * 3).reshape(-1, 3)
+
+    shaper = None
+    if size_1d:
+        table_1d = np.ascontiguousarray(values[:size_1d])
+        shaper = LoadedLUT(KIND_3X1D, table_1d, range_1d if range_1d is not None else domain, title)
+        if not size_3d:
+            return shaper
+        shaper.name = f"{title} - Shaper"
+
+    # 数据中红色分量变化最快 (Fortran 顺序)，转为 [R, G, B] 索引
+    table_3d = np.ascontiguousarray(
+        values[size_1d:].reshape(size_3d, size_3d, size_3d, 3, order='F'))
+    cube = LoadedLUT(KIND_3D, table_3d, range_3d if range_3d is not None else domain, title)
+    if shaper is None:
+        return cube
+    cube.name = f"{title} - Cube"
+    return LoadedLUT(KIND_SEQUENCE, None, None, title, parts=[shaper, cube])
+
+
+def _bit_depth_max(value: float) -> float:
+    """按数据中的最大值推断整数位深 (与 OCIO 的做法一致)"""
+    for bits in (8, 10, 12, 14, 16):
+        if value <= 2 ** bits - 1:
+            return float(2 ** bits - 1)
+    return float(2 ** 32 - 1)
+
+
+def _read_3dl(path: str, raw: bytes) -> LoadedLUT:
+    """Autodesk .3dl (Flame / Lustre)"""
+    header, offset = _split_header(raw)
+
+    out_max = None
+    for line in header:
+        tokens = line.split()
+        # Lustre: 'Mesh <网格位数> <输出位深>'
+        if tokens[0].lower() == 'mesh' and len(tokens) >= 3:
+            out_max = float(2 ** int(tokens[2]) - 1)
+
+    # 第一行数字是 shaper (网格各点对应的输入码值)，其长度即网格尺寸
+    end = raw.find(b'\n', offset)
+    if end < 0:
+        raise ValueError("Missing 3DL data")
+    shaper = np.array(raw[offset:end].split(), dtype=np.float64)
+    size = shaper.shape[0]
+    if size < 2:
+        raise ValueError("Invalid 3DL shaper line")
+
+    values = _parse_numbers(raw[end + 1:], size ** 3 * 3)
+    in_max = _bit_depth_max(shaper.max())
+    if out_max is None:
+        out_max = _bit_depth_max(values.max())
+
+    # 数据中蓝色分量变化最快 (C 顺序)，直接对应 [R, G, B] 索引
+    table = np.ascontiguousarray(values.reshape(size, size, size, 3) / np.float32(out_max), dtype=np.float32)
+    title = _title_from_path(path)
+
+    grid = shaper / in_max
+    if np.allclose(grid, np.linspace(grid[0], grid[-1], size), atol=0.5 / in_max):
+        domain = np.array([[grid[0]] * 3, [grid[-1]] * 3])
+        return LoadedLUT(KIND_3D, table, domain, title)
+
+    # 非均匀网格: 用 3x1D shaper 把输入映射到均匀的网格坐标
+    shaper_lut = LoadedLUT(
+        KIND_3X1D,
+        np.ascontiguousarray(np.repeat(np.linspace(0.0, 1.0, size, dtype=np.float32)[:, None], 3, axis=1)),
+        np.ascontiguousarray(np.repeat(grid[:, None], 3, axis=1)),
+        f"{title} - Shaper",
+    )
+    cube = LoadedLUT(KIND_3D, table, _UNIT_DOMAIN.copy(), f"{title} - Cube")
+    return LoadedLUT(KIND_SEQUENCE, None, None, title, parts=[shaper_lut, cube])
+
+
+def _read_csp(path: str, raw: bytes) -> LoadedLUT:
+    """Cinespace .csp"""
+    lines = []
+    pos = 0
+    length = len(raw)
+    # 文件头: 类型、元数据、3 组 pre-LUT (每组 3 行) 和尺寸行
+    while pos < length and (len(lines) < 2 or not _csp_header_done(lines)):
+        end = raw.find(b'\n', pos)
+        if end < 0:
+            end = length
+        line = raw[pos:end].strip()
+        pos = end + 1
+        if line:
+            lines.append(line.decode('utf-8', errors='replace'))
+
+    if not lines or lines[0] != 'CSPLUTV100':
+        raise ValueError('"LUT" header is invalid!')
+    kind = lines[1]
+    if kind not in ('1D', '3D'):
+        raise ValueError('"LUT" type must be "1D" or "3D"!')
+    is_3d = kind == '3D'
+
+    title = ''
+    seek = 2
+    if lines[2] == 'BEGIN METADATA':
+        end_index = lines.index('END METADATA')
+        metadata = lines[3:end_index]
+        title = metadata[0] if metadata else ''
+        seek = end_index + 1
+
+    pre = []
+    for channel in range(3):
+        count = int(lines[seek + channel * 3])
+        pre_in = np.array(lines[seek + channel * 3 + 1].split(), dtype=np.float64)
+        pre_out = np.array(lines[seek + channel * 3 + 2].split(), dtype=np.float64)
+        if pre_in.shape[0] != count or pre_out.shape[0] != count:
+            raise ValueError("Invalid CSP pre-LUT")
+        pre.append((pre_in, pre_out))
+    if len({p[0].shape[0] for p in pre}) != 1:
+        # 各通道 pre-LUT 长度不同，交给 colour 处理
+        raise ValueError("Unequal CSP pre-LUT sizes")
+
+    sizes = [int(v) for v in lines[seek + 9].split()]
+    values = _parse_numbers(raw[pos:], int(np.prod(sizes)) * 3).reshape(-1, 3)
+
+    pre_in = np.stack([p[0] for p in pre], axis=1)
+    pre_out = np.stack([p[1] for p in pre], axis=1)
+    unity_pre = pre_in.shape[0] == 2 and np.array_equal(pre_out, _UNIT_DOMAIN)
+
+    if is_3d:
+        size = sizes[0]
+        table = np.ascontiguousarray(values.reshape(size, sizes[1], sizes[2], 3, order='F'))
+        if unity_pre:
+            return LoadedLUT(KIND_3D, table, pre_in, title)
+        shaper = LoadedLUT(KIND_3X1D, np.ascontiguousarray(pre_out, dtype=np.float32),
+                           np.ascontiguousarray(pre_in), f"{title} - Shaper")
+        cube = LoadedLUT(KIND_3D, table, _UNIT_DOMAIN.copy(), f"{title} - Cube")
+        return LoadedLUT(KIND_SEQUENCE, None, None, title, parts=[shaper, cube])
+
+    table = np.ascontiguousarray(values)
+    if unity_pre:
+        return LoadedLUT(KIND_3X1D, table, pre_in, title)
+    if table.shape == (2, 3):
+        # 2 点表只做线性缩放，直接并入 pre-LUT
+        pre_table = pre_out * (table[1] - table[0]) + table[0]
+        return LoadedLUT(KIND_3X1D, np.ascontiguousarray(pre_table, dtype=np.float32),
+                         np.ascontiguousarray(pre_in), title)
+    pre_lut = LoadedLUT(KIND_3X1D, np.ascontiguousarray(pre_out, dtype=np.float32),
+                        np.ascontiguousarray(pre_in), f"{title} - PreLUT")
+    main = LoadedLUT(KIND_3X1D, table, _UNIT_DOMAIN.copy(), f"{title} - Table")
+    return LoadedLUT(KIND_SEQUENCE, None, None, title, parts=[pre_lut, main])
+
+
+def _csp_header_done(lines) -> bool:
+    """CSP 文件头是否已读完 (读到尺寸行为止)"""
+    seek = 2
+    if lines[2:3] == ['BEGIN METADATA']:
+        if 'END METADATA' not in lines:
+            return False
+        seek = lines.index('END METADATA') + 1
+    return len(lines) >= seek + 10
+
+
+_NATIVE_READERS = {
+    '.cube': _read_cube,
+    '.3dl': _read_3dl,
+    '.csp': _read_csp,
+}
+
+
+# ==========================================
+#              对外接口
+# ==========================================
+
+def read_lut(path: str) -> LoadedLUT:
+    """
+    读取 LUT 文件
+
+    .cube / .3dl / .csp 使用原生解析器；其他格式，或原生解析器无法识别的 .cube / .csp 文件，
+    回退到 colour.read_LUT。
+
+    Raises:
+        OSError: 文件无法读取
+        ValueError: 文件格式无效
+    """
+    ext = os.path.splitext(path)[1].lower()
+    reader = _NATIVE_READERS.get(ext)
+    if reader is not None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            return reader(path, raw)
+        except (ValueError, IndexError) as e:
+            if ext == '.3dl':
+                raise ValueError(f"Invalid 3DL file: {e}") from e
+    return from_colour_lut(colour.read_LUT(path))
@@ -0,0 +1,166 @@
+"""
+增量批处理清单
+在输出目录中记录每个输出文件对应的输入身份 (大小、修改时间、可选的内容摘要) 和处理参数摘要，
+再次处理同一目录时只处理新增或变化的文件 (--force 强制全部重新处理)。
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional, Sequence, Tuple, Union
+
+from raw_alchemy.config import DEFAULT_LENS_INTERPOLATION
+from raw_alchemy.decode_cache import build_cache_params, hash_file_content
+from raw_alchemy.lut_layout import LAYOUT_RGBA16
+
+MANIFEST_FILENAME = '.raw_alchemy_manifest.json'
+
+# 清单格式版本，格式变化时递增即可让旧清单失效
+MANIFEST_FORMAT_VERSION = 1
+
+# 处理过程中定期写回清单的间隔 (秒)，中断后已完成的文件不必重做
+_SAVE_INTERVAL = 5.0
+
+
+def input_identity(raw_path: str, content_hash: bool = False) -> dict:
+    """输入文件的身份: 大小、修改时间，可选的内容摘要"""
+    st = os.stat(raw_path)
+    identity = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if content_hash:
+        identity['hash'] = hash_file_content(raw_path)
+    return identity
+
+
+def params_digest(log_space: str, lut_path: Union[str, Sequence[str], None], exposure: Optional[float],
+                  metering_mode: str, lens_correct: bool, custom_db_path: Optional[str], output_format: str,
+                  baked: bool = False, baked_size: Optional[int] = None,
+                  lut_stack_size: Optional[int] = None, lens_grid: int = 0,
+                  lens_interpolation: str = DEFAULT_LENS_INTERPOLATION, lut_layout: Optional[str] = None) -> str:
+    """
+    所有影响输出内容的处理参数的规范化摘要
+
+    LUT 按文件内容计算摘要 (改名或重新拷贝不会触发重新处理，内容变化则会)；
+    镜头参数与解码参数和解码缓存的键一致。
+    3D LUT 布局中只有 rgba16 (float16 表) 改变输出，其余布局 (包括 'auto' 的选择) 结果一致，
+    因此只在 rgba16 时写入键，原有清单保持有效。
+    """
+    if isinstance(lut_path, str):
+        lut_path = [lut_path]
+    payload = {
+        'version': MANIFEST_FORMAT_VERSION,
+        'decode': build_cache_params(lens_correct=lens_correct, custom_db_path=custom_db_path, lens_grid=lens_grid,
+                                     lens_interpolation=lens_interpolation),
+        'log_space': log_space,
+        'luts': [hash_file_content(path) for path in lut_path or []],
+        'lut_stack_size': lut_stack_size if lut_path and len(lut_path) > 1 else None,
+        'exposure': exposure,
+        'metering': metering_mode if exposure is None else None,
+        'lens_correct': bool(lens_correct),
+        'format': output_format.lower(),
+        'baked_size': baked_size if baked else None,
+    }
+    if lut_path and not baked and lut_layout == LAYOUT_RGBA16:
+        payload['lut_precision'] = 'float16'
+    text = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=20).hexdigest()
+
+
+class Manifest:
+    """
+    输出目录中的处理清单
+
+    每个条目以输入文件名为键，记录输入身份、参数摘要和输出文件名。
+    只有处理成功的文件才会记录，失败的文件下次仍会重新处理。
+    文件发现线程与处理循环可以同时访问。
+
+    分片处理时每个分片写入自己的清单文件 (多台机器共享输出目录时互不覆盖)，
+    读取时合并目录中的全部清单，改变分片数后已处理的文件仍会被跳过。
+
+    Args:
+        output_dir: 输出目录
+        shard: 分片 (i, n)，None 表示不分片
+    """
+
+    def __init__(self, output_dir: str, shard: Optional[Tuple[int, int]] = None):
+        name = MANIFEST_FILENAME
+        if shard is not None:
+            stem, ext = os.path.splitext(MANIFEST_FILENAME)
+            name = f"{stem}.shard-{shard[0]}-of-{shard[1]}{ext}"
+        self.path = os.path.join(output_dir, name)
+        self.output_dir = output_dir
+        self.entries = {}
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._lock = threading.RLock()
+        stem, ext = os.path.splitext(MANIFEST_FILENAME)
+        others = sorted(glob.glob(os.path.join(glob.escape(output_dir), f"{stem}*{ext}")))
+        # 自己的清单最后读取，优先于其他分片的记录
+        for path in [path for path in others if path != self.path] + [self.path]:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_FORMAT_VERSION:
+                    self.entries.update(data.get('files', {}))
+            except (OSError, ValueError, AttributeError):
+                pass
+
+    def is_current(self, name: str, raw_path: str, digest: str, output_name: str, content_hash: bool = False) -> bool:
+        """
+        判断输入文件是否已经以相同参数处理过且输出仍然存在
+
+        大小或修改时间变化时，如果启用了内容摘要且摘要未变 (例如同步工具只改了修改时间)，
+        仍视为未变化并更新记录的修改时间。
+        """
+        with self._lock:
+            return self._is_current(name, raw_path, digest, output_name, content_hash)
+
+    def _is_current(self, name, raw_path, digest, output_name, content_hash):
+        entry = self.entries.get(name)
+        if not entry or entry.get('params') != digest or entry.get('output') != output_name:
+            return False
+        if not os.path.exists(os.path.join(self.output_dir, output_name)):
+            return False
+        recorded = entry.get('input', {})
+        identity = input_identity(raw_path)
+        if identity['size'] == recorded.get('size') and identity['mtime_ns'] == recorded.get('mtime_ns'):
+            if content_hash and not recorded.get('hash'):
+                # 之前未记录摘要的条目补上，之后修改时间变化时才能按内容判断
+                recorded['hash'] = hash_file_content(raw_path)
+                self._dirty = True
+            return True
+        if not content_hash or not recorded.get('hash') or identity['size'] != recorded.get('size'):
+            return False
+        if hash_file_content(raw_path) != recorded['hash']:
+            return False
+        recorded['mtime_ns'] = identity['mtime_ns']
+        self._dirty = True
+        return True
+
+    def record(self, name: str, raw_path: str, digest: str, output_name: str, content_hash: bool = False):
+        """记录一个处理成功的文件 (定期写回磁盘)"""
+        try:
+            identity = input_identity(raw_path, content_hash)
+        except OSError:
+            return
+        with self._lock:
+            self.entries[name] = {'input': identity, 'params': digest, 'output': output_name}
+            self._dirty = True
+            if time.monotonic() - self._last_save >= _SAVE_INTERVAL:
+                self.save()
+
+    def save(self):
+        """原子地写回清单"""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = f"{self.path}.tmp-{os.getpid()}"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': MANIFEST_FORMAT_VERSION, 'files': self.entries}, f, indent=1, sort_keys=True)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError:
+                pass
+            self._last_save = time.monotonic()
@@ -1,12 +1,19 @@
 import os
+import time
 import concurrent.futures
-from raw_alchemy import core
+from raw_alchemy import core, discovery, job_store, lens_profiles, manifest, pipeline, scheduler, shards, topology, worker_pool
+from raw_alchemy.config import DEFAULT_BAKED_LUT_SIZE, DEFAULT_JOB_RETRIES, DEFAULT_LUT_LAYOUT, DEFAULT_LUT_STACK_SIZE
+from raw_alchemy.config import DEFAULT_LENS_GRID, DEFAULT_LENS_INTERPOLATION
+from raw_alchemy.lut_cache import get_lut
 
 # Supported RAW file extensions (lowercase)
 SUPPORTED_RAW_EXTENSIONS = [
     '.dng', '.cr2', '.cr3', '.nef', '.arw', '.rw2', '.raf', '.orf', '.pef', '.srw'
 ]
 
+# 文件发现仍在进行时，处理循环检查新文件的间隔 (秒)
+_DISCOVERY_POLL_INTERVAL = 0.5
+
 def process_path(
     input_path,
     output_path,
@@ -19,6 +26,35 @@ def process_path(
     jobs,
     logger_func, # A function to handle logging, e.g., print or queue.put
     output_format: str = 'tif',
+    cache_dir=None,
+    cache_size_gb=None,
+    baked=False,
+    baked_size=DEFAULT_BAKED_LUT_SIZE,
+    lut_layout=DEFAULT_LUT_LAYOUT,
+    lut_stack_size=DEFAULT_LUT_STACK_SIZE,
+    lens_grid=DEFAULT_LENS_GRID,
+    lens_interpolation=DEFAULT_LENS_INTERPOLATION,
+    max_memory_gb=None,
+    threads_per_job=None,
+    pin_cpus=False,
+    recalibrate=False,
+    engine='executor',
+    backend='processes',
+    force=False,
+    hash_inputs=False,
+    retries=DEFAULT_JOB_RETRIES,
+    priority=0,
+    batch_id=None,
+    job_store_path=None,
+    file_timeout=None,
+    max_tasks_per_worker=None,
+    max_worker_memory_gb=None,
+    recursive=False,
+    include=None,
+    exclude=None,
+    files_from=None,
+    shard=None,
+    shard_by='hash',
 ):
     """
     Orchestrates the processing of a single file or a directory of files.
@@ -51,50 +87,407 @@ def process_path(
             log_message(f"❌ Error: {error_msg}")
             raise ValueError(error_msg)
 
-        raw_files = []
-        for ext in SUPPORTED_RAW_EXTENSIONS:
-            raw_files.extend([f for f in os.listdir(input_path) if f.lower().endswith(ext)])
+        def output_name(filename):
+            # 递归处理时 filename 是相对输入目录的路径，输出按同样的子目录结构镜像
+            return f"{os.path.splitext(filename)[0]}{output_ext}"
 
-        if not raw_files:
-            log_message("⚠️ No supported RAW files found in the input directory.")
-            raise ValueError("No RAW files found.")
+        # 分片: 多台机器各自处理同一批次中互不重叠的子集 ("i/n"，按路径哈希或文件大小分配)
+        if shard is not None:
+            shard = shards.parse_shard(shard)
+            if shard_by not in shards.SHARD_BY:
+                raise ValueError(f"Unknown shard mode: {shard_by}")
+        started = time.time()
 
-        # 【关键修改 1】发送总文件数信号，通知 GUI 初始化进度条
-        count = len(raw_files)
-        log_message(f"🔍 Found {count} RAW files for parallel processing.")
-        send_signal({'total_files': count}) 
-        
-        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
-            futures = {
-                executor.submit(
-                    core.process_image,
-                    raw_path=os.path.join(input_path, filename),
-                    output_path=os.path.join(output_path, f"{os.path.splitext(filename)[0]}{output_ext}"),
-                    log_space=log_space,
-                    lut_path=lut_path,
-                    exposure=exposure,
-                    lens_correct=lens_correct,
-                    custom_db_path=custom_db_path,
-                    metering_mode=metering_mode,
-                    # Pass queue directly if it is one (for internal logging inside the worker)
-                    log_queue=logger_func if hasattr(logger_func, 'put') else None 
-                ): filename for filename in raw_files
+        processed = manifest.Manifest(output_path, shard)
+        try:
+            digest = manifest.params_digest(
+                log_space, lut_path, exposure, metering_mode, lens_correct, custom_db_path, output_format,
+                baked, baked_size, lut_stack_size, lens_grid, lens_interpolation, lut_layout)
+        except OSError as e:
+            log_message(f"⚠️ Could not hash processing parameters, incremental mode disabled: {e}")
+            digest = None
+
+        # 持久化任务队列: 记录每个文件的状态，崩溃后可以用 `raw-alchemy resume <batch-id>` 继续
+        store = job_store.open_store(job_store_path, logger=log_message)
+
+        budget = int(max_memory_gb * scheduler.GB) if max_memory_gb else scheduler.default_memory_budget()
+        budget_text = f"{budget / scheduler.GB:.2f} GB" if budget is not None else "unlimited"
+        max_attempts = 1 + retries
+        estimates = {}
+
+        profiles = lens_profiles.get_profile_cache(cache_dir, custom_db_path) if lens_correct else None
+
+        def estimate(filename):
+            # 按文件头估算峰值内存，在预算内准入 (--jobs 只是并发上限)
+            raw_path = os.path.join(input_path, filename)
+            width, height, raw_width, raw_height = scheduler.read_raw_dimensions(raw_path)
+            lens = lens_correct
+            if profiles is not None and profiles.entries:
+                # 已知 Lensfun 中没有配置的镜头不会做镜头校正，不计入校正阶段的内存
+                try:
+                    lens = not lens_profiles.is_known_missing(profiles.get(lens_profiles.read_lens_exif(raw_path)))
+                except Exception:
+                    pass
+            return scheduler.estimate_peak_memory(
+                width, height, raw_width, raw_height, lens_correct=lens, output_format=output_format,
+                lens_grid=lens_grid)
+
+        def prepare(filename):
+            """在发现线程中调用: 跳过未变化的文件，创建镜像的输出子目录，估算峰值内存"""
+            raw_path = os.path.join(input_path, filename)
+            try:
+                # 增量处理: 输入文件和处理参数都未变化、输出仍存在的文件直接跳过
+                if digest is not None and not force and processed.is_current(
+                        filename, raw_path, digest, output_name(filename), hash_inputs):
+                    return None
+                os.makedirs(os.path.dirname(os.path.join(output_path, output_name(filename))), exist_ok=True)
+                return filename, estimate(filename)
+            except OSError:
+                # 例如文件在发现后被删除: 照常排队，处理时报告错误
+                return filename, scheduler.WORKER_BASE_BYTES
+
+        def discover():
+            # 单次 os.scandir 遍历 (或读取文件列表)，在后台线程中边发现边交给处理循环
+            if files_from:
+                source = discovery.read_file_list(files_from, input_path, SUPPORTED_RAW_EXTENSIONS, include, exclude,
+                                                  logger=log_message)
+            else:
+                source = discovery.scan_directory(input_path, SUPPORTED_RAW_EXTENSIONS, recursive, include, exclude,
+                                                  skip_dirs=[output_path])
+            if shard is not None:
+                source = shards.select(source, shard, shard_by, input_path)
+            return source
+
+        def finish_batch():
+            """写回清单，输出批次统计，分片处理时写入本分片的汇总文件"""
+            processed.save()
+            if batch_id is not None:
+                summarize_batch(store, batch_id, log_message)
+            if shard is not None:
+                if batch_id is None:
+                    done, failures, remaining = [], [], 0
+                else:
+                    progress = store.progress(batch_id)
+                    done = store.names(batch_id, job_store.DONE)
+                    failures = store.failures(batch_id)
+                    remaining = progress[job_store.PENDING] + progress[job_store.RUNNING]
+                try:
+                    path = shards.write_summary(output_path, shard, shard_by, batch_id, started, done, failures,
+                                                finder.skipped if finder is not None else 0, remaining)
+                    log_message(f"🧩 Shard {shard[0]}/{shard[1]} summary: {path}")
+                except OSError as e:
+                    log_message(f"⚠️ Could not write the shard summary: {e}")
+            store.close()
+
+        finder = None
+        if batch_id is None:
+            finder = discovery.Discovery(discover(), prepare)
+            source = f"file list {'<stdin>' if files_from == '-' else files_from}" if files_from else input_path
+            log_message(f"🔍 Discovering RAW files in {source}{' (recursive)' if recursive and not files_from else ''}...")
+            if shard is not None:
+                log_message(f"🧩 Processing shard {shard[0]}/{shard[1]} (by {shard_by}).")
+        else:
+            batch_info = store.batch(batch_id)
+            if batch_info is None:
+                raise ValueError(f"Unknown batch: {batch_id}")
+            recovered = store.recover(batch_id)
+            if recovered:
+                log_message(f"♻️ Re-queued {recovered} interrupted job(s) of batch {batch_id}.")
+            if not batch_info['discovery_complete']:
+                if files_from == '-':
+                    log_message("⚠️ The batch was read from stdin and its discovery was interrupted; "
+                                "only the files registered before the interruption will be processed.")
+                    store.mark_discovery_complete(batch_id)
+                else:
+                    finder = discovery.Discovery(discover(), prepare)
+                    log_message("🔍 Continuing file discovery of the interrupted batch...")
+
+        # 预先解析 LUT 并写入磁盘缓存，工作进程直接以只读内存映射方式共享同一份表
+        # 自动布局在这里测一次，工作进程直接使用结果，不必各自重复微基准测试
+        # (与文件发现同时进行)
+        if lut_path:
+            try:
+                lut = get_lut(lut_path, cache_dir, layout=None if baked else lut_layout, stack_size=lut_stack_size)
+                if lut.is_3d and not baked:
+                    lut_layout = lut.layout
+                    log_message(f"🧊 LUT memory layout: {lut_layout}")
+            except Exception as e:
+                log_message(f"⚠️ Could not pre-load LUT: {e}")
+
+        warm_config = worker_pool.make_warm_config(
+            log_space, lut_path, lut_layout, lut_stack_size, cache_dir,
+            lens_correct, custom_db_path, baked, baked_size,
+        )
+
+        def register(items):
+            """将新发现的文件登记为任务，返回新任务名"""
+            for filename, peak in items:
+                estimates[filename] = peak
+            return store.add_jobs(
+                batch_id,
+                [(filename, os.path.join(input_path, filename), os.path.join(output_path, output_name(filename)))
+                 for filename, _ in items],
+                priority=priority, max_attempts=max_attempts,
+            )
+
+        discovery_open = finder is not None
+
+        def close_discovery():
+            nonlocal discovery_open
+            discovery_open = False
+            store.mark_discovery_complete(batch_id)
+            if finder.error is not None:
+                log_message(f"⚠️ File discovery stopped early: {finder.error}")
+            skipped = f", {finder.skipped} unchanged file(s) skipped (use --force to reprocess)" if finder.skipped else ""
+            log_message(f"🔍 Discovery finished: {finder.found} file(s) to process{skipped}.")
+
+        total = 0
+
+        def discovered(block=False, timeout=None):
+            """取出新发现的文件并登记，发现结束时标记批次"""
+            nonlocal total
+            if not discovery_open:
+                return []
+            added = register(finder.take(block, timeout))
+            if added:
+                total += len(added)
+                # 【关键修改 1】发送总文件数信号，通知 GUI 初始化 / 更新进度条
+                send_signal({'total_files': total})
+            if finder.finished:
+                close_discovery()
+            return added
+
+        if batch_id is None:
+            first = finder.take(block=True)
+            if not first:
+                if finder.error is not None:
+                    raise finder.error
+                if finder.skipped:
+                    send_signal({'total_files': 0})
+                    log_message(f"⏭️ Skipping {finder.skipped} unchanged file(s) (use --force to reprocess).")
+                    finish_batch()
+                    log_message("\n🎉 All files are up to date.")
+                    return
+                if shard is not None:
+                    # 文件很少时某个分片可能为空
+                    send_signal({'total_files': 0})
+                    log_message(f"🧩 No files in shard {shard[0]}/{shard[1]}.")
+                    finish_batch()
+                    return
+                log_message("⚠️ No supported RAW files found in the input directory.")
+                raise ValueError("No RAW files found.")
+            batch_params = {
+                'log_space': log_space, 'lut_path': lut_path, 'exposure': exposure, 'lens_correct': lens_correct,
+                'custom_db_path': custom_db_path, 'metering_mode': metering_mode, 'output_format': output_format,
+                'cache_dir': cache_dir, 'cache_size_gb': cache_size_gb, 'baked': baked, 'baked_size': baked_size,
+                'lut_layout': lut_layout, 'lut_stack_size': lut_stack_size, 'lens_grid': lens_grid,
+                'lens_interpolation': lens_interpolation, 'hash_inputs': hash_inputs,
+                'recursive': recursive, 'include': include, 'exclude': exclude, 'files_from': files_from,
+                'shard': f"{shard[0]}/{shard[1]}" if shard is not None else None, 'shard_by': shard_by,
             }
-            
-            for future in concurrent.futures.as_completed(futures):
-                filename = futures[future]
+            batch_id = store.create_batch(input_path, output_path, batch_params, priority=priority,
+                                          max_attempts=max_attempts, discovery_complete=False)
+            log_message(f"🗂️ Batch {batch_id}. Resume with: raw-alchemy resume {batch_id}")
+            pending = register(first)
+            if finder.finished:
+                close_discovery()
+        else:
+            pending = store.pending(batch_id)
+            for filename in pending:
                 try:
-                    future.result()  # Check for exceptions
-                except Exception as exc:
-                    log_msg = f"❌ Generated an exception: {exc}"
-                    if hasattr(logger_func, 'put'):
-                        logger_func.put({'id': filename, 'msg': log_msg})
+                    estimates[filename] = estimate(filename)
+                except OSError:
+                    estimates[filename] = scheduler.WORKER_BASE_BYTES
+            if not pending and finder is not None:
+                pending = discovered(block=True)
+            if not pending and not discovery_open:
+                send_signal({'total_files': 0})
+                finish_batch()
+                return
+
+        total = len(pending)
+        send_signal({'total_files': total})
+
+        def record_success(filename):
+            store.finish(batch_id, filename)
+            if digest is not None:
+                processed.record(filename, os.path.join(input_path, filename), digest, output_name(filename), hash_inputs)
+
+        def record_failure(filename, exc):
+            """记录失败，还有重试次数时重新排队并返回 True"""
+            retry, attempts, max_attempts = store.fail(batch_id, filename, exc)
+            if retry:
+                log_message(f"🔁 [{filename}] Attempt {attempts}/{max_attempts} failed ({exc}); re-queued.")
+            else:
+                report_failure(filename, exc)
+            return retry
+
+        def report_failure(filename, exc):
+            log_msg = f"❌ Generated an exception: {exc}"
+            if hasattr(logger_func, 'put'):
+                logger_func.put({'id': filename, 'msg': log_msg})
+            else:
+                log_message(f"[{filename}] {log_msg}")
+
+        # 单文件超时与工作进程回收 (需要进程后端)
+        limits = worker_pool.WorkerLimits(
+            file_timeout, max_tasks_per_worker,
+            int(max_worker_memory_gb * scheduler.GB) if max_worker_memory_gb else None,
+        )
+
+        if engine == 'staged':
+            if limits:
+                log_message("⚠️ Per-file timeouts and worker recycling need the executor engine; ignoring them.")
+            # 分阶段流水线: 读取 / 解码 / 计算 / 编码各自的线程池，在当前进程中重叠执行
+            workers = pipeline.default_stage_workers(topology.available_cpus())
+            largest = max((estimates[filename] for filename in pending), default=scheduler.WORKER_BASE_BYTES)
+            max_in_flight = sum(workers.values()) - workers['read_workers'] + 1
+            if budget is not None:
+                max_in_flight = max(1, min(max_in_flight, budget // largest))
+            log_message(f"🏭 [Pipeline] read×{workers['read_workers']} -> decode×{workers['decode_workers']} -> "
+                        f"compute×{workers['compute_workers']} -> encode×{workers['encode_workers']}, "
+                        f"up to {max_in_flight} image buffers in flight (budget {budget_text}).")
+            worker_pool.warm_up(warm_config)
+
+            def on_done(raw_path, exc):
+                filename = os.path.relpath(raw_path, input_path)
+                if exc is None:
+                    record_success(filename)
+                elif record_failure(filename, exc):
+                    retry.append(filename)
+                    return
+                send_signal({'status': 'done'})
+
+            staged = pipeline.StagedPipeline(
+                dict(warm_config, exposure=exposure, metering_mode=metering_mode, cache_size_gb=cache_size_gb,
+                     lens_grid=lens_grid, lens_interpolation=lens_interpolation),
+                max_in_flight=max_in_flight,
+                log_target=logger_func if hasattr(logger_func, 'put') else None,
+                on_done=on_done,
+                **workers,
+            )
+
+            def claimed(filenames):
+                for filename in filenames:
+                    if store.claim(batch_id, filename):
+                        yield os.path.join(input_path, filename), os.path.join(output_path, output_name(filename))
+                    else:
+                        # 已被同一批次的其他进程领取
+                        send_signal({'status': 'done'})
+
+            def stream(filenames):
+                # 在流水线的送料线程中运行: 先处理已登记的任务，再处理陆续发现的文件
+                yield from claimed(filenames)
+                while discovery_open:
+                    yield from claimed(discovered(block=True))
+
+            try:
+                retry = []
+                stats = staged.run(stream(pending))
+                # 失败后重新排队的文件在下一轮处理
+                while True:
+                    busy = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in stats['busy'].items())
+                    log_message(f"🏭 [Pipeline] {stats['files'] - stats['failed']}/{stats['files']} files in "
+                                f"{stats['seconds']:.1f}s ({stats['files'] / max(stats['seconds'], 1e-9) * 60:.1f} images/min); "
+                                f"stage busy time: {busy}.")
+                    if not retry:
+                        break
+                    todo, retry = retry, []
+                    stats = staged.run(claimed(todo))
+            finally:
+                finish_batch()
+            log_message("\n🎉 Batch processing complete.")
+            return
+
+        # 常驻进程池 (或共享状态的线程池): 工作者启动时预热一次，GUI 多次处理之间复用
+        # 进程数 × 每进程 numba 线程数 ('auto' 时使用校准结果)
+        topo = topology.resolve_topology(jobs, threads_per_job, pin_cpus, recalibrate, logger=log_message)
+        pool = worker_pool.get_worker_pool(topo, warm_config, logger=log_message, backend=backend, limits=limits)
+        topo = pool.topology
+        if isinstance(pool, worker_pool.SupervisedWorkerPool):
+            pool.take_stats()
+        log_message(f"🧮 [Scheduler] Memory budget {budget_text}, up to {topo.processes} concurrent jobs.")
+        admission = scheduler.MemoryScheduler(budget, topo.processes, logger=log_message)
+
+        def submit(filename):
+            return pool.submit(
+                warm_config,
+                raw_path=os.path.join(input_path, filename),
+                output_path=os.path.join(output_path, output_name(filename)),
+                log_space=log_space,
+                lut_path=lut_path,
+                exposure=exposure,
+                lens_correct=lens_correct,
+                custom_db_path=custom_db_path,
+                metering_mode=metering_mode,
+                cache_dir=cache_dir,
+                cache_size_gb=cache_size_gb,
+                baked=baked,
+                baked_size=baked_size,
+                lut_layout=lut_layout,
+                lut_stack_size=lut_stack_size,
+                lens_grid=lens_grid,
+                lens_interpolation=lens_interpolation,
+                # Pass queue directly if it is one (for internal logging inside the worker)
+                log_queue=logger_func if hasattr(logger_func, 'put') else None 
+            )
+
+        pending = list(pending)
+        futures = {}
+        try:
+            while True:
+                pending.extend(discovered())
+                if not (pending or futures or discovery_open):
+                    break
+
+                # 预算允许时持续放行，直到没有能放下的文件
+                filename = admission.next_admissible(pending, estimates)
+                while filename is not None:
+                    pending.remove(filename)
+                    if store.claim(batch_id, filename):
+                        if pool.broken:
+                            # 工作进程异常退出 (例如内存不足被系统终止) 后重建进程池
+                            pool = worker_pool.get_worker_pool(topo, warm_config, logger=log_message, backend=backend,
+                                                               limits=limits)
+                        admission.admit(filename, estimates[filename])
+                        futures[submit(filename)] = filename
+                    else:
+                        # 已被同一批次的其他进程领取
+                        send_signal({'status': 'done'})
+                    filename = admission.next_admissible(pending, estimates)
+
+                if not futures:
+                    # 没有正在处理的文件: 等待发现新文件
+                    pending.extend(discovered(block=True))
+                    continue
+
+                # 发现仍在进行时定期返回，及时放行新发现的文件
+                done, _ = concurrent.futures.wait(
+                    futures, timeout=_DISCOVERY_POLL_INTERVAL if discovery_open else None,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    filename = futures.pop(future)
+                    admission.release(filename)
+                    try:
+                        future.result()  # Check for exceptions
+                    except Exception as exc:
+                        if record_failure(filename, exc):
+                            pending.append(filename)
+                            continue
                     else:
-                        log_message(f"[{filename}] {log_msg}")
-                finally:
+                        record_success(filename)
                     # 【关键修改 2】无论成功还是失败，都发送完成信号，让进度条往前走
                     send_signal({'status': 'done'})
-        
+        finally:
+            finish_batch()
+
+        log_message(f"🧮 [Scheduler] Peak: {admission.peak_jobs} concurrent job(s), "
+                    f"{admission.peak_bytes / scheduler.GB:.2f} GB estimated.")
+        if isinstance(pool, worker_pool.SupervisedWorkerPool):
+            stats = pool.take_stats()
+            log_message(f"🩺 [Watchdog] {stats['timeouts']} timed out, {stats['crashes']} crashed, "
+                        f"{stats['recycled_tasks']} worker(s) recycled by file count, "
+                        f"{stats['recycled_rss']} by RSS; peak worker RSS {stats['peak_rss'] / scheduler.GB:.2f} GB.")
         log_message("\n🎉 Batch processing complete.")
 
     # ============================
@@ -121,10 +514,69 @@ def process_path(
                 lens_correct=lens_correct,
                 custom_db_path=custom_db_path,
                 metering_mode=metering_mode,
-                log_queue=logger_func if hasattr(logger_func, 'put') else None
+                log_queue=logger_func if hasattr(logger_func, 'put') else None,
+                cache_dir=cache_dir,
+                cache_size_gb=cache_size_gb,
+                baked=baked,
+                baked_size=baked_size,
+                lut_layout=lut_layout,
+                lut_stack_size=lut_stack_size,
+                lens_grid=lens_grid,
+                lens_interpolation=lens_interpolation,
             )
         finally:
             # 发送完成信号
             send_signal({'status': 'done'})
             
-        log_message("\n🎉 Single file processing complete.")
\ No newline at end of file
+        log_message("\n🎉 Single file processing complete.")
+
+
+def summarize_batch(store, batch_id, log_message):
+    """输出批次的任务状态统计"""
+    progress = store.progress(batch_id)
+    remaining = progress[job_store.PENDING] + progress[job_store.RUNNING]
+    log_message(f"🗂️ Batch {batch_id}: {progress[job_store.DONE]} done, {progress[job_store.FAILED]} failed, "
+                f"{remaining} remaining.")
+    if progress[job_store.FAILED]:
+        log_message(f"   Retry the failed files with: raw-alchemy resume {batch_id} --retry-failed")
+
+
+def resume_batch(batch_id, logger_func, jobs=4, job_store_path=None, retry_failed=False,
+                 retries=DEFAULT_JOB_RETRIES, **options):
+    """
+    继续一个中断的批处理，处理参数从任务数据库中读取
+
+    Args:
+        batch_id: 批次 ID (批处理开始时输出)
+        logger_func: 同 process_path
+        jobs: 同 process_path
+        job_store_path: 任务数据库路径，None 时使用默认位置
+        retry_failed: 是否将已失败的任务重新排队
+        retries: 重新排队的失败任务可以再重试的次数
+        **options: process_path 的执行参数 (engine、backend、max_memory_gb 等)
+
+    Raises:
+        ValueError: 批次不存在
+    """
+    log_message = logger_func.put if hasattr(logger_func, 'put') else logger_func
+    store = job_store.open_store(job_store_path, logger=log_message)
+    try:
+        batch = store.batch(batch_id)
+        if batch is None:
+            raise ValueError(f"Unknown batch: {batch_id}")
+        if retry_failed:
+            count = store.retry_failed(batch_id, retries)
+            log_message(f"🔁 Re-queued {count} failed job(s).")
+    finally:
+        store.close()
+    log_message(f"▶️ Resuming batch {batch_id}: {batch['input_path']} -> {batch['output_path']}")
+    process_path(
+        input_path=batch['input_path'],
+        output_path=batch['output_path'],
+        jobs=jobs,
+        logger_func=logger_func,
+        batch_id=batch_id,
+        job_store_path=job_store_path,
+        **batch['params'],
+        **options,
+    )
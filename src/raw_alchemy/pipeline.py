@@ -0,0 +1,220 @@
+"""
+分阶段流水线批处理引擎
+将每张图片的处理拆成 读取 -> 解码 -> 计算 -> 编码/写入 四个阶段，每个阶段有独立的线程池，
+阶段之间用有界队列连接。TIFF zlib 压缩 / HEIF 编码、LibRaw 解码和文件读取都在 C 代码中释放 GIL，
+因此一张图片在编码时，下一张可以同时解码、再下一张可以同时进行 numba 计算。
+
+背压: 解码前需要获得一个缓冲区名额，编码写入完成后才归还，
+同时存在的整图缓冲区数量不超过 max_in_flight；读取阶段的预读数量受队列长度限制。
+"""
+import io
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Optional, Tuple
+
+from raw_alchemy import core, utils
+from raw_alchemy.file_io import save_image
+from raw_alchemy.logger import create_logger
+
+# 阶段之间的队列长度 (预读的压缩 RAW 数据也受此限制)
+DEFAULT_QUEUE_SIZE = 2
+
+_SENTINEL = None
+
+
+class _Item:
+    """流经各阶段的单个文件"""
+
+    def __init__(self, raw_path: str, output_path: str, logger):
+        self.raw_path = raw_path
+        self.output_path = output_path
+        self.filename = os.path.basename(raw_path)
+        self.logger = logger
+        self.data = None
+        self.frame = None
+        self.img = None
+        self.error = None
+        self.holds_buffer = False
+
+
+class _Stage:
+    """一个阶段: 若干工作线程从输入队列取任务，处理后放入输出队列"""
+
+    def __init__(self, name: str, fn: Callable, workers: int, inbox: queue.Queue, outbox: queue.Queue):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.busy_seconds = 0.0
+        self._remaining = self.workers
+        self._lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._loop, name=f"raw-alchemy-{name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+
+    def start(self, next_workers: int):
+        self._next_workers = next_workers
+        for thread in self.threads:
+            thread.start()
+
+    def _loop(self):
+        while True:
+            item = self.inbox.get()
+            if item is _SENTINEL:
+                break
+            if item.error is None:
+                start = time.perf_counter()
+                try:
+                    self.fn(item)
+                except Exception as e:
+                    item.error = e
+                    item.logger.error(f"  ❌ [{self.name}] {e}")
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.busy_seconds += elapsed
+            self.outbox.put(item)
+
+        # 最后一个退出的线程通知下一阶段的所有线程
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last:
+            for _ in range(self._next_workers):
+                self.outbox.put(_SENTINEL)
+
+
+class StagedPipeline:
+    """
+    分阶段流水线
+
+    Args:
+        params: core.develop_image 所需的处理参数 (与 core.process_image 的同名参数一致)
+        read_workers / decode_workers / compute_workers / encode_workers: 各阶段线程数
+        max_in_flight: 同时存在的整图缓冲区上限 (从开始解码到写入完成)
+        queue_size: 阶段之间的队列长度
+        log_target: 单个文件日志的输出目标 (None=print，或多进程队列)
+        on_done: 每个文件结束 (成功或失败) 时在收尾线程中调用，参数为 (输入路径, 异常或 None)
+    """
+
+    def __init__(self, params: dict, read_workers: int = 2, decode_workers: int = 2, compute_workers: int = 1,
+                 encode_workers: int = 2, max_in_flight: int = 4, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 log_target=None, on_done: Optional[Callable] = None):
+        self.params = params
+        self.worker_counts = (read_workers, decode_workers, compute_workers, encode_workers)
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue_size = max(1, queue_size)
+        self.log_target = log_target
+        self.on_done = on_done
+        self._buffers = threading.BoundedSemaphore(self.max_in_flight)
+        # workqueue 线程层不允许多个线程同时启动并行核函数，此时只串行化核函数调用本身
+        # (LibRaw 解码、Lensfun 坐标表生成、缓存写入等仍可与另一张图片的计算重叠)
+        self._kernels = None if utils.parallel_kernels_threadsafe() else threading.Lock()
+
+    # ---------------- 各阶段 ----------------
+
+    def _read(self, item: _Item):
+        item.logger.info(f"🧪 [Raw Alchemy] Processing: {item.raw_path}")
+        with open(item.raw_path, 'rb') as f:
+            item.data = io.BytesIO(f.read())
+
+    def _decode(self, item: _Item):
+        p = self.params
+        self._buffers.acquire()
+        item.holds_buffer = True
+        item.frame = core.decode_image(
+            item.raw_path, p['exposure'], p['lens_correct'], p['custom_db_path'], p['cache_dir'],
+            p['cache_size_gb'], item.logger, raw_source=item.data, lens_grid=p['lens_grid'],
+            lens_interpolation=p['lens_interpolation'], kernel_lock=self._kernels,
+        )
+        item.data = None
+
+    def _compute(self, item: _Item):
+        p = self.params
+        item.img = core.develop_image(
+            item.frame, p['log_space'], p['lut_path'], p['exposure'], p['lens_correct'], p['metering_mode'],
+            p['custom_db_path'], p['cache_dir'], p.get('fused', True), p['baked'], p['baked_size'],
+            p['lut_layout'], p['lut_stack_size'], item.logger, lens_grid=p['lens_grid'],
+            lens_interpolation=p['lens_interpolation'], kernel_lock=self._kernels,
+        )
+        item.frame = None
+
+    def _encode(self, item: _Item):
+        item.logger.info(f"  💾 Saving to {os.path.basename(item.output_path)}...")
+        if not save_image(item.img, item.output_path, item.logger):
+            raise RuntimeError(f"could not write {item.output_path}")
+
+    # ---------------- 运行 ----------------
+
+    def run(self, files: Iterable[Tuple[str, str]]) -> dict:
+        """
+        处理 (输入路径, 输出路径) 序列，阻塞直到全部完成
+
+        files 可以是生成器 (例如边发现边产出)，在单独的线程中逐个送入流水线。
+
+        Returns:
+            统计信息: 文件数、失败数、总耗时、各阶段累计忙碌时间
+        """
+        todo = queue.Queue()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(3)]
+        done = queue.Queue()
+        inboxes = [todo] + queues
+        outboxes = queues + [done]
+        stages = [
+            _Stage(name, fn, workers, inbox, outbox)
+            for name, fn, workers, inbox, outbox in zip(
+                ('read', 'decode', 'compute', 'encode'),
+                (self._read, self._decode, self._compute, self._encode),
+                self.worker_counts, inboxes, outboxes,
+            )
+        ]
+
+        start = time.perf_counter()
+        for i, stage in enumerate(stages):
+            stage.start(stages[i + 1].workers if i + 1 < len(stages) else 1)
+        fed = 0
+
+        def feed():
+            nonlocal fed
+            try:
+                for raw_path, output_path in files:
+                    todo.put(_Item(raw_path, output_path, create_logger(self.log_target, os.path.basename(raw_path))))
+                    fed += 1
+            finally:
+                for _ in range(stages[0].workers):
+                    todo.put(_SENTINEL)
+
+        feeder = threading.Thread(target=feed, name='raw-alchemy-feed', daemon=True)
+        feeder.start()
+
+        failed = 0
+        while True:
+            item = done.get()
+            if item is _SENTINEL:
+                break
+            # 收尾: 归还缓冲区名额并释放整图内存
+            if item.holds_buffer:
+                item.holds_buffer = False
+                self._buffers.release()
+            item.data = item.frame = item.img = None
+            if item.error is not None:
+                failed += 1
+            if self.on_done is not None:
+                self.on_done(item.raw_path, item.error)
+
+        feeder.join()
+        return {
+            'files': fed,
+            'failed': failed,
+            'seconds': time.perf_counter() - start,
+            'busy': {stage.name: stage.busy_seconds for stage in stages},
+        }
+
+
+def default_stage_workers(cpus: int) -> dict:
+    """根据 CPU 数确定各阶段线程数: 计算阶段单线程 (numba 核函数自身并行)，解码与编码随核心数增加"""
+    side = max(1, min(4, cpus // 4))
+    return {'read_workers': 2, 'decode_workers': side, 'compute_workers': 1, 'encode_workers': side}
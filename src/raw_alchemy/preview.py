@@ -13,7 +13,9 @@ matplotlib.use('TkAgg')
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 
-from raw_alchemy import utils, config
+from raw_alchemy import utils, config, log_curves
+from raw_alchemy.decode_cache import get_decode_cache, build_cache_params
+from raw_alchemy.lut_cache import get_lut
 from raw_alchemy.metering import apply_auto_exposure
 
 
@@ -141,6 +143,7 @@ class PreviewWindow:
         self.gui_app.log_space_var.trace_add("write", self.on_param_change)
         self.gui_app.lut_folder_var.trace_add("write", self.on_param_change)
         self.gui_app.lut_file_var.trace_add("write", self.on_param_change)
+        self.gui_app.lut_stack_var.trace_add("write", self.on_param_change)
         self.gui_app.exposure_mode_var.trace_add("write", self.on_param_change)
         self.gui_app.exposure_stops_var.trace_add("write", self.on_param_change)
         self.gui_app.metering_mode_var.trace_add("write", self.on_param_change)
@@ -195,43 +198,48 @@ class PreviewWindow:
         
         def load_thread():
             try:
-                with rawpy.imread(self.raw_path) as raw:
-                    # 提取EXIF
-                    self.exif_data = utils.extract_lens_exif(raw, logger=print)
-                    
-                    # 解码RAW - 使用半尺寸解码加快预览速度（速度提升约4倍）
-                    prophoto_linear = raw.postprocess(
-                        gamma=(1, 1),
-                        no_auto_bright=True,
-                        use_camera_wb=True,
-                        output_bps=16,
-                        output_color=rawpy.ColorSpace.ProPhoto,
-                        bright=1.0,
-                        highlight_mode=2,
-                        demosaic_algorithm=rawpy.DemosaicAlgorithm.AAHD,
-                        half_size=True,  # 半尺寸解码，分辨率减半但速度提升4倍
-                    )
-                    
-                    # 转为Float32
-                    img = prophoto_linear.astype(np.float32) / 65535.0
-                    
-                    # 缩小图像以加快预览（保持宽高比，最大边1600px）
-                    h, w = img.shape[:2]
-                    max_dim = 1600
-                    if max(h, w) > max_dim:
-                        scale = max_dim / max(h, w)
-                        new_h, new_w = int(h * scale), int(w * scale)
-                        # 使用简单的numpy缩放
-                        from scipy.ndimage import zoom
-                        img = zoom(img, (scale, scale, 1), order=1)
-                    
-                    self.prophoto_linear = img
-                    del prophoto_linear
-                    gc.collect()
-                    
-                    # 加载完成后刷新预览
-                    self.window.after(0, self.on_raw_loaded)
-                    
+                # 与主界面共用解码缓存 (半尺寸解码单独成条目)
+                cache = get_decode_cache(self.gui_app.cache_dir_var.get() or None)
+                cache_key = None
+                cached = None
+                if cache is not None:
+                    cache_key = cache.make_key(self.raw_path, build_cache_params(half_size=True))
+                    cached = cache.load(cache_key)
+
+                if cached is not None:
+                    img, _, meta = cached
+                    self.exif_data = meta.get('exif', {})
+                else:
+                    with rawpy.imread(self.raw_path) as raw:
+                        # 提取EXIF
+                        self.exif_data = utils.extract_lens_exif(raw, logger=print)
+                        
+                        # 解码RAW - 使用半尺寸解码加快预览速度（速度提升约4倍）
+                        prophoto_linear = utils.decode_raw(raw, half_size=True)
+                        
+                        # 转为Float32 (单次转换)
+                        img = utils.raw_to_float32(prophoto_linear)
+                        del prophoto_linear
+
+                    if cache is not None:
+                        cache.store(cache_key, img, {'exif': self.exif_data})
+
+                # 缩小图像以加快预览（保持宽高比，最大边1600px）
+                h, w = img.shape[:2]
+                max_dim = 1600
+                if max(h, w) > max_dim:
+                    scale = max_dim / max(h, w)
+                    new_h, new_w = int(h * scale), int(w * scale)
+                    # 使用简单的numpy缩放
+                    from scipy.ndimage import zoom
+                    img = zoom(img, (scale, scale, 1), order=1)
+                
+                self.prophoto_linear = img
+                gc.collect()
+                
+                # 加载完成后刷新预览
+                self.window.after(0, self.on_raw_loaded)
+                
             except Exception as e:
                 error_msg = str(e)
                 import traceback
@@ -327,7 +335,6 @@ class PreviewWindow:
                 # 4. Log转换
                 log_space = params['log_space']
                 log_color_space_name = config.LOG_TO_WORKING_SPACE.get(log_space)
-                log_curve_name = config.LOG_ENCODING_MAP.get(log_space, log_space)
                 
                 if log_color_space_name:
                     # Gamut变换
@@ -341,25 +348,16 @@ class PreviewWindow:
                         img = img.astype(np.float32)
                     utils.apply_matrix_inplace(img, M)
                     
-                    # Log编码
-                    np.maximum(img, 1e-6, out=img)
-                    img = colour.cctf_encoding(img, function=log_curve_name)
+                    # Log编码 (原生 numba 曲线，原位处理)
+                    img = log_curves.log_encode(img, log_space, floor=1e-6)
                 
                 # 5. 应用LUT
                 lut_path = params['lut_path']
                 if lut_path:
                     try:
-                        lut = colour.read_LUT(lut_path)
-                        if isinstance(lut, colour.LUT3D):
-                            if not img.flags['C_CONTIGUOUS']:
-                                img = np.ascontiguousarray(img)
-                            if img.dtype != np.float32:
-                                img = img.astype(np.float32)
-                            if lut.table.dtype != np.float32:
-                                lut.table = lut.table.astype(np.float32)
-                            utils.apply_lut_inplace(img, lut.table, lut.domain[0], lut.domain[1])
-                        else:
-                            img = lut.apply(img)
+                        # 解析结果按文件缓存，拖动滑块时不会重复解析
+                        lut = get_lut(lut_path, self.gui_app.cache_dir_var.get() or None, layout=config.DEFAULT_LUT_LAYOUT)
+                        img = lut.apply_inplace(img)
                     except Exception as e:
                         print(f"LUT应用错误: {e}")
                 
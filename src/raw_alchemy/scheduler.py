@@ -0,0 +1,204 @@
+"""
+内存感知的批处理调度
+根据 RAW 文件头中的尺寸和启用的处理阶段估算每张图片的峰值内存，
+在内存预算内决定同时处理多少张图片 (--jobs 只作为并发上限)。
+大尺寸文件自动降低并发，小尺寸文件可以更宽地并行。
+"""
+import ctypes
+import os
+import sys
+from typing import Iterable, Optional
+
+import rawpy
+
+from raw_alchemy import lens_maps
+from raw_alchemy.config import DEFAULT_MEMORY_BUDGET_FRACTION
+
+GB = 1024 ** 3
+
+# 每个工作进程与图片大小无关的常驻开销 (解释器、numpy/colour/numba、LUT 等)
+WORKER_BASE_BYTES = 300 * 1024 ** 2
+
+# 无法读取文件头时，按文件大小估算像素数 (压缩 RAW 约 1-2 字节/像素，取保守值)
+_BYTES_PER_PIXEL_FALLBACK = 1.0
+
+
+# ==========================================
+#                 内存估算
+# ==========================================
+
+def read_raw_dimensions(raw_path: str):
+    """
+    只读取文件头获得尺寸 (不解包传感器数据)
+
+    Returns:
+        (width, height, raw_width, raw_height)；无法识别时按文件大小估算
+    """
+    try:
+        raw = rawpy.RawPy()
+        try:
+            raw.open_file(raw_path)
+            sizes = raw.sizes
+            return sizes.width, sizes.height, sizes.raw_width, sizes.raw_height
+        finally:
+            raw.close()
+    except Exception:
+        pixels = int(os.path.getsize(raw_path) / _BYTES_PER_PIXEL_FALLBACK)
+        side = int(pixels ** 0.5)
+        return side, side, side, side
+
+
+def estimate_peak_memory(width: int, height: int, raw_width: int, raw_height: int,
+                         lens_correct: bool = True, output_format: str = 'tif', lens_grid: int = 0) -> int:
+    """
+    估算处理一张图片的峰值内存 (字节)
+
+    各阶段同时存活的主要缓冲区:
+    - 解码: LibRaw 传感器数据 (uint16) + 4 通道工作图像 (uint16) + postprocess 输出 (uint16 RGB) + float32 图像
+    - 镜头校正: float32 图像 + 坐标表 (3 通道 × 2 × float32) + 输出图像；
+      使用稀疏坐标网格 (lens_grid > 0) 时坐标表缩小为 1/lens_grid²
+    - 保存: float32 图像 + 编码用的整数图像及编码器缓冲
+
+    启用镜头校正时另加每个进程常驻的镜头校正表缓存上限 (lens_maps.LENS_MAP_CACHE_MAX_BYTES)。
+    """
+    pixels = width * height
+    float_image = pixels * 3 * 4
+    decode = raw_width * raw_height * 2 + pixels * 4 * 2 + pixels * 3 * 2 + float_image
+    if not lens_correct:
+        lens = 0
+    elif lens_grid > 1:
+        lens = float_image * 2 + pixels * 3 * 2 * 4 // (lens_grid * lens_grid)
+    else:
+        lens = float_image * 2 + pixels * 3 * 2 * 4
+    encode_bytes = 2 if output_format.lower() in ('tif', 'tiff') else 1
+    encode = float_image + pixels * 3 * encode_bytes * 2
+    resident = WORKER_BASE_BYTES + (lens_maps.LENS_MAP_CACHE_MAX_BYTES if lens_correct else 0)
+    return resident + max(decode, lens, encode)
+
+
+def available_memory() -> Optional[int]:
+    """当前可用物理内存 (字节)，无法获取时返回 None"""
+    try:
+        if sys.platform.startswith('linux'):
+            with open('/proc/meminfo', 'r') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        elif sys.platform == 'win32':
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [
+                    ('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                    ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                    ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                    ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                    ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+                ]
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return int(status.ullAvailPhys)
+        else:
+            return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None
+
+
+def current_rss() -> Optional[int]:
+    """当前进程的常驻内存 (字节)，无法获取时返回 None"""
+    try:
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        elif sys.platform == 'win32':
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t),
+                ]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return int(counters.WorkingSetSize)
+        else:
+            # 其他平台只能取得峰值 (macOS 上单位为字节)
+            import resource
+            return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    except (OSError, ValueError, AttributeError, ImportError):
+        pass
+    return None
+
+
+def default_memory_budget() -> Optional[int]:
+    """默认内存预算: 当前可用内存的固定比例"""
+    available = available_memory()
+    if available is None:
+        return None
+    return int(available * DEFAULT_MEMORY_BUDGET_FRACTION)
+
+
+# ==========================================
+#                 准入控制
+# ==========================================
+
+class MemoryScheduler:
+    """
+    按内存预算准入任务
+
+    任务按提交顺序优先，队首放不下时允许后面较小的文件先行 (first-fit)；
+    单个任务超出整个预算时，只在没有其他任务运行时单独放行，避免批处理卡死。
+    """
+
+    def __init__(self, budget: Optional[int], max_jobs: int, logger: callable = print):
+        self.budget = budget
+        self.max_jobs = max_jobs
+        self.logger = logger
+        self.in_flight = {}
+        self.peak_bytes = 0
+        self.peak_jobs = 0
+        self._waiting_logged = None
+
+    @property
+    def used(self) -> int:
+        return sum(self.in_flight.values())
+
+    def _fits(self, estimate: int) -> bool:
+        if self.budget is None:
+            return True
+        if not self.in_flight:
+            return True
+        return self.used + estimate <= self.budget
+
+    def next_admissible(self, pending: Iterable[str], estimates: dict) -> Optional[str]:
+        """返回下一个可以立即开始的任务，没有则返回 None"""
+        if len(self.in_flight) >= self.max_jobs:
+            return None
+        head = None
+        for name in pending:
+            if self._fits(estimates[name]):
+                return name
+            head = head or name
+        if head is not None and self._waiting_logged != head:
+            # 同一个队首任务只记录一次等待
+            self._waiting_logged = head
+            self.logger(f"⏳ [Scheduler] Holding {head}: needs {estimates[head] / GB:.2f} GB, "
+                        f"{self.used / GB:.2f}/{self.budget / GB:.2f} GB in use by {len(self.in_flight)} job(s).")
+        return None
+
+    def admit(self, name: str, estimate: int):
+        if self.budget is not None and estimate > self.budget:
+            self.logger(f"⚠️ [Scheduler] {name} needs {estimate / GB:.2f} GB, more than the "
+                        f"{self.budget / GB:.2f} GB budget; running it alone.")
+        self.in_flight[name] = estimate
+        self.peak_bytes = max(self.peak_bytes, self.used)
+        self.peak_jobs = max(self.peak_jobs, len(self.in_flight))
+        budget = f"{self.budget / GB:.2f} GB" if self.budget is not None else "unlimited"
+        self.logger(f"🧮 [Scheduler] Admit {name} (est. {estimate / GB:.2f} GB) -> "
+                    f"{len(self.in_flight)} running, {self.used / GB:.2f}/{budget}")
+
+    def release(self, name: str):
+        self.in_flight.pop(name, None)
@@ -0,0 +1,218 @@
+"""
+确定性分片
+多台机器 (共享 NFS 等存储) 各自处理同一批次中互不重叠的一个子集，不需要协调者:
+每台机器按相同的规则独立算出每个文件属于哪个分片。
+按相对路径的稳定哈希分片可以边发现边筛选；按文件大小分片需要先得到完整的文件列表，
+再按大小贪心均衡地分配到各分片。
+每个分片在输出目录中写入自己的汇总文件，`raw-alchemy merge` 将它们合并为一份。
+"""
+import glob
+import hashlib
+import heapq
+import json
+import os
+import socket
+import tempfile
+import time
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+SHARD_BY = ('hash', 'size')
+
+SUMMARY_FORMAT_VERSION = 1
+SUMMARY_PREFIX = '.raw_alchemy_shard-'
+MERGED_SUMMARY_FILENAME = 'raw_alchemy_summary.json'
+
+
+def parse_shard(spec: Union[str, Sequence[int]]) -> Tuple[int, int]:
+    """
+    解析分片参数
+
+    Args:
+        spec: "i/n" 字符串或 (i, n)，i 从 1 开始
+
+    Raises:
+        ValueError: 格式错误或 i 不在 1..n 之间
+    """
+    try:
+        if isinstance(spec, str):
+            index, count = (int(part) for part in spec.split('/'))
+        else:
+            index, count = (int(part) for part in spec)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid shard '{spec}': expected i/n, e.g. 1/4.")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}': i must be between 1 and n.")
+    return index, count
+
+
+def _key(rel_path: str) -> str:
+    # 统一使用 '/' 分隔，Windows 与 Linux 节点得到相同的分片
+    return rel_path.replace(os.sep, '/')
+
+
+def shard_of(rel_path: str, count: int) -> int:
+    """按相对路径的稳定哈希确定文件所属分片 (从 1 开始)，与进程、机器和文件顺序无关"""
+    digest = hashlib.blake2b(_key(rel_path).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count + 1
+
+
+def assign_by_size(rel_paths: Iterable[str], root: str, count: int) -> dict:
+    """
+    按文件大小均衡分配: 从大到小依次分给当前总大小最小的分片
+
+    所有节点看到相同的文件列表和大小时得到相同的分配结果。
+
+    Returns:
+        {相对路径: 分片 (从 1 开始)}
+    """
+    sized = []
+    for rel_path in rel_paths:
+        try:
+            size = os.path.getsize(os.path.join(root, rel_path))
+        except OSError:
+            size = 0
+        sized.append((-size, _key(rel_path), rel_path))
+    sized.sort()
+    loads = [(0, index) for index in range(1, count + 1)]
+    assignment = {}
+    for neg_size, _, rel_path in sized:
+        load, index = heapq.heappop(loads)
+        assignment[rel_path] = index
+        heapq.heappush(loads, (load - neg_size, index))
+    return assignment
+
+
+def select(source: Iterable[str], shard: Tuple[int, int], by: str = 'hash', root: str = '') -> Iterator[str]:
+    """
+    从文件序列中筛选出属于本分片的文件
+
+    Args:
+        source: 相对 root 的路径序列 (discovery.scan_directory / read_file_list)
+        shard: (i, n)
+        by: 'hash' 边发现边筛选；'size' 先读取完整列表再按大小均衡分配
+        root: 输入目录 (按大小分片时读取文件大小)
+    """
+    index, count = shard
+    if by == 'size':
+        rel_paths = list(source)
+        assignment = assign_by_size(rel_paths, root, count)
+        for rel_path in rel_paths:
+            if assignment[rel_path] == index:
+                yield rel_path
+    else:
+        for rel_path in source:
+            if shard_of(rel_path, count) == index:
+                yield rel_path
+
+
+def summary_path(output_dir: str, shard: Tuple[int, int]) -> str:
+    index, count = shard
+    return os.path.join(output_dir, f"{SUMMARY_PREFIX}{index}-of-{count}.json")
+
+
+def _write_json(path: str, data: dict):
+    """原子地写入 JSON (同一目录中的临时文件 + 替换)"""
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path), suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_summary(output_dir: str, shard: Tuple[int, int], by: str, batch_id: Optional[str], started: float,
+                  done: List[str], failures: List[Tuple[str, str]], skipped: int, remaining: int = 0) -> str:
+    """
+    写入本分片的汇总文件
+
+    Args:
+        done: 处理成功的文件
+        failures: (文件, 错误) 列表
+        skipped: 因未变化而跳过的文件数
+        remaining: 尚未处理的文件数 (批处理中断时)
+
+    Returns:
+        汇总文件路径
+    """
+    index, count = shard
+    path = summary_path(output_dir, shard)
+    _write_json(path, {
+        'version': SUMMARY_FORMAT_VERSION,
+        'shard': index,
+        'count': count,
+        'by': by,
+        'host': socket.gethostname(),
+        'batch_id': batch_id,
+        'started': started,
+        'finished': time.time(),
+        'done': sorted(done),
+        'failed': dict(failures),
+        'skipped': skipped,
+        'remaining': remaining,
+    })
+    return path
+
+
+def merge_summaries(output_dir: str, output_file: Optional[str] = None) -> dict:
+    """
+    合并输出目录中各分片的汇总文件
+
+    同一分片有多份汇总时 (例如换了节点重新运行) 使用最后完成的一份。
+
+    Args:
+        output_dir: 各分片共享的输出目录
+        output_file: 合并结果的路径，None 时写入 output_dir 中的 raw_alchemy_summary.json
+
+    Returns:
+        合并后的汇总 (含缺失的分片 missing_shards)
+
+    Raises:
+        ValueError: 没有汇总文件，或汇总来自不同的分片数
+    """
+    summaries = {}
+    for path in glob.glob(os.path.join(glob.escape(output_dir), f"{SUMMARY_PREFIX}*.json")):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(data, dict) or data.get('version') != SUMMARY_FORMAT_VERSION:
+            continue
+        key = (data['count'], data['shard'])
+        if key not in summaries or data['finished'] > summaries[key]['finished']:
+            summaries[key] = data
+    if not summaries:
+        raise ValueError(f"No shard summaries found in {output_dir}.")
+    counts = {count for count, _ in summaries}
+    if len(counts) > 1:
+        raise ValueError(f"Shard summaries in {output_dir} come from different shard counts: "
+                         f"{', '.join(str(count) for count in sorted(counts))}.")
+    count = counts.pop()
+    shards = [summaries[key] for key in sorted(summaries)]
+
+    done = sorted(name for data in shards for name in data['done'])
+    failed = {}
+    for data in shards:
+        failed.update(data['failed'])
+    merged = {
+        'version': SUMMARY_FORMAT_VERSION,
+        'count': count,
+        'shards': [
+            {key: data[key] for key in ('shard', 'by', 'host', 'batch_id', 'started', 'finished', 'skipped',
+                                        'remaining')}
+            for data in shards
+        ],
+        'missing_shards': [index for index in range(1, count + 1) if (count, index) not in summaries],
+        'done': done,
+        'failed': failed,
+        'skipped': sum(data['skipped'] for data in shards),
+        'remaining': sum(data['remaining'] for data in shards),
+    }
+    _write_json(output_file or os.path.join(output_dir, MERGED_SUMMARY_FILENAME), merged)
+    return merged
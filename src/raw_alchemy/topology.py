@@ -0,0 +1,231 @@
+"""
+批处理并发拓扑 (进程数 × 每进程 numba 线程数)
+每个工作进程中的 @njit(parallel=True) 核函数默认会使用全部核心，
+多个进程同时运行时线程数成倍超额订阅。这里为每个工作进程限制 numba 线程数，
+可选地将工作进程绑定到互不重叠的 CPU 集合，并支持 --jobs auto:
+在当前机器上做一次简短的校准，选出每分钟处理图片数最高的拆分方式并持久化保存。
+"""
+import json
+import os
+import platform
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from raw_alchemy.config import user_cache_dir
+
+# 校准使用的合成图像尺寸 (约 3 MP，只为比较不同拆分的相对吞吐)
+CALIBRATION_SHAPE = (1536, 2048, 3)
+
+# 每个候选拆分中每个进程处理的校准图像数
+CALIBRATION_IMAGES_PER_PROCESS = 2
+
+# 校准结果格式版本，格式变化时递增即可让旧结果失效
+PROFILE_FORMAT_VERSION = 1
+
+
+class Topology:
+    """批处理并发拓扑"""
+
+    def __init__(self, processes: int, threads: int, pin: bool = False):
+        self.processes = max(1, int(processes))
+        self.threads = max(1, int(threads))
+        self.pin = pin
+
+    @property
+    def key(self):
+        return self.processes, self.threads, self.pin
+
+    def cpu_sets(self) -> Optional[List[List[int]]]:
+        """绑定 CPU 时每个工作进程使用的 CPU 集合 (不支持或未启用时为 None)"""
+        if not self.pin or not hasattr(os, 'sched_setaffinity'):
+            return None
+        cpus = sorted(os.sched_getaffinity(0))
+        sets = []
+        for i in range(self.processes):
+            start = (i * self.threads) % len(cpus)
+            sets.append([cpus[(start + j) % len(cpus)] for j in range(min(self.threads, len(cpus)))])
+        return sets
+
+    def __repr__(self):
+        pinned = ", pinned" if self.pin else ""
+        return f"{self.processes} process(es) × {self.threads} thread(s){pinned}"
+
+
+def available_cpus() -> int:
+    """当前进程可用的 CPU 数 (考虑已有的亲和性限制)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# ==========================================
+#              工作进程配置
+# ==========================================
+
+def configure_worker(threads: int, cpu_sets: Optional[List[List[int]]], counter=None, index: Optional[int] = None):
+    """
+    工作进程初始化时调用: 限制 numba 线程数，按需绑定 CPU
+
+    Args:
+        threads: 每个工作进程的 numba 线程数
+        cpu_sets: Topology.cpu_sets() 的结果
+        counter: 进程间共享的 multiprocessing.Value，用于给工作进程分配 CPU 集合
+        index: 直接指定使用第几个 CPU 集合 (替换的工作进程沿用原来的集合)
+    """
+    import numba
+    numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+    if cpu_sets and (counter is not None or index is not None):
+        if index is None:
+            with counter.get_lock():
+                index = counter.value
+                counter.value += 1
+        try:
+            os.sched_setaffinity(0, cpu_sets[index % len(cpu_sets)])
+        except OSError:
+            pass
+
+
+# ==========================================
+#                 校准
+# ==========================================
+
+def candidate_topologies(cpus: int, pin: bool = False) -> List[Topology]:
+    """候选拆分: 进程数取 1, 2, 4, ... 直到 CPU 数，线程数平分 CPU"""
+    candidates = []
+    processes = 1
+    while processes <= cpus:
+        candidates.append(Topology(processes, cpus // processes, pin))
+        processes *= 2
+    if candidates[-1].processes != cpus:
+        candidates.append(Topology(cpus, 1, pin))
+    return candidates
+
+
+def _calibration_task(seed: int, output_dir: str) -> float:
+    """模拟一张图片: 解码后的类型转换、融合逐像素管线、TIFF 编码"""
+    from raw_alchemy import utils
+    from raw_alchemy.file_io import save_image
+    from raw_alchemy.fused_pipeline import apply_pointwise_pipeline
+    from raw_alchemy.logger import create_logger
+
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    decoded = rng.integers(0, 65535, size=CALIBRATION_SHAPE, dtype=np.uint16)
+    img = utils.raw_to_float32(decoded, 1.0)
+    img = apply_pointwise_pipeline(img, 1.0, 'S-Log3')
+    save_image(img, os.path.join(output_dir, f"calibration-{os.getpid()}-{seed}.tif"), create_logger(lambda message: None))
+    return time.perf_counter() - start
+
+
+def measure_throughput(topology: Topology, output_dir: str) -> float:
+    """以给定拓扑运行校准任务，返回每分钟处理的图片数"""
+    from raw_alchemy.worker_pool import WorkerPool
+
+    pool = WorkerPool(topology.processes, topology=topology)
+    try:
+        # 第一轮只用于启动进程和编译 / 加载核函数，不计时
+        for future in [pool.submit_call(_calibration_task, i, output_dir) for i in range(topology.processes)]:
+            future.result()
+        count = topology.processes * CALIBRATION_IMAGES_PER_PROCESS
+        start = time.perf_counter()
+        for future in [pool.submit_call(_calibration_task, i, output_dir) for i in range(count)]:
+            future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.shutdown()
+    return count / elapsed * 60.0
+
+
+def calibrate(cpus: Optional[int] = None, pin: bool = False, logger: callable = print) -> Topology:
+    """依次测量各候选拆分，返回吞吐最高的拓扑"""
+    cpus = cpus or available_cpus()
+    logger(f"⏱️ [Topology] Calibrating process × thread split on {cpus} CPU(s)...")
+    best, best_rate = None, 0.0
+    with tempfile.TemporaryDirectory(prefix='raw_alchemy_calibration_') as output_dir:
+        for topology in candidate_topologies(cpus, pin):
+            rate = measure_throughput(topology, output_dir)
+            logger(f"   {topology!r}: {rate:.1f} images/min")
+            if rate > best_rate:
+                best, best_rate = topology, rate
+    logger(f"⏱️ [Topology] Selected {best!r} ({best_rate:.1f} images/min).")
+    return best
+
+
+# ==========================================
+#               持久化与解析
+# ==========================================
+
+def default_profile_path() -> str:
+    """校准结果文件: 用户缓存目录下的 raw_alchemy/topology.json"""
+    return os.path.join(user_cache_dir(), 'topology.json')
+
+
+def _machine_key(cpus: int, pin: bool) -> str:
+    # CPU 型号、可用核心数或绑定方式变化后需要重新校准
+    return f"{platform.machine()}|{platform.processor() or platform.node()}|{cpus}|{'pin' if pin else 'nopin'}"
+
+
+def load_profile(cpus: int, pin: bool, path: Optional[str] = None) -> Optional[Topology]:
+    try:
+        with open(path or default_profile_path(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entry = data[_machine_key(cpus, pin)]
+        if entry.get('version') != PROFILE_FORMAT_VERSION:
+            return None
+        return Topology(entry['processes'], entry['threads'], pin)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_profile(topology: Topology, cpus: int, path: Optional[str] = None):
+    path = path or default_profile_path()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data[_machine_key(cpus, topology.pin)] = {
+        'version': PROFILE_FORMAT_VERSION,
+        'processes': topology.processes,
+        'threads': topology.threads,
+    }
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def resolve_topology(jobs, threads_per_job: Optional[int] = None, pin: bool = False,
+                     recalibrate: bool = False, logger: callable = print) -> Topology:
+    """
+    根据命令行参数确定拓扑
+
+    Args:
+        jobs: 进程数，或 'auto' (读取已保存的校准结果，没有时现场校准并保存)
+        threads_per_job: 每个进程的 numba 线程数，None 时平分可用 CPU
+        pin: 是否将工作进程绑定到互不重叠的 CPU 集合
+        recalibrate: 'auto' 时忽略已保存的结果重新校准
+        logger: 日志函数
+    """
+    cpus = available_cpus()
+    if str(jobs).lower() == 'auto':
+        topology = None if recalibrate else load_profile(cpus, pin)
+        if topology is not None:
+            logger(f"⏱️ [Topology] Using calibrated profile: {topology!r}.")
+        else:
+            topology = calibrate(cpus, pin, logger)
+            save_profile(topology, cpus)
+        if threads_per_job:
+            topology.threads = threads_per_job
+        return topology
+
+    processes = max(1, int(jobs))
+    threads = threads_per_job or max(1, cpus // processes)
+    return Topology(processes, threads, pin)
@@ -1,9 +1,10 @@
 import os
 import sys
-from typing import Optional
+from typing import Optional, Tuple
 import rawpy
 import numpy as np
 from raw_alchemy import lensfun_wrapper as lf
+import numba
 from numba import njit, prange
 
 
@@ -19,7 +20,19 @@ def resource_path(relative_path):
 # Numba 加速核函数 (In-Place / 无内存分配)
 # =========================================================
 
-@njit(parallel=True, fastmath=True, cache=True)
+def parallel_kernels_threadsafe() -> bool:
+    """
+    当前 numba 线程层是否允许多个 Python 线程同时启动并行核函数
+
+    tbb / omp 线程层支持并发启动；只有 workqueue 可用时，并发启动会直接终止进程，
+    调用方需要串行化核函数调用。
+    """
+    # 线程层在第一次启动并行核函数时才确定
+    apply_gain_inplace(np.zeros((1, 1, 3), dtype=np.float32), 1.0)
+    return numba.threading_layer() != 'workqueue'
+
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
 def apply_matrix_inplace(img, matrix):
     """
     高性能原位矩阵变换
@@ -51,7 +64,213 @@ def apply_matrix_inplace(img, matrix):
         flat_img[i, 1] = r * m10 + g * m11 + b * m12
         flat_img[i, 2] = r * m20 + g * m21 + b * m22
 
-@njit(parallel=True, fastmath=True, cache=True)
+@njit(fastmath=True, cache=True)
+def tetrahedral_sample(lut_table, idx_r, idx_g, idx_b, size_minus_1):
+    """
+    在 LUT 网格坐标 (已归一化并钳位到 [0, size-1]) 处做四面体插值，返回 (r, g, b)
+    供 apply_lut_inplace 及其他融合核函数共用
+    """
+    # --- A. 计算整数坐标 (x0) 和 小数部分 (d) ---
+    x0 = int(idx_r)
+    y0 = int(idx_g)
+    z0 = int(idx_b)
+
+    # 边界保护：确保 x1 不会越界
+    # 注意：如果 x0 已经是 size_minus_1，x1 应该保持 size_minus_1
+    x1 = x0 + 1
+    if x0 == size_minus_1: x1 = x0
+    
+    y1 = y0 + 1
+    if y0 == size_minus_1: y1 = y0
+    
+    z1 = z0 + 1
+    if z0 == size_minus_1: z1 = z0
+
+    # 计算权重 (Delta)
+    dx = idx_r - x0
+    dy = idx_g - y0
+    dz = idx_b - z0
+
+    # --- B. 四面体判定逻辑 (Tetrahedral Logic) ---
+    # 我们需要找到包围该点的 4 个顶点。
+    # P0 (x0, y0, z0) 和 P3 (x1, y1, z1) 总是存在的。
+    # 剩下的 P1 和 P2 取决于 dx, dy, dz 的大小关系。
+    
+    # 定义临时变量用于存储插值结果
+    r_val = 0.0
+    g_val = 0.0
+    b_val = 0.0
+
+    # 读取基础点 P0 (Base) 和 对角点 P3 (Opposite)
+    # 这样写虽然代码长，但比用数组存储 P1, P2 更快，因为直接操作寄存器
+    
+    # 优化技巧：我们在 if 分支里直接读取 LUT 并计算，避免不必要的内存读取
+    
+    if dx >= dy:
+        if dy >= dz:
+            # Case 1: dx >= dy >= dz
+            # P1=(1,0,0), P2=(1,1,0)
+            # Weights: (1-dx), (dx-dy), (dy-dz), dz
+            
+            # P0
+            w0 = 1.0 - dx
+            c_r = lut_table[x0, y0, z0, 0] * w0
+            c_g = lut_table[x0, y0, z0, 1] * w0
+            c_b = lut_table[x0, y0, z0, 2] * w0
+            
+            # P1 (x+1, y, z)
+            w1 = dx - dy
+            c_r += lut_table[x1, y0, z0, 0] * w1
+            c_g += lut_table[x1, y0, z0, 1] * w1
+            c_b += lut_table[x1, y0, z0, 2] * w1
+            
+            # P2 (x+1, y+1, z)
+            w2 = dy - dz
+            c_r += lut_table[x1, y1, z0, 0] * w2
+            c_g += lut_table[x1, y1, z0, 1] * w2
+            c_b += lut_table[x1, y1, z0, 2] * w2
+            
+            # P3 (x+1, y+1, z+1) -> Weight is dz
+            c_r += lut_table[x1, y1, z1, 0] * dz
+            c_g += lut_table[x1, y1, z1, 1] * dz
+            c_b += lut_table[x1, y1, z1, 2] * dz
+
+            r_val, g_val, b_val = c_r, c_g, c_b
+
+        elif dx >= dz:
+            # Case 2: dx >= dz > dy
+            # P1=(1,0,0), P2=(1,0,1)
+            # Weights: (1-dx), (dx-dz), (dz-dy), dy
+            
+            w0 = 1.0 - dx
+            c_r = lut_table[x0, y0, z0, 0] * w0
+            c_g = lut_table[x0, y0, z0, 1] * w0
+            c_b = lut_table[x0, y0, z0, 2] * w0
+            
+            w1 = dx - dz
+            c_r += lut_table[x1, y0, z0, 0] * w1
+            c_g += lut_table[x1, y0, z0, 1] * w1
+            c_b += lut_table[x1, y0, z0, 2] * w1
+            
+            w2 = dz - dy
+            c_r += lut_table[x1, y0, z1, 0] * w2
+            c_g += lut_table[x1, y0, z1, 1] * w2
+            c_b += lut_table[x1, y0, z1, 2] * w2
+            
+            c_r += lut_table[x1, y1, z1, 0] * dy
+            c_g += lut_table[x1, y1, z1, 1] * dy
+            c_b += lut_table[x1, y1, z1, 2] * dy
+            
+            r_val, g_val, b_val = c_r, c_g, c_b
+            
+        else:
+            # Case 3: dz > dx >= dy
+            # P1=(0,0,1), P2=(1,0,1)
+            # Weights: (1-dz), (dz-dx), (dx-dy), dy
+            
+            w0 = 1.0 - dz
+            c_r = lut_table[x0, y0, z0, 0] * w0
+            c_g = lut_table[x0, y0, z0, 1] * w0
+            c_b = lut_table[x0, y0, z0, 2] * w0
+            
+            w1 = dz - dx
+            c_r += lut_table[x0, y0, z1, 0] * w1
+            c_g += lut_table[x0, y0, z1, 1] * w1
+            c_b += lut_table[x0, y0, z1, 2] * w1
+            
+            w2 = dx - dy
+            c_r += lut_table[x1, y0, z1, 0] * w2
+            c_g += lut_table[x1, y0, z1, 1] * w2
+            c_b += lut_table[x1, y0, z1, 2] * w2
+            
+            c_r += lut_table[x1, y1, z1, 0] * dy
+            c_g += lut_table[x1, y1, z1, 1] * dy
+            c_b += lut_table[x1, y1, z1, 2] * dy
+
+            r_val, g_val, b_val = c_r, c_g, c_b
+
+    else: # dy > dx
+        if dz >= dy:
+            # Case 6: dz > dy > dx
+            # P1=(0,0,1), P2=(0,1,1)
+            # Weights: (1-dz), (dz-dy), (dy-dx), dx
+            
+            w0 = 1.0 - dz
+            c_r = lut_table[x0, y0, z0, 0] * w0
+            c_g = lut_table[x0, y0, z0, 1] * w0
+            c_b = lut_table[x0, y0, z0, 2] * w0
+            
+            w1 = dz - dy
+            c_r += lut_table[x0, y0, z1, 0] * w1
+            c_g += lut_table[x0, y0, z1, 1] * w1
+            c_b += lut_table[x0, y0, z1, 2] * w1
+            
+            w2 = dy - dx
+            c_r += lut_table[x0, y1, z1, 0] * w2
+            c_g += lut_table[x0, y1, z1, 1] * w2
+            c_b += lut_table[x0, y1, z1, 2] * w2
+            
+            c_r += lut_table[x1, y1, z1, 0] * dx
+            c_g += lut_table[x1, y1, z1, 1] * dx
+            c_b += lut_table[x1, y1, z1, 2] * dx
+            
+            r_val, g_val, b_val = c_r, c_g, c_b
+
+        elif dz >= dx:
+            # Case 5: dy >= dz > dx
+            # P1=(0,1,0), P2=(0,1,1)
+            # Weights: (1-dy), (dy-dz), (dz-dx), dx
+            
+            w0 = 1.0 - dy
+            c_r = lut_table[x0, y0, z0, 0] * w0
+            c_g = lut_table[x0, y0, z0, 1] * w0
+            c_b = lut_table[x0, y0, z0, 2] * w0
+            
+            w1 = dy - dz
+            c_r += lut_table[x0, y1, z0, 0] * w1
+            c_g += lut_table[x0, y1, z0, 1] * w1
+            c_b += lut_table[x0, y1, z0, 2] * w1
+            
+            w2 = dz - dx
+            c_r += lut_table[x0, y1, z1, 0] * w2
+            c_g += lut_table[x0, y1, z1, 1] * w2
+            c_b += lut_table[x0, y1, z1, 2] * w2
+            
+            c_r += lut_table[x1, y1, z1, 0] * dx
+            c_g += lut_table[x1, y1, z1, 1] * dx
+            c_b += lut_table[x1, y1, z1, 2] * dx
+            
+            r_val, g_val, b_val = c_r, c_g, c_b
+
+        else:
+            # Case 4: dy > dx >= dz
+            # P1=(0,1,0), P2=(1,1,0)
+            # Weights: (1-dy), (dy-dx), (dx-dz), dz
+            
+            w0 = 1.0 - dy
+            c_r = lut_table[x0, y0, z0, 0] * w0
+            c_g = lut_table[x0, y0, z0, 1] * w0
+            c_b = lut_table[x0, y0, z0, 2] * w0
+            
+            w1 = dy - dx
+            c_r += lut_table[x0, y1, z0, 0] * w1
+            c_g += lut_table[x0, y1, z0, 1] * w1
+            c_b += lut_table[x0, y1, z0, 2] * w1
+            
+            w2 = dx - dz
+            c_r += lut_table[x1, y1, z0, 0] * w2
+            c_g += lut_table[x1, y1, z0, 1] * w2
+            c_b += lut_table[x1, y1, z0, 2] * w2
+            
+            c_r += lut_table[x1, y1, z1, 0] * dz
+            c_g += lut_table[x1, y1, z1, 1] * dz
+            c_b += lut_table[x1, y1, z1, 2] * dz
+
+            r_val, g_val, b_val = c_r, c_g, c_b
+
+    return r_val, g_val, b_val
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
 def apply_lut_inplace(img, lut_table, domain_min, domain_max):
     """
     高性能原位四面体插值 (Tetrahedral Interpolation)
@@ -101,210 +320,117 @@ def apply_lut_inplace(img, lut_table, domain_min, domain_max):
         idx_g = min(max(raw_idx_g, 0.0), size_float)
         idx_b = min(max(raw_idx_b, 0.0), size_float)
 
-        # --- B. 计算整数坐标 (x0) 和 小数部分 (d) ---
-        x0 = int(idx_r)
-        y0 = int(idx_g)
-        z0 = int(idx_b)
+        # --- B. 四面体插值 ---
+        r_val, g_val, b_val = tetrahedral_sample(lut_table, idx_r, idx_g, idx_b, size_minus_1)
 
-        # 边界保护：确保 x1 不会越界
-        # 注意：如果 x0 已经是 size_minus_1，x1 应该保持 size_minus_1
-        x1 = x0 + 1
-        if x0 == size_minus_1: x1 = x0
-        
-        y1 = y0 + 1
-        if y0 == size_minus_1: y1 = y0
-        
-        z1 = z0 + 1
-        if z0 == size_minus_1: z1 = z0
-
-        # 计算权重 (Delta)
-        dx = idx_r - x0
-        dy = idx_g - y0
-        dz = idx_b - z0
-
-        # --- C. 四面体判定逻辑 (Tetrahedral Logic) ---
-        # 我们需要找到包围该点的 4 个顶点。
-        # P0 (x0, y0, z0) 和 P3 (x1, y1, z1) 总是存在的。
-        # 剩下的 P1 和 P2 取决于 dx, dy, dz 的大小关系。
-        
-        # 定义临时变量用于存储插值结果
-        r_val = 0.0
-        g_val = 0.0
-        b_val = 0.0
+        # 写入最终结果
+        flat_img[i, 0] = r_val
+        flat_img[i, 1] = g_val
+        flat_img[i, 2] = b_val
 
-        # 读取基础点 P0 (Base) 和 对角点 P3 (Opposite)
-        # 这样写虽然代码长，但比用数组存储 P1, P2 更快，因为直接操作寄存器
-        
-        # 优化技巧：我们在 if 分支里直接读取 LUT 并计算，避免不必要的内存读取
-        
-        if dx >= dy:
-            if dy >= dz:
-                # Case 1: dx >= dy >= dz
-                # P1=(1,0,0), P2=(1,1,0)
-                # Weights: (1-dx), (dx-dy), (dy-dz), dz
-                
-                # P0
-                w0 = 1.0 - dx
-                c_r = lut_table[x0, y0, z0, 0] * w0
-                c_g = lut_table[x0, y0, z0, 1] * w0
-                c_b = lut_table[x0, y0, z0, 2] * w0
-                
-                # P1 (x+1, y, z)
-                w1 = dx - dy
-                c_r += lut_table[x1, y0, z0, 0] * w1
-                c_g += lut_table[x1, y0, z0, 1] * w1
-                c_b += lut_table[x1, y0, z0, 2] * w1
-                
-                # P2 (x+1, y+1, z)
-                w2 = dy - dz
-                c_r += lut_table[x1, y1, z0, 0] * w2
-                c_g += lut_table[x1, y1, z0, 1] * w2
-                c_b += lut_table[x1, y1, z0, 2] * w2
-                
-                # P3 (x+1, y+1, z+1) -> Weight is dz
-                c_r += lut_table[x1, y1, z1, 0] * dz
-                c_g += lut_table[x1, y1, z1, 1] * dz
-                c_b += lut_table[x1, y1, z1, 2] * dz
+@njit(fastmath=True, cache=True)
+def lut1d_sample(table, channel, x, domain_min, scale, last_index):
+    """
+    在均匀 1D 表的某一列上线性插值，超出定义域时沿端点斜率线性外推 (与 colour 默认的 Extrapolator 一致)
+    """
+    t = (x - domain_min) * scale
+    if t <= 0.0:
+        idx = 0
+    elif t >= last_index - 1:
+        idx = last_index - 1
+    else:
+        idx = int(t)
+    y0 = table[idx, channel]
+    return y0 + (table[idx + 1, channel] - y0) * (t - idx)
 
-                r_val, g_val, b_val = c_r, c_g, c_b
+@njit(fastmath=True, cache=True)
+def lut1d_sample_irregular(table, samples, channel, x):
+    """
+    在非均匀 1D 表 (samples 为每个表项对应的输入值，单调递增) 上线性插值，两端线性外推
+    """
+    last_index = samples.shape[0] - 1
+    lo = 0
+    hi = last_index - 1
+    # 二分查找 samples[lo] <= x < samples[lo + 1]
+    while lo < hi:
+        mid = (lo + hi + 1) >> 1
+        if samples[mid, channel] <= x:
+            lo = mid
+        else:
+            hi = mid - 1
+    x0 = samples[lo, channel]
+    y0 = table[lo, channel]
+    return y0 + (table[lo + 1, channel] - y0) * (x - x0) / (samples[lo + 1, channel] - x0)
 
-            elif dx >= dz:
-                # Case 2: dx >= dz > dy
-                # P1=(1,0,0), P2=(1,0,1)
-                # Weights: (1-dx), (dx-dz), (dz-dy), dy
-                
-                w0 = 1.0 - dx
-                c_r = lut_table[x0, y0, z0, 0] * w0
-                c_g = lut_table[x0, y0, z0, 1] * w0
-                c_b = lut_table[x0, y0, z0, 2] * w0
-                
-                w1 = dx - dz
-                c_r += lut_table[x1, y0, z0, 0] * w1
-                c_g += lut_table[x1, y0, z0, 1] * w1
-                c_b += lut_table[x1, y0, z0, 2] * w1
-                
-                w2 = dz - dy
-                c_r += lut_table[x1, y0, z1, 0] * w2
-                c_g += lut_table[x1, y0, z1, 1] * w2
-                c_b += lut_table[x1, y0, z1, 2] * w2
-                
-                c_r += lut_table[x1, y1, z1, 0] * dy
-                c_g += lut_table[x1, y1, z1, 1] * dy
-                c_b += lut_table[x1, y1, z1, 2] * dy
-                
-                r_val, g_val, b_val = c_r, c_g, c_b
-                
-            else:
-                # Case 3: dz > dx >= dy
-                # P1=(0,0,1), P2=(1,0,1)
-                # Weights: (1-dz), (dz-dx), (dx-dy), dy
-                
-                w0 = 1.0 - dz
-                c_r = lut_table[x0, y0, z0, 0] * w0
-                c_g = lut_table[x0, y0, z0, 1] * w0
-                c_b = lut_table[x0, y0, z0, 2] * w0
-                
-                w1 = dz - dx
-                c_r += lut_table[x0, y0, z1, 0] * w1
-                c_g += lut_table[x0, y0, z1, 1] * w1
-                c_b += lut_table[x0, y0, z1, 2] * w1
-                
-                w2 = dx - dy
-                c_r += lut_table[x1, y0, z1, 0] * w2
-                c_g += lut_table[x1, y0, z1, 1] * w2
-                c_b += lut_table[x1, y0, z1, 2] * w2
-                
-                c_r += lut_table[x1, y1, z1, 0] * dy
-                c_g += lut_table[x1, y1, z1, 1] * dy
-                c_b += lut_table[x1, y1, z1, 2] * dy
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def apply_lut1d_inplace(img, table, domain_min, domain_max):
+    """
+    原位应用均匀 1D / 3x1D LUT
 
-                r_val, g_val, b_val = c_r, c_g, c_b
+    table 为 (N, 1) 时三个通道共用同一条曲线 (LUT1D)，为 (N, 3) 时逐通道查表 (LUT3x1D)
+    """
+    flat_img = img.reshape(-1, 3)
+    n_pixels = flat_img.shape[0]
 
-        else: # dy > dx
-            if dz >= dy:
-                # Case 6: dz > dy > dx
-                # P1=(0,0,1), P2=(0,1,1)
-                # Weights: (1-dz), (dz-dy), (dy-dx), dx
-                
-                w0 = 1.0 - dz
-                c_r = lut_table[x0, y0, z0, 0] * w0
-                c_g = lut_table[x0, y0, z0, 1] * w0
-                c_b = lut_table[x0, y0, z0, 2] * w0
-                
-                w1 = dz - dy
-                c_r += lut_table[x0, y0, z1, 0] * w1
-                c_g += lut_table[x0, y0, z1, 1] * w1
-                c_b += lut_table[x0, y0, z1, 2] * w1
-                
-                w2 = dy - dx
-                c_r += lut_table[x0, y1, z1, 0] * w2
-                c_g += lut_table[x0, y1, z1, 1] * w2
-                c_b += lut_table[x0, y1, z1, 2] * w2
-                
-                c_r += lut_table[x1, y1, z1, 0] * dx
-                c_g += lut_table[x1, y1, z1, 1] * dx
-                c_b += lut_table[x1, y1, z1, 2] * dx
-                
-                r_val, g_val, b_val = c_r, c_g, c_b
+    last_index = table.shape[0] - 1
+    c_g = 1 if table.shape[1] == 3 else 0
+    c_b = 2 if table.shape[1] == 3 else 0
+    scale_r = last_index / (domain_max[0] - domain_min[0])
+    scale_g = last_index / (domain_max[1] - domain_min[1])
+    scale_b = last_index / (domain_max[2] - domain_min[2])
+    min_r, min_g, min_b = domain_min[0], domain_min[1], domain_min[2]
 
-            elif dz >= dx:
-                # Case 5: dy >= dz > dx
-                # P1=(0,1,0), P2=(0,1,1)
-                # Weights: (1-dy), (dy-dz), (dz-dx), dx
-                
-                w0 = 1.0 - dy
-                c_r = lut_table[x0, y0, z0, 0] * w0
-                c_g = lut_table[x0, y0, z0, 1] * w0
-                c_b = lut_table[x0, y0, z0, 2] * w0
-                
-                w1 = dy - dz
-                c_r += lut_table[x0, y1, z0, 0] * w1
-                c_g += lut_table[x0, y1, z0, 1] * w1
-                c_b += lut_table[x0, y1, z0, 2] * w1
-                
-                w2 = dz - dx
-                c_r += lut_table[x0, y1, z1, 0] * w2
-                c_g += lut_table[x0, y1, z1, 1] * w2
-                c_b += lut_table[x0, y1, z1, 2] * w2
-                
-                c_r += lut_table[x1, y1, z1, 0] * dx
-                c_g += lut_table[x1, y1, z1, 1] * dx
-                c_b += lut_table[x1, y1, z1, 2] * dx
-                
-                r_val, g_val, b_val = c_r, c_g, c_b
+    for i in prange(n_pixels):
+        flat_img[i, 0] = lut1d_sample(table, 0, flat_img[i, 0], min_r, scale_r, last_index)
+        flat_img[i, 1] = lut1d_sample(table, c_g, flat_img[i, 1], min_g, scale_g, last_index)
+        flat_img[i, 2] = lut1d_sample(table, c_b, flat_img[i, 2], min_b, scale_b, last_index)
 
-            else:
-                # Case 4: dy > dx >= dz
-                # P1=(0,1,0), P2=(1,1,0)
-                # Weights: (1-dy), (dy-dx), (dx-dz), dz
-                
-                w0 = 1.0 - dy
-                c_r = lut_table[x0, y0, z0, 0] * w0
-                c_g = lut_table[x0, y0, z0, 1] * w0
-                c_b = lut_table[x0, y0, z0, 2] * w0
-                
-                w1 = dy - dx
-                c_r += lut_table[x0, y1, z0, 0] * w1
-                c_g += lut_table[x0, y1, z0, 1] * w1
-                c_b += lut_table[x0, y1, z0, 2] * w1
-                
-                w2 = dx - dz
-                c_r += lut_table[x1, y1, z0, 0] * w2
-                c_g += lut_table[x1, y1, z0, 1] * w2
-                c_b += lut_table[x1, y1, z0, 2] * w2
-                
-                c_r += lut_table[x1, y1, z1, 0] * dz
-                c_g += lut_table[x1, y1, z1, 1] * dz
-                c_b += lut_table[x1, y1, z1, 2] * dz
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def apply_lut1d_irregular_inplace(img, table, samples):
+    """原位应用非均匀定义域的 3x1D LUT (table 与 samples 均为 (N, 3))"""
+    flat_img = img.reshape(-1, 3)
+    for i in prange(flat_img.shape[0]):
+        flat_img[i, 0] = lut1d_sample_irregular(table, samples, 0, flat_img[i, 0])
+        flat_img[i, 1] = lut1d_sample_irregular(table, samples, 1, flat_img[i, 1])
+        flat_img[i, 2] = lut1d_sample_irregular(table, samples, 2, flat_img[i, 2])
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def apply_shaper_lut3d_inplace(img, shaper_table, shaper_min, shaper_max, lut_table, domain_min, domain_max):
+    """
+    单遍应用 shaper (均匀 1D / 3x1D) + 3D LUT，中间结果只存在于寄存器中
+    """
+    flat_img = img.reshape(-1, 3)
+    n_pixels = flat_img.shape[0]
 
-                r_val, g_val, b_val = c_r, c_g, c_b
+    last_index = shaper_table.shape[0] - 1
+    c_g = 1 if shaper_table.shape[1] == 3 else 0
+    c_b = 2 if shaper_table.shape[1] == 3 else 0
+    s_scale_r = last_index / (shaper_max[0] - shaper_min[0])
+    s_scale_g = last_index / (shaper_max[1] - shaper_min[1])
+    s_scale_b = last_index / (shaper_max[2] - shaper_min[2])
+
+    size_minus_1 = lut_table.shape[0] - 1
+    size_float = float(size_minus_1)
+    scale_r = size_minus_1 / (domain_max[0] - domain_min[0])
+    scale_g = size_minus_1 / (domain_max[1] - domain_min[1])
+    scale_b = size_minus_1 / (domain_max[2] - domain_min[2])
+    min_r, min_g, min_b = domain_min[0], domain_min[1], domain_min[2]
+
+    for i in prange(n_pixels):
+        r = lut1d_sample(shaper_table, 0, flat_img[i, 0], shaper_min[0], s_scale_r, last_index)
+        g = lut1d_sample(shaper_table, c_g, flat_img[i, 1], shaper_min[1], s_scale_g, last_index)
+        b = lut1d_sample(shaper_table, c_b, flat_img[i, 2], shaper_min[2], s_scale_b, last_index)
+
+        idx_r = min(max((r - min_r) * scale_r, 0.0), size_float)
+        idx_g = min(max((g - min_g) * scale_g, 0.0), size_float)
+        idx_b = min(max((b - min_b) * scale_b, 0.0), size_float)
+        r_val, g_val, b_val = tetrahedral_sample(lut_table, idx_r, idx_g, idx_b, size_minus_1)
 
-        # 写入最终结果
         flat_img[i, 0] = r_val
         flat_img[i, 1] = g_val
         flat_img[i, 2] = b_val
 
-@njit(parallel=True, fastmath=True)
+@njit(parallel=True, fastmath=True, nogil=True)
 def apply_saturation_contrast_inplace(img, saturation, contrast, pivot, luma_coeffs):
     """
     原位应用饱和度和对比度。
@@ -343,7 +469,7 @@ def apply_saturation_contrast_inplace(img, saturation, contrast, pivot, luma_coe
             img[r, c, 1] = g_fin
             img[r, c, 2] = b_fin
 
-@njit(parallel=True, fastmath=True)
+@njit(parallel=True, fastmath=True, nogil=True)
 def apply_gain_inplace(img, gain):
     """简单的原位增益，比 numpy 的 img *= gain 稍微快一点点，且绝对不分配内存"""
     rows, cols, _ = img.shape
@@ -353,7 +479,21 @@ def apply_gain_inplace(img, gain):
             img[r, c, 1] *= gain
             img[r, c, 2] *= gain
 
-@njit(parallel=True, fastmath=True, cache=True)
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def normalize_uint16_into(src, dst, gain):
+    """
+    16-bit 解码结果 -> float32 (0.0-1.0) 单次转换，可同时乘以曝光增益
+    写入预分配的 dst，替代 astype + 除法产生的两份整图临时数组
+    """
+    rows, cols, _ = src.shape
+    scale = np.float32(gain / 65535.0)
+    for r in prange(rows):
+        for c in range(cols):
+            dst[r, c, 0] = np.float32(src[r, c, 0]) * scale
+            dst[r, c, 1] = np.float32(src[r, c, 1]) * scale
+            dst[r, c, 2] = np.float32(src[r, c, 2]) * scale
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
 def bt709_to_srgb_inplace(img):
     """
     快速原位转换: BT.709 -> sRGB
@@ -389,6 +529,178 @@ def bt709_to_srgb_inplace(img):
                 
                 img[r, c, ch] = result
 
+# 镜头校正重采样的插值方式 (remap_* 的 method 参数)
+REMAP_METHODS = {'bilinear': 0, 'bicubic': 1, 'lanczos3': 2}
+
+@njit(fastmath=True, cache=True)
+def bilinear_sample(src, ch, x, y, rows, cols):
+    """双线性采样 src[:, :, ch] 在 (x, y) 处的值，图像外的像素视为 0"""
+    x0 = int(np.floor(x))
+    y0 = int(np.floor(y))
+    tx = x - x0
+    ty = y - y0
+    wx = (1.0 - tx, tx)
+    wy = (1.0 - ty, ty)
+    acc = 0.0
+    for j in range(2):
+        yy = y0 + j
+        if yy < 0 or yy >= rows:
+            continue
+        for i in range(2):
+            xx = x0 + i
+            if xx < 0 or xx >= cols:
+                continue
+            acc += wy[j] * wx[i] * src[yy, xx, ch]
+    return acc
+
+@njit(fastmath=True, cache=True)
+def cubic_weights(t):
+    """Catmull-Rom 权重 (a = -0.5)，对应偏移 -1, 0, 1, 2 的采样点"""
+    return (((-0.5 * t + 1.0) * t - 0.5) * t,
+            (1.5 * t - 2.5) * t * t + 1.0,
+            ((-1.5 * t + 2.0) * t + 0.5) * t,
+            (0.5 * t - 0.5) * t * t)
+
+@njit(fastmath=True, cache=True)
+def bicubic_sample(src, ch, x, y, rows, cols):
+    """
+    Catmull-Rom 双三次采样 src[:, :, ch] 在 (x, y) 处的值，图像外的像素视为 0
+    """
+    x0 = int(np.floor(x))
+    y0 = int(np.floor(y))
+    wx = cubic_weights(x - x0)
+    wy = cubic_weights(y - y0)
+    acc = 0.0
+    for j in range(4):
+        yy = y0 - 1 + j
+        if yy < 0 or yy >= rows:
+            continue
+        row_acc = 0.0
+        for i in range(4):
+            xx = x0 - 1 + i
+            if xx < 0 or xx >= cols:
+                continue
+            row_acc += wx[i] * src[yy, xx, ch]
+        acc += wy[j] * row_acc
+    return acc
+
+@njit(fastmath=True, cache=True)
+def lanczos3_weights(t):
+    """
+    Lanczos-3 权重 (归一化使和为 1)，对应偏移 -2 .. 3 的采样点 (距离 d = t + 2 .. t - 3)
+
+    L(d) = 3 sin(πd) sin(πd/3) / (πd)²。各采样点距离相差整数，
+    sin(πd) 只差符号，sin(πd/3) 由 sin/cos(πt/3) 按和角公式得到: 每轴只需 3 次三角函数。
+    """
+    if t < 1e-6:
+        return (0.0, 0.0, 1.0, 0.0, 0.0, 0.0)
+    s = 3.0 * np.sin(np.pi * t) / (np.pi * np.pi)
+    a = np.pi * t / 3.0
+    sa = 0.5 * np.sin(a)
+    ca = 0.8660254037844386 * np.cos(a)  # √3/2 · cos(πt/3)
+    d0 = t + 2.0
+    d1 = t + 1.0
+    d3 = t - 1.0
+    d4 = t - 2.0
+    d5 = t - 3.0
+    w0 = s * (ca - sa) / (d0 * d0)
+    w1 = -s * (sa + ca) / (d1 * d1)
+    w2 = s * 2.0 * sa / (t * t)
+    w3 = -s * (sa - ca) / (d3 * d3)
+    w4 = -s * (sa + ca) / (d4 * d4)
+    w5 = s * 2.0 * sa / (d5 * d5)
+    norm = 1.0 / (w0 + w1 + w2 + w3 + w4 + w5)
+    return (w0 * norm, w1 * norm, w2 * norm, w3 * norm, w4 * norm, w5 * norm)
+
+@njit(fastmath=True, cache=True)
+def lanczos3_sample(src, ch, x, y, rows, cols):
+    """Lanczos-3 采样 src[:, :, ch] 在 (x, y) 处的值 (6x6 邻域)，图像外的像素视为 0"""
+    x0 = int(np.floor(x))
+    y0 = int(np.floor(y))
+    wx = lanczos3_weights(x - x0)
+    wy = lanczos3_weights(y - y0)
+    acc = 0.0
+    for j in range(6):
+        yy = y0 - 2 + j
+        if yy < 0 or yy >= rows:
+            continue
+        row_acc = 0.0
+        for i in range(6):
+            xx = x0 - 2 + i
+            if xx < 0 or xx >= cols:
+                continue
+            row_acc += wx[i] * src[yy, xx, ch]
+        acc += wy[j] * row_acc
+    return acc
+
+@njit(fastmath=True, cache=True)
+def remap_sample(src, ch, x, y, method):
+    """按 method (见 REMAP_METHODS) 采样"""
+    rows, cols = src.shape[0], src.shape[1]
+    if method == 0:
+        return bilinear_sample(src, ch, x, y, rows, cols)
+    if method == 2:
+        return lanczos3_sample(src, ch, x, y, rows, cols)
+    return bicubic_sample(src, ch, x, y, rows, cols)
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def remap_into(src, coords, out, method):
+    """
+    按逐像素坐标表重采样 (镜头畸变 / 横向色差校正)
+
+    单遍处理交错存储的 RGB，每个通道使用各自的坐标 (横向色差)，按行并行。
+
+    Args:
+        src: (H, W, 3) float32 源图像
+        coords: (H, W, 3, 2) float32 坐标表，coords[y, x, ch] 为输出像素在 src 中的 (x, y) 坐标
+        out: (H, W, 3) float32 预分配的输出 (不能与 src 相同)
+        method: 插值方式 (见 REMAP_METHODS)
+    """
+    rows, cols, _ = out.shape
+    for r in prange(rows):
+        for c in range(cols):
+            for ch in range(3):
+                out[r, c, ch] = remap_sample(src, ch, coords[r, c, ch, 0], coords[r, c, ch, 1], method)
+
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def remap_grid_into(src, grid, step, out, method):
+    """
+    按稀疏坐标网格重采样 (镜头畸变 / 横向色差校正)
+
+    grid[gy, gx, ch] 为输出像素 (gx * step, gy * step) 在 src 中的 (x, y) 坐标，
+    其余像素的坐标在网格中双线性插值得到，不需要整图坐标表。
+
+    Args:
+        src: (H, W, 3) float32 源图像
+        grid: (Gh, Gw, 3, 2) float32 坐标网格，需覆盖整幅输出 ((Gh - 1) * step >= H - 1)
+        step: 网格间距 (像素)
+        out: (H, W, 3) float32 预分配的输出 (不能与 src 相同)
+        method: 插值方式 (见 REMAP_METHODS)
+    """
+    rows, cols, _ = out.shape
+    inv_step = 1.0 / step
+    last_gy = grid.shape[0] - 2
+    last_gx = grid.shape[1] - 2
+
+    for r in prange(rows):
+        gy = r * inv_step
+        iy = min(int(gy), last_gy)
+        fy = gy - iy
+        for c in range(cols):
+            gx = c * inv_step
+            ix = min(int(gx), last_gx)
+            fx = gx - ix
+            w00 = (1.0 - fx) * (1.0 - fy)
+            w01 = fx * (1.0 - fy)
+            w10 = (1.0 - fx) * fy
+            w11 = fx * fy
+            for ch in range(3):
+                sx = (w00 * grid[iy, ix, ch, 0] + w01 * grid[iy, ix + 1, ch, 0]
+                      + w10 * grid[iy + 1, ix, ch, 0] + w11 * grid[iy + 1, ix + 1, ch, 0])
+                sy = (w00 * grid[iy, ix, ch, 1] + w01 * grid[iy, ix + 1, ch, 1]
+                      + w10 * grid[iy + 1, ix, ch, 1] + w11 * grid[iy + 1, ix + 1, ch, 1])
+                out[r, c, ch] = remap_sample(src, ch, sx, sy, method)
+
 # =========================================================
 # 辅助计算函数 (用于测光)
 # =========================================================
@@ -631,10 +943,15 @@ def auto_expose_matrix(img_linear: np.ndarray, source_colorspace, target_gray: f
 
 # ----------------- 镜头校正 (保持逻辑，优化注释) -----------------
 
-def apply_lens_correction(image: np.ndarray, exif_data: dict, custom_db_path: Optional[str] = None, logger: callable = print, **kwargs) -> np.ndarray:
+def correct_lens(image: np.ndarray, exif_data: dict, custom_db_path: Optional[str] = None, logger: callable = print,
+                 **kwargs) -> Tuple[np.ndarray, bool]:
     """
     镜头校正通常需要几何变换，很难完全 In-Place。
     这是整个流程中少数几个必然会产生内存拷贝的地方。
+
+    Returns:
+        (图像, 是否为确定的结果)。Lensfun 不可用或校正出错时返回未 (完全) 校正的图像和 False，
+        这样的结果不应写入解码缓存 (环境或数据库修复后应重新校正)
     """
     # exif_data is now passed directly
     
@@ -644,17 +961,20 @@ def apply_lens_correction(image: np.ndarray, exif_data: dict, custom_db_path: Op
     # 必要的 key 检查
     if not params.get('camera_model') or not params.get('lens_model'):
         logger("  ⚠️  [Lens] Missing info, skipping.")
-        return image
+        return image, True
     
     if not params.get('focal_length') or not params.get('aperture'):
         logger("  ⚠️  [Lens] Missing optical info, skipping.")
-        return image
+        return image, True
     
     logger(f"  🧬 [Lens] {params.get('camera_maker')} {params.get('camera_model')} + {params.get('lens_model')}")
+
+    if not lf._lensfun:
+        logger("  ⚠️ [Lensfun] Library not loaded. Skipping lens correction.")
+        return image, False
     
     try:
-        # lensfun_wrapper 内部通常会调用 cv2.remap 或 scipy.map_coordinates
-        # 这必然返回新图像
+        # lensfun_wrapper 内部使用 remap_into / remap_grid_into 重采样到新的输出图像
         corrected = lf.apply_lens_correction(
             image=image,
             custom_db_path=custom_db_path,
@@ -664,11 +984,55 @@ def apply_lens_correction(image: np.ndarray, exif_data: dict, custom_db_path: Op
         
         # 显式帮助 GC (虽然 Python 会自动处理，但在大内存压力下 explicit is better)
         # 这里原来的 image 引用计数会减少，如果外面没有引用，旧内存会被释放
-        return corrected
+        return corrected, True
         
     except Exception as e:
         logger(f"  ❌ [Lens Error] {e}")
-        return image # 失败则返回原图
+        return image, False # 失败则返回原图
+
+
+def apply_lens_correction(image: np.ndarray, exif_data: dict, custom_db_path: Optional[str] = None,
+                          logger: callable = print, **kwargs) -> np.ndarray:
+    """同 correct_lens，只返回图像 (失败时为原图)"""
+    return correct_lens(image, exif_data, custom_db_path, logger, **kwargs)[0]
+
+# ----------------- RAW 解码 -----------------
+
+# 统一的 RAW 解码参数 (core 与 preview 共用，同时作为解码缓存键的一部分)
+RAW_DECODE_PARAMS = {
+    'gamma': (1, 1),
+    'no_auto_bright': True,
+    'use_camera_wb': True,
+    'output_bps': 16,  # 必须使用 16-bit 以保留 Log 转换所需的动态范围
+    'output_color': 'ProPhoto',
+    'bright': 1.0,
+    'highlight_mode': 2,  # 2=Blend (防止高光死白)
+    'demosaic_algorithm': 'AAHD',
+}
+
+def decode_raw(raw: rawpy.RawPy, half_size: bool = False) -> np.ndarray:
+    """使用统一参数将 RAW 解码为 16-bit 线性 ProPhoto RGB"""
+    params = dict(RAW_DECODE_PARAMS)
+    params['output_color'] = rawpy.ColorSpace[params['output_color']]
+    params['demosaic_algorithm'] = rawpy.DemosaicAlgorithm[params['demosaic_algorithm']]
+    return raw.postprocess(half_size=half_size, **params)
+
+def raw_to_float32(prophoto_linear: np.ndarray, gain: float = 1.0) -> np.ndarray:
+    """
+    将 16-bit 解码结果转为 float32 线性图像 (可顺带应用增益)
+
+    Args:
+        prophoto_linear: raw.postprocess 输出的 uint16 数组
+        gain: 同一遍中应用的曝光增益
+
+    Returns:
+        新分配的 float32 数组，整个过程只多占用这一份内存
+    """
+    if not prophoto_linear.flags['C_CONTIGUOUS']:
+        prophoto_linear = np.ascontiguousarray(prophoto_linear)
+    img = np.empty(prophoto_linear.shape, dtype=np.float32)
+    normalize_uint16_into(prophoto_linear, img, float(gain))
+    return img
 
 def extract_lens_exif(raw: rawpy.RawPy, logger: callable = print) -> dict:
     """使用 rawpy 对象从 RAW 文件中提取 EXIF 和镜头信息。"""
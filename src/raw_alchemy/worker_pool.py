@@ -0,0 +1,539 @@
+"""
+常驻工作进程池 (以及共享状态的单进程线程池)
+批处理的工作进程在启动时预热一次 (导入模块、编译 / 加载 numba 核函数、Lensfun 数据库、
+解析后的 LUT 与色域矩阵)，之后在多次 process_path 调用之间复用 (GUI 中每次点击开始处理不再重新创建进程)。
+
+工作进程由每个进程的初始化函数各自预热。Linux 上使用 forkserver 启动 (服务进程预先导入本模块，
+新进程不必重新导入)，其他平台使用 spawn。父进程可能已经启动了 numba 的并行线程池 (TBB / OpenMP)，
+从这样的进程直接 fork 会使子进程卡死或中止，因此不使用 fork。
+
+设置了单文件超时、每进程任务数上限或常驻内存上限时使用 SupervisedWorkerPool:
+由监督线程逐个管理工作进程，卡死的文件会连同其工作进程一起被终止并替换，
+处理了一定数量的文件或常驻内存超过上限的工作进程在任务之间回收重建 (避免堆碎片不断累积)。
+
+线程后端 (ThreadWorkerPool) 在当前进程中并发运行 core.process_image，所有线程共享同一份
+LUT、Lensfun 数据库和缓存，没有进程启动和参数序列化开销。numba 核函数以 nogil 编译，
+LibRaw、Lensfun 和编码器在 C 代码中运行，计算阶段可以真正并行。
+"""
+import atexit
+import collections
+import concurrent.futures
+import multiprocessing
+import multiprocessing.connection
+import sys
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from raw_alchemy import core, scheduler, utils
+from raw_alchemy import lensfun_wrapper as lf
+from raw_alchemy.baked_lut import get_baked_lut, apply_baked_lut
+from raw_alchemy.fused_pipeline import apply_pointwise_pipeline
+from raw_alchemy.lut_cache import get_lut
+from raw_alchemy.topology import Topology, available_cpus, configure_worker
+
+# 工作进程的启动方式: 从已运行并行核函数或多线程的进程 fork 并不安全 (TBB / OpenMP 等线程库的状态)，
+# Linux 上改由单线程的 forkserver 启动，服务进程预先导入本模块，新进程只需预热
+START_METHOD = 'forkserver' if sys.platform.startswith('linux') else 'spawn'
+
+# 受监督进程池的启动方式 (替换工作进程发生在监督线程中，同样不能 fork)
+SUPERVISED_START_METHOD = START_METHOD
+
+# 预热时流经管线的小图尺寸 (只为触发核函数编译与缓存加载)
+_WARM_IMAGE_SHAPE = (8, 8, 3)
+
+
+# ==========================================
+#                 预热
+# ==========================================
+
+def make_warm_config(log_space, lut_path=None, lut_layout=None, lut_stack_size=None, cache_dir=None,
+                     lens_correct=False, custom_db_path=None, baked=False, baked_size=None) -> dict:
+    """汇总预热所需的处理参数 (与 core.process_image 的同名参数一致)"""
+    if lut_path is not None and not isinstance(lut_path, str):
+        lut_path = tuple(lut_path)
+    return {
+        'log_space': log_space,
+        'lut_path': lut_path,
+        'lut_layout': lut_layout,
+        'lut_stack_size': lut_stack_size,
+        'cache_dir': cache_dir,
+        'lens_correct': lens_correct,
+        'custom_db_path': custom_db_path,
+        'baked': baked,
+        'baked_size': baked_size,
+    }
+
+
+# 当前进程已完成预热的配置
+_warmed = set()
+
+
+def _quiet(*args, **kwargs):
+    pass
+
+
+def warm_up(warm_config: Optional[dict]):
+    """
+    按处理参数预热当前进程，同一配置只执行一次
+
+    预热失败不会抛出异常: 实际处理图片时会重新遇到并报告同样的错误。
+    """
+    if not warm_config:
+        return
+    key = tuple(sorted(warm_config.items()))
+    if key in _warmed:
+        return
+    try:
+        _warm(**warm_config)
+    except Exception:
+        pass
+    _warmed.add(key)
+
+
+def _warm(log_space, lut_path, lut_layout, lut_stack_size, cache_dir, lens_correct, custom_db_path, baked, baked_size):
+    lut = None
+    if lut_path:
+        lut = get_lut(lut_path, cache_dir, layout=None if baked else lut_layout, stack_size=lut_stack_size)
+
+    # 与 process_image 相同的核函数调用顺序: 解码转换 -> 逐像素管线 (-> 非 3D LUT)
+    img = utils.raw_to_float32(np.full(_WARM_IMAGE_SHAPE, 16384, dtype=np.uint16), 1.0)
+    if baked:
+        baked_table = get_baked_lut(log_space, lut_path, lut, baked_size, cache_dir=cache_dir,
+                                    logger=_quiet, lut_stack_size=lut_stack_size)
+        apply_baked_lut(img, baked_table, 1.0)
+    else:
+        lut3d = lut if lut is not None and lut.is_3d else None
+        img = apply_pointwise_pipeline(img, 1.0, log_space, lut3d, clip_output=(lut is None or lut3d is not None))
+        if lut is not None and lut3d is None:
+            lut.apply_inplace(img)
+
+    if lens_correct and lf._lensfun:
+        lf.get_database(custom_db_path, logger=_quiet)
+
+
+def _init_worker(warm_config, threads, cpu_sets, counter):
+    if threads:
+        configure_worker(threads, cpu_sets, counter)
+    warm_up(warm_config)
+
+
+def _run_task(warm_config, kwargs):
+    # 复用的进程池遇到新的处理参数时，在第一个任务前补做预热
+    warm_up(warm_config)
+    return core.process_image(**kwargs)
+
+
+# ==========================================
+#                 进程池
+# ==========================================
+
+def _get_context(method: str):
+    """工作进程的 multiprocessing 上下文 (forkserver 的服务进程预先导入本模块)"""
+    context = multiprocessing.get_context(method)
+    if method == 'forkserver':
+        context.set_forkserver_preload([__name__])
+    return context
+
+class WorkerPool:
+    """预热过的常驻进程池"""
+
+    def __init__(self, jobs: int, warm_config: Optional[dict] = None, topology: Optional[Topology] = None):
+        """
+        Args:
+            jobs: 工作进程数
+            warm_config: make_warm_config 生成的预热参数
+            topology: 每个进程的 numba 线程数与 CPU 绑定 (None 时不做限制)
+        """
+        self.jobs = jobs
+        self.topology = topology
+        context = _get_context(START_METHOD)
+        cpu_sets = topology.cpu_sets() if topology is not None else None
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(
+                warm_config,
+                topology.threads if topology is not None else None,
+                cpu_sets,
+                context.Value('i', 0) if cpu_sets else None,
+            ),
+        )
+
+    def submit(self, warm_config: Optional[dict] = None, **kwargs) -> concurrent.futures.Future:
+        """提交一个 core.process_image 任务 (kwargs 即其参数)"""
+        return self._executor.submit(_run_task, warm_config, kwargs)
+
+    def submit_call(self, fn, *args) -> concurrent.futures.Future:
+        """在工作进程中执行任意可序列化的函数"""
+        return self._executor.submit(fn, *args)
+
+    @property
+    def broken(self) -> bool:
+        # 工作进程异常退出后执行器不可再用，需要重建
+        return bool(getattr(self._executor, '_broken', False))
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class ThreadWorkerPool:
+    """共享进程内状态的线程池，接口与 WorkerPool 相同"""
+
+    def __init__(self, jobs: int, warm_config: Optional[dict] = None, topology: Optional[Topology] = None):
+        self.jobs = jobs
+        self.topology = topology
+        cpu_sets = topology.cpu_sets() if topology is not None else None
+        warm_up(warm_config)
+        # numba 的线程数设置和 CPU 绑定都作用于调用线程，在每个工作线程启动时设置
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=jobs,
+            thread_name_prefix='raw-alchemy-worker',
+            initializer=configure_worker if topology is not None else None,
+            initargs=(
+                topology.threads, cpu_sets, multiprocessing.Value('i', 0) if cpu_sets else None,
+            ) if topology is not None else (),
+        )
+
+    def submit(self, warm_config: Optional[dict] = None, **kwargs) -> concurrent.futures.Future:
+        return self._executor.submit(_run_task, warm_config, kwargs)
+
+    def submit_call(self, fn, *args) -> concurrent.futures.Future:
+        return self._executor.submit(fn, *args)
+
+    @property
+    def broken(self) -> bool:
+        return bool(getattr(self._executor, '_broken', False))
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# ==========================================
+#            受监督的进程池
+# ==========================================
+
+class WorkerTimeoutError(RuntimeError):
+    """单个文件处理超时，工作进程已被终止"""
+
+
+class WorkerCrashedError(RuntimeError):
+    """工作进程在处理文件时异常退出 (例如内存不足被系统终止)"""
+
+
+class WorkerLimits:
+    """工作进程的监督限制 (都为 None 时不需要监督)"""
+
+    def __init__(self, timeout: Optional[float] = None, max_tasks: Optional[int] = None,
+                 max_rss: Optional[int] = None):
+        """
+        Args:
+            timeout: 单个文件的最长处理时间 (秒)，超时则终止并替换工作进程
+            max_tasks: 每个工作进程处理的文件数上限，达到后回收重建
+            max_rss: 工作进程常驻内存上限 (字节)，任务结束后超出则回收重建
+        """
+        self.timeout = timeout or None
+        self.max_tasks = max_tasks or None
+        self.max_rss = max_rss or None
+
+    @property
+    def key(self):
+        return self.timeout, self.max_tasks, self.max_rss
+
+    def __bool__(self):
+        return any(value is not None for value in self.key)
+
+    def __repr__(self):
+        parts = []
+        if self.timeout:
+            parts.append(f"timeout {self.timeout:g}s")
+        if self.max_tasks:
+            parts.append(f"recycle after {self.max_tasks} files")
+        if self.max_rss:
+            parts.append(f"recycle above {self.max_rss / scheduler.GB:.2f} GB RSS")
+        return ", ".join(parts) or "unsupervised"
+
+
+def _supervised_main(conn, warm_config, threads, cpu_sets, slot):
+    """受监督工作进程的主循环: 逐个接收 (函数, 参数)，返回 (状态, 结果, 常驻内存)"""
+    if threads:
+        configure_worker(threads, cpu_sets, index=slot)
+    warm_up(warm_config)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        fn, args = message
+        try:
+            reply = ('ok', fn(*args))
+        except Exception as e:
+            reply = ('error', e)
+        try:
+            conn.send(reply + (scheduler.current_rss(),))
+        except Exception as e:
+            # 结果或异常无法序列化
+            conn.send(('error', RuntimeError(f"{reply[1]!r} ({e})"), scheduler.current_rss()))
+
+
+class _SupervisedWorker:
+    """一个受监督的工作进程及其当前任务"""
+
+    def __init__(self, context, slot: int, warm_config, threads, cpu_sets):
+        self.slot = slot
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_supervised_main,
+            args=(child_conn, warm_config, threads, cpu_sets, slot),
+            name=f"raw-alchemy-worker-{slot}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.future = None
+        self.started = 0.0
+        self.tasks_done = 0
+
+    def stop(self, kill: bool = False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout=None if kill else 5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class SupervisedWorkerPool:
+    """
+    受监督的常驻进程池，接口与 WorkerPool 相同
+
+    监督线程为每个工作进程单独派发任务，因此可以只终止卡死的那一个进程
+    (ProcessPoolExecutor 中终止任何一个工作进程都会使整个执行器失效)。
+    """
+
+    def __init__(self, jobs: int, warm_config: Optional[dict] = None, topology: Optional[Topology] = None,
+                 limits: Optional[WorkerLimits] = None):
+        self.jobs = jobs
+        self.topology = topology
+        self.limits = limits or WorkerLimits()
+        self._context = _get_context(SUPERVISED_START_METHOD)
+        self._warm_config = warm_config
+        self._threads = topology.threads if topology is not None else None
+        self._cpu_sets = topology.cpu_sets() if topology is not None else None
+        self._tasks = collections.deque()
+        self._lock = threading.Lock()
+        self._wake_reader, self._wake_writer = self._context.Pipe(duplex=False)
+        self._shutdown = False
+        self.stats = self._new_stats()
+        # 初始工作进程在调用线程中启动，替换的进程由监督线程启动
+        self._workers = [self._start_worker(slot) for slot in range(jobs)]
+        self._thread = threading.Thread(target=self._supervise, name='raw-alchemy-supervisor', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _new_stats() -> dict:
+        return {'timeouts': 0, 'crashes': 0, 'recycled_tasks': 0, 'recycled_rss': 0, 'peak_rss': 0}
+
+    def take_stats(self) -> dict:
+        """返回并清零自上次调用以来的统计: 超时、崩溃、按任务数 / 常驻内存回收的次数和工作进程峰值常驻内存"""
+        with self._lock:
+            stats, self.stats = self.stats, self._new_stats()
+        return stats
+
+    def _start_worker(self, slot: int) -> _SupervisedWorker:
+        return _SupervisedWorker(self._context, slot, self._warm_config, self._threads, self._cpu_sets)
+
+    def submit(self, warm_config: Optional[dict] = None, **kwargs) -> concurrent.futures.Future:
+        """提交一个 core.process_image 任务 (kwargs 即其参数)"""
+        return self.submit_call(_run_task, warm_config, kwargs)
+
+    def submit_call(self, fn, *args) -> concurrent.futures.Future:
+        """在工作进程中执行任意可序列化的函数"""
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            self._tasks.append((future, fn, args))
+            self._wake_writer.send(None)
+        return future
+
+    @property
+    def broken(self) -> bool:
+        return not self._shutdown and not self._thread.is_alive()
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            self._shutdown = True
+            while self._tasks:
+                self._tasks.popleft()[0].cancel()
+            self._wake_writer.send(None)
+        if wait:
+            self._thread.join()
+
+    # ---------------- 监督线程 ----------------
+
+    def _dispatch(self):
+        """给空闲的工作进程派发排队的任务"""
+        with self._lock:
+            for worker in self._workers:
+                while worker.future is None and self._tasks:
+                    future, fn, args = self._tasks.popleft()
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        worker.conn.send((fn, args))
+                    except Exception as e:
+                        future.set_exception(e)
+                        continue
+                    worker.future = future
+                    worker.started = time.monotonic()
+
+    def _replace(self, worker: _SupervisedWorker, kill: bool = False):
+        worker.stop(kill=kill)
+        self._workers[self._workers.index(worker)] = self._start_worker(worker.slot)
+
+    def _supervise(self):
+        timeout = self.limits.timeout
+        while True:
+            self._dispatch()
+            busy = [worker for worker in self._workers if worker.future is not None]
+            if self._shutdown and not busy:
+                break
+
+            wait_timeout = None
+            if timeout and busy:
+                deadline = min(worker.started for worker in busy) + timeout
+                wait_timeout = max(0.0, deadline - time.monotonic())
+            handles = [self._wake_reader] + [worker.conn for worker in busy] + [worker.process.sentinel for worker in busy]
+            ready = multiprocessing.connection.wait(handles, timeout=wait_timeout)
+            if self._wake_reader in ready:
+                while self._wake_reader.poll():
+                    self._wake_reader.recv()
+
+            now = time.monotonic()
+            for worker in busy:
+                future = worker.future
+                reply = None
+                if worker.conn in ready or worker.process.sentinel in ready:
+                    try:
+                        reply = worker.conn.recv() if worker.conn.poll() else None
+                    except (EOFError, OSError):
+                        # 管道已关闭: 进程正在退出，等它结束后按崩溃处理
+                        reply = None
+                        worker.process.join(timeout=5)
+
+                if reply is not None:
+                    status, value, rss = reply
+                    worker.future = None
+                    worker.tasks_done += 1
+                    if status == 'ok':
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+                    with self._lock:
+                        self.stats['peak_rss'] = max(self.stats['peak_rss'], rss or 0)
+                    # 任务之间回收: 处理文件数或常驻内存达到上限
+                    if self.limits.max_rss and rss and rss > self.limits.max_rss:
+                        with self._lock:
+                            self.stats['recycled_rss'] += 1
+                        self._replace(worker)
+                    elif self.limits.max_tasks and worker.tasks_done >= self.limits.max_tasks:
+                        with self._lock:
+                            self.stats['recycled_tasks'] += 1
+                        self._replace(worker)
+                elif not worker.process.is_alive():
+                    worker.future = None
+                    future.set_exception(WorkerCrashedError(
+                        f"worker process exited with code {worker.process.exitcode} while processing"))
+                    with self._lock:
+                        self.stats['crashes'] += 1
+                    self._replace(worker, kill=True)
+                elif timeout and now - worker.started >= timeout:
+                    worker.future = None
+                    future.set_exception(WorkerTimeoutError(
+                        f"timed out after {timeout:g}s; worker process killed and replaced"))
+                    with self._lock:
+                        self.stats['timeouts'] += 1
+                    self._replace(worker, kill=True)
+
+        for worker in self._workers:
+            worker.stop()
+
+
+BACKEND_PROCESSES = 'processes'
+BACKEND_THREADS = 'threads'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool(topology: Topology, warm_config: Optional[dict] = None, logger: callable = print,
+                    backend: str = BACKEND_PROCESSES, limits: Optional[WorkerLimits] = None):
+    """
+    获取进程内共享的工作池，拓扑 / 后端 / 监督限制变化或工作池损坏时重建
+
+    Args:
+        topology: 并发数 × 每个工作者的 numba 线程数 (见 topology.resolve_topology)
+        warm_config: make_warm_config 生成的预热参数
+        logger: 日志函数
+        backend: 'processes' (进程池) 或 'threads' (单进程线程池)
+        limits: 单文件超时与工作进程回收限制 (只适用于进程后端)
+
+    Returns:
+        WorkerPool、SupervisedWorkerPool 或 ThreadWorkerPool
+    """
+    global _pool
+    limits = limits or WorkerLimits()
+    if backend == BACKEND_THREADS and limits:
+        logger("⚠️ Per-file timeouts and worker recycling need the processes backend; ignoring them for threads.")
+        limits = WorkerLimits()
+    if backend == BACKEND_THREADS and topology.processes > 1 and not utils.parallel_kernels_threadsafe():
+        # workqueue 线程层不支持多个线程同时启动并行核函数
+        logger("⚠️ Numba threading layer is not thread-safe (install tbb); the threads backend will use 1 worker.")
+        # 单个工作线程接管全部 numba 线程，但不超过可用 CPU 数 (避免超额订阅)
+        topology = Topology(1, min(topology.threads * topology.processes, available_cpus()), topology.pin)
+    with _pool_lock:
+        if backend == BACKEND_THREADS:
+            pool_class = ThreadWorkerPool
+        else:
+            pool_class = SupervisedWorkerPool if limits else WorkerPool
+        if (_pool is not None and type(_pool) is pool_class and _pool.topology.key == topology.key
+                and getattr(_pool, 'limits', WorkerLimits()).key == limits.key and not _pool.broken):
+            logger(f"♻️ Reusing warm worker pool ({topology!r}, {backend}).")
+            return _pool
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        if backend == BACKEND_THREADS:
+            logger(f"🚀 Starting thread pool ({topology.processes} worker thread(s) × {topology.threads} numba thread(s)).")
+        elif limits:
+            logger(f"🚀 Starting supervised worker pool ({topology!r}, {SUPERVISED_START_METHOD}, {limits!r}).")
+        else:
+            logger(f"🚀 Starting worker pool ({topology!r}, {START_METHOD}).")
+        if pool_class is SupervisedWorkerPool:
+            _pool = pool_class(topology.processes, warm_config, topology, limits)
+        else:
+            _pool = pool_class(topology.processes, warm_config, topology)
+        return _pool
+
+
+def shutdown_worker_pool(wait: bool = True):
+    """关闭共享的工作进程池 (程序退出时自动调用)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+            _pool = None
+
+
+atexit.register(shutdown_worker_pool)